@@ -1,23 +1,31 @@
 #!/usr/bin/env python3
-import os
-from datetime import datetime
+import argparse
 
 from config_system.backup import BackupManager
 from config_system.storage import Storage
 
 
-def backup_configs():
+def backup_configs(incremental: bool = False):
     """Create backup of all configurations"""
-    storage = Storage()
-    backup_dir = os.path.join("backups", datetime.now().strftime("%Y%m%d"))
-    backup_manager = BackupManager(backup_dir)
+    storage = Storage(cache_size=0)
+    # One directory so retention and incremental chains see every backup
+    backup_manager = BackupManager("backups")
 
     try:
-        backup_file = backup_manager.create_backup(storage)
+        if incremental:
+            backup_file = backup_manager.create_incremental_backup(storage)
+        else:
+            backup_file = backup_manager.create_backup(storage)
         print(f"Backup created successfully: {backup_file}")
     except Exception as e:
         print(f"Backup failed: {e}")
 
 
 if __name__ == "__main__":
-    backup_configs()
+    parser = argparse.ArgumentParser(description=backup_configs.__doc__)
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only back up keys changed since the previous backup",
+    )
+    backup_configs(parser.parse_args().incremental)
@@ -1,3 +1,4 @@
+from .async_storage import AsyncStorage
 from .config_manager import ConfigManager
 from .models import AuditLog, ConfigVersion
 from .storage import Storage
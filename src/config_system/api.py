@@ -1,22 +1,37 @@
+import asyncio
+import json
 import logging
+import time
 from datetime import datetime
 from functools import partial
 from http import HTTPStatus
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
-from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import APIKeyHeader
 from pydantic import BaseModel
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
+from .async_storage import AsyncStorage
 from .auth import AuthManager
 from .config_manager import ConfigManager
-from .metrics import increment_config_updates, track_request_duration
+from .encryption import EncryptionManager, FieldEncryptor
+from . import metrics, tracing
+from .metrics import (
+    increment_config_updates,
+    track_connection,
+    track_request_duration,
+)
 from .models import AppConfig
-from .storage import Storage
-from .validation import validate_config_schema
+from .retention import VersionCompactor
+from .rotation import KeyRotator
+from .schemas import SchemaRegistry
+from .storage import ConfigConflictError, Storage
+from .validation import InvalidSchemaError, SchemaValidationError
+from .watch import ChangeBroadcaster
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +41,36 @@ class ConfigUpdateRequest(BaseModel):
     config_schema: Optional[Dict] = None
 
 
+class ConfigImportRequest(BaseModel):
+    configs: Dict[str, Dict]
+    environment: str = "prod"
+    comment: Optional[str] = None
+
+
+class SchemaRegistrationRequest(BaseModel):
+    pattern: str
+    config_schema: Dict
+
+
+class ConfigBatchRequest(BaseModel):
+    paths: List[str]
+    environment: str = "prod"
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
 class ConfigurationAPI:
     def __init__(self, config: AppConfig):
         """
@@ -53,12 +98,35 @@ class ConfigurationAPI:
             allow_headers=self.config.cors.allow_headers,
         )
 
+        metrics.configure(
+            self.config.metrics.path_prefixes,
+            self.config.metrics.path_depth,
+            self.config.metrics.max_path_buckets,
+        )
+
         @self.app.middleware("http")
         async def log_and_track_request(request: Request, call_next):
-            start_time = datetime.now()
-            response = await call_next(request)
-            duration = (datetime.now() - start_time).total_seconds()
-            track_request_duration(request.url.path, duration)
+            start_time = time.perf_counter()
+            track_connection(True)
+            try:
+                with tracing.trace(request.method) as span:
+                    response = await call_next(request)
+                    # Name spans by route template too, like the metrics below
+                    route = getattr(request.scope.get("route"), "path", "unmatched")
+                    if span is not None:
+                        span.name = f"{request.method} {route}"
+                        span.set(
+                            **{
+                                "http.request.method": request.method,
+                                "http.route": route,
+                                "http.response.status_code": response.status_code,
+                            }
+                        )
+            finally:
+                track_connection(False)
+            duration = time.perf_counter() - start_time
+            # Label by route template so config paths don't become series
+            track_request_duration(route, duration)
             return response
 
         # Rate limiting with configured values
@@ -73,18 +141,86 @@ class ConfigurationAPI:
                 port=self.config.storage.port,
                 username=self.config.storage.username,
                 password=self.config.storage.password,
+                cache_size=self.config.storage.cache_size,
+            )
+
+            self.auth_manager.attach_storage(storage)
+
+            async_storage = AsyncStorage(
+                storage, max_workers=self.config.storage.io_workers
             )
 
-            config_manager = ConfigManager(storage, self.auth_manager)
+            encryptor = None
+            if self.config.security.secret_fields:
+                encryptor = FieldEncryptor(
+                    EncryptionManager.from_environment(),
+                    self.config.security.secret_fields,
+                )
+
+            config_manager = ConfigManager(
+                storage,
+                self.auth_manager,
+                async_storage=async_storage,
+                schema_registry=SchemaRegistry(storage),
+                environments=self.config.environments,
+                encryptor=encryptor,
+            )
             self.app.state.config_manager = config_manager
+            self.app.state.broadcaster = ChangeBroadcaster(
+                storage.watch_hub,
+                config_manager.renderer,
+                asyncio.get_running_loop(),
+                buffer_size=self.config.watch_buffer_size,
+                resolve=config_manager.resolve_change,
+                dependents=config_manager.layers.dependents,
+            )
+
+            self.app.state.compactor = None
+            if self.config.retention.enabled:
+                self.app.state.compactor = VersionCompactor(
+                    storage, self.config.retention
+                )
+                self.app.state.compactor.start()
+
+            self.app.state.key_rotator = None
+            if encryptor is not None and self.config.security.rotate_keys:
+                self.app.state.key_rotator = KeyRotator(storage, encryptor.manager)
+                self.app.state.key_rotator.start()
+
+            if self.config.tracing.enabled:
+                tracing.configure(
+                    self.config.tracing.export_path,
+                    self.config.tracing.sample_rate,
+                    self.config.tracing.service_name,
+                    self.config.tracing.max_queue,
+                )
 
             logger.info("Application components initialized successfully")
 
+        @self.app.on_event("shutdown")
+        async def shutdown_event():
+            if self.app.state.compactor is not None:
+                self.app.state.compactor.stop()
+            if self.app.state.key_rotator is not None:
+                self.app.state.key_rotator.stop()
+            metrics.mark_process_dead()
+            tracing.shutdown()
+            self.app.state.broadcaster.close()
+            self.app.state.config_manager.schema_registry.close()
+            self.app.state.config_manager.async_storage.close()
+
     def _setup_routes(self):
+        if self.config.metrics.endpoint:
+
+            @self.app.get("/metrics", include_in_schema=False)
+            async def get_metrics() -> Response:
+                content, content_type = metrics.latest()
+                return Response(content=content, media_type=content_type)
+
         @self.app.get("/config/health")
         async def health_check():
             try:
-                self.app.state.config_manager.storage.ping()
+                await self.app.state.config_manager.async_storage.ping()
                 return {"status": "healthy"}
             except Exception as e:
                 logger.error(f"Health check failed: {str(e)}")
@@ -100,6 +236,114 @@ class ConfigurationAPI:
         ) -> Dict:
             return await self._get_config(request, path, environment, api_key)
 
+        @self.app.post("/configs")
+        @self.limiter.limit(self.config.rate_limit_read)
+        async def get_configs(
+            request: Request,
+            batch: ConfigBatchRequest,
+            api_key: str = Depends(self.api_key_header),
+        ) -> Dict:
+            return await self._get_configs(
+                request, batch.paths, batch.environment, api_key
+            )
+
+        @self.app.put("/configs")
+        @self.limiter.limit(self.config.rate_limit_write)
+        async def import_configs(
+            request: Request,
+            batch: ConfigImportRequest,
+            api_key: str = Depends(self.api_key_header),
+        ) -> Dict:
+            return await self._import_configs(request, batch, api_key)
+
+        @self.app.get("/watch/{path:path}")
+        @self.limiter.limit(self.config.rate_limit_read)
+        async def watch_config(
+            request: Request,
+            path: str,
+            environment: str = "prod",
+            api_key: str = Depends(self.api_key_header),
+        ):
+            return await self._watch_config(request, path, environment, api_key)
+
+        @self.app.get("/versions/{path:path}")
+        @self.limiter.limit(self.config.rate_limit_read)
+        async def get_versions(
+            request: Request,
+            path: str,
+            environment: str = "prod",
+            limit: int = Query(50, ge=1, le=1000),
+            cursor: Optional[str] = None,
+            include_data: bool = False,
+            api_key: str = Depends(self.api_key_header),
+        ) -> Dict:
+            return await self._get_versions(
+                request, path, environment, limit, cursor, include_data, api_key
+            )
+
+        @self.app.get("/diff/{path:path}")
+        @self.limiter.limit(self.config.rate_limit_read)
+        async def diff_versions(
+            request: Request,
+            path: str,
+            from_version: str = Query(..., alias="from"),
+            to_version: str = Query(..., alias="to"),
+            environment: str = "prod",
+            api_key: str = Depends(self.api_key_header),
+        ) -> Dict:
+            return await self._diff_versions(
+                request, path, from_version, to_version, environment, api_key
+            )
+
+        @self.app.get("/audit")
+        @self.limiter.limit(self.config.rate_limit_read)
+        async def get_audit_logs(
+            request: Request,
+            path: Optional[str] = None,
+            user: Optional[str] = None,
+            start_time: Optional[datetime] = None,
+            end_time: Optional[datetime] = None,
+            limit: int = Query(100, ge=1, le=1000),
+            cursor: Optional[str] = None,
+            api_key: str = Depends(self.api_key_header),
+        ) -> Dict:
+            return await self._get_audit_logs(
+                request, path, user, start_time, end_time, limit, cursor, api_key
+            )
+
+        @self.app.get("/schemas")
+        @self.limiter.limit(self.config.rate_limit_read)
+        async def list_schemas(
+            request: Request, api_key: str = Depends(self.api_key_header)
+        ) -> Dict:
+            return await self._call_schema_registry(request, api_key, "list")
+
+        @self.app.put("/schemas/{name}")
+        @self.limiter.limit(self.config.rate_limit_write)
+        async def register_schema(
+            request: Request,
+            name: str,
+            registration: SchemaRegistrationRequest,
+            api_key: str = Depends(self.api_key_header),
+        ):
+            await self._call_schema_registry(
+                request,
+                api_key,
+                "register",
+                name,
+                registration.pattern,
+                registration.config_schema,
+            )
+            return {"status": "success"}
+
+        @self.app.delete("/schemas/{name}")
+        @self.limiter.limit(self.config.rate_limit_write)
+        async def unregister_schema(
+            request: Request, name: str, api_key: str = Depends(self.api_key_header)
+        ):
+            await self._call_schema_registry(request, api_key, "unregister", name)
+            return {"status": "success"}
+
         @self.app.put("/config/{path:path}")
         @self.limiter.limit(self.config.rate_limit_write)
         async def update_config(
@@ -109,24 +353,35 @@ class ConfigurationAPI:
             api_key: str = Depends(self.api_key_header),
         ):
             return await self._update_config(
-                request, path, update_data.config, update_data.schema, api_key
+                request, path, update_data.config, update_data.config_schema, api_key
             )
 
     async def _get_config(
         self, request: Request, path: str, environment: str, api_key: str
-    ) -> Dict:
+    ) -> Response:
         try:
-            if not request.app.state.config_manager.verify_api_key(api_key, ["read"]):
+            config_manager = request.app.state.config_manager
+            if not config_manager.verify_api_key(api_key, ["read"]):
                 raise HTTPException(
                     status_code=HTTPStatus.UNAUTHORIZED, detail="Invalid API key"
                 )
 
-            config = request.app.state.config_manager.get_config(path, environment)
-            if not config:
+            stored = await config_manager.get_stored_config_async(path, environment)
+            if not stored:
                 raise HTTPException(
                     status_code=HTTPStatus.NOT_FOUND, detail="Configuration not found"
                 )
-            return config
+
+            # Unchanged configs are answered from cached metadata alone
+            etag = config_manager.etag(stored)
+            if _etag_matches(request.headers.get("if-none-match"), etag):
+                return Response(
+                    status_code=HTTPStatus.NOT_MODIFIED, headers={"ETag": etag}
+                )
+
+            config = config_manager.render_config(path, stored, environment)
+            with tracing.span("json.encode"):
+                return JSONResponse(content=config, headers={"ETag": etag})
         except HTTPException:
             raise
         except Exception as e:
@@ -136,31 +391,271 @@ class ConfigurationAPI:
                 detail="Internal server error",
             )
 
-    async def _update_config(
+    async def _get_versions(
         self,
         request: Request,
         path: str,
-        config: Dict,
-        schema: Optional[Dict],
+        environment: str,
+        limit: int,
+        cursor: Optional[str],
+        include_data: bool,
+        api_key: str,
+    ) -> Dict:
+        try:
+            config_manager = request.app.state.config_manager
+            if not config_manager.verify_api_key(api_key, ["read"]):
+                raise HTTPException(
+                    status_code=HTTPStatus.UNAUTHORIZED, detail="Invalid API key"
+                )
+
+            versions, next_cursor = await config_manager.async_storage.run(
+                config_manager.get_version_page,
+                path,
+                environment,
+                limit,
+                cursor,
+                include_data,
+            )
+            return {"versions": versions, "next_cursor": next_cursor}
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error listing versions of {path}: {str(e)}")
+            raise HTTPException(
+                status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+                detail="Internal server error",
+            )
+
+    async def _diff_versions(
+        self,
+        request: Request,
+        path: str,
+        from_version: str,
+        to_version: str,
+        environment: str,
         api_key: str,
+    ) -> Dict:
+        try:
+            config_manager = request.app.state.config_manager
+            if not config_manager.verify_api_key(api_key, ["read"]):
+                raise HTTPException(
+                    status_code=HTTPStatus.UNAUTHORIZED, detail="Invalid API key"
+                )
+
+            patch = await config_manager.async_storage.run(
+                config_manager.diff_versions,
+                path,
+                from_version,
+                to_version,
+                environment,
+            )
+            if patch is None:
+                raise HTTPException(
+                    status_code=HTTPStatus.NOT_FOUND, detail="Version not found"
+                )
+            return {"from": from_version, "to": to_version, "patch": patch}
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error diffing versions of {path}: {str(e)}")
+            raise HTTPException(
+                status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+                detail="Internal server error",
+            )
+
+    async def _get_configs(
+        self, request: Request, paths: List[str], environment: str, api_key: str
+    ) -> Dict:
+        try:
+            if not request.app.state.config_manager.verify_api_key(api_key, ["read"]):
+                raise HTTPException(
+                    status_code=HTTPStatus.UNAUTHORIZED, detail="Invalid API key"
+                )
+
+            if len(paths) > self.config.batch_read_limit:
+                raise HTTPException(
+                    status_code=HTTPStatus.BAD_REQUEST,
+                    detail=f"At most {self.config.batch_read_limit} paths per request",
+                )
+
+            configs = await request.app.state.config_manager.get_configs_async(
+                paths, environment
+            )
+            return {
+                "configs": configs,
+                "not_found": [path for path, config in configs.items() if not config],
+            }
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error getting configs {paths}: {str(e)}")
+            raise HTTPException(
+                status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+                detail="Internal server error",
+            )
+
+    async def _watch_config(
+        self, request: Request, path: str, environment: str, api_key: str
+    ) -> StreamingResponse:
+        if not request.app.state.config_manager.verify_api_key(api_key, ["read"]):
+            raise HTTPException(
+                status_code=HTTPStatus.UNAUTHORIZED, detail="Invalid API key"
+            )
+
+        broadcaster = request.app.state.broadcaster
+        subscription = broadcaster.subscribe(f"{environment}/{path}")
+        keepalive = self.config.watch_keepalive
+
+        async def events():
+            # The middleware only sees the request until headers are sent
+            track_connection(True)
+            try:
+                while True:
+                    try:
+                        change = await asyncio.wait_for(
+                            subscription.get(), timeout=keepalive
+                        )
+                    except asyncio.TimeoutError:
+                        if await request.is_disconnected():
+                            return
+                        yield ": keepalive\n\n"
+                        continue
+
+                    if change is None:
+                        # Dropped as a slow consumer or the watch went away;
+                        # the client is expected to reconnect and re-read.
+                        return
+                    yield (
+                        f"id: {change['revision']}\n"
+                        f"event: change\n"
+                        f"data: {json.dumps(change)}\n\n"
+                    )
+            finally:
+                track_connection(False)
+                broadcaster.unsubscribe(subscription)
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def _get_audit_logs(
+        self,
+        request: Request,
+        path: Optional[str],
+        user: Optional[str],
+        start_time: Optional[datetime],
+        end_time: Optional[datetime],
+        limit: int,
+        cursor: Optional[str],
+        api_key: str,
+    ) -> Dict:
+        try:
+            config_manager = request.app.state.config_manager
+            if not config_manager.verify_api_key(api_key, ["admin"]):
+                raise HTTPException(
+                    status_code=HTTPStatus.UNAUTHORIZED, detail="Invalid API key"
+                )
+
+            logs, next_cursor = await config_manager.async_storage.get_audit_page(
+                path, user, start_time, end_time, limit, cursor
+            )
+            return {"logs": logs, "next_cursor": next_cursor}
+        except HTTPException:
+            raise
+        except ValueError as e:
+            raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(e))
+        except Exception as e:
+            logger.error(f"Error getting audit logs: {str(e)}")
+            raise HTTPException(
+                status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+                detail="Internal server error",
+            )
+
+    async def _call_schema_registry(
+        self, request: Request, api_key: str, method: str, *args
     ):
         try:
-            if not request.app.state.config_manager.verify_api_key(api_key, ["write"]):
+            config_manager = request.app.state.config_manager
+            if not config_manager.verify_api_key(api_key, ["admin"]):
                 raise HTTPException(
                     status_code=HTTPStatus.UNAUTHORIZED, detail="Invalid API key"
                 )
 
-            if schema and not validate_config_schema(config, schema):
+            registry = config_manager.schema_registry
+            return await config_manager.async_storage.run(
+                getattr(registry, method), *args
+            )
+        except HTTPException:
+            raise
+        except InvalidSchemaError as e:
+            raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(e))
+        except Exception as e:
+            logger.error(f"Error calling schema registry {method}: {str(e)}")
+            raise HTTPException(
+                status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+                detail="Internal server error",
+            )
+
+    async def _import_configs(
+        self, request: Request, batch: ConfigImportRequest, api_key: str
+    ) -> Dict:
+        try:
+            config_manager = request.app.state.config_manager
+            if not config_manager.verify_api_key(api_key, ["write"]):
+                raise HTTPException(
+                    status_code=HTTPStatus.UNAUTHORIZED, detail="Invalid API key"
+                )
+            if len(batch.configs) > self.config.batch_write_limit:
                 raise HTTPException(
                     status_code=HTTPStatus.BAD_REQUEST,
-                    detail="Invalid configuration format",
+                    detail=f"At most {self.config.batch_write_limit} configs "
+                    "per request",
+                )
+
+            return await config_manager.async_storage.run(
+                config_manager.import_configs,
+                batch.configs.items(),
+                api_key,
+                batch.environment,
+                comment=batch.comment,
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error importing configs: {str(e)}")
+            raise HTTPException(
+                status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+                detail="Internal server error",
+            )
+
+    async def _update_config(
+        self,
+        request: Request,
+        path: str,
+        config: Dict,
+        schema: Optional[Dict],
+        api_key: str,
+    ):
+        try:
+            if not request.app.state.config_manager.verify_api_key(api_key, ["write"]):
+                raise HTTPException(
+                    status_code=HTTPStatus.UNAUTHORIZED, detail="Invalid API key"
                 )
 
-            request.app.state.config_manager.update_config(path, config, api_key)
+            await request.app.state.config_manager.update_config_async(
+                path, config, api_key, schema=schema
+            )
             increment_config_updates(path, "success")
             return {"status": "success"}
         except HTTPException:
             raise
+        except ConfigConflictError as e:
+            increment_config_updates(path, "conflict")
+            raise HTTPException(status_code=HTTPStatus.CONFLICT, detail=str(e))
+        except SchemaValidationError as e:
+            increment_config_updates(path, "invalid")
+            raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=e.errors)
+        except InvalidSchemaError as e:
+            increment_config_updates(path, "invalid")
+            raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(e))
         except Exception as e:
             increment_config_updates(path, "error")
             logger.error(f"Error updating config {path}: {str(e)}")
@@ -0,0 +1,114 @@
+import asyncio
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .metrics import track_cache
+from .models import AuditLog, ConfigVersion
+from .storage import Storage
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncStorage:
+    """
+    Awaitable facade over Storage for use from the event loop.
+
+    The etcd3 client and sqlite are blocking, so every call runs on a bounded
+    thread pool. Config reads that hit the watch-driven cache are answered
+    inline without a thread hop.
+    """
+
+    def __init__(self, storage: Storage, max_workers: int = 32):
+        self.storage = storage
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="storage"
+        )
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        # Carry the current trace span over to the pool thread
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self._executor, partial(context.run, func, *args, **kwargs)
+        )
+
+    async def get_config(self, path: str) -> Optional[ConfigVersion]:
+        entry = self.storage.cache.peek(f"/config/{path}")
+        if entry is not None:
+            # Misses are counted by the cache on the storage read below
+            track_cache(self.storage.cache.prefix, True)
+            return entry[1]
+        return await self.run(self.storage.get_config, path)
+
+    async def get_configs(self, paths: List[str]) -> Dict[str, Optional[ConfigVersion]]:
+        result = {}
+        for path in paths:
+            entry = self.storage.cache.peek(f"/config/{path}")
+            if entry is None:
+                return await self.run(self.storage.get_configs, paths)
+            result[path] = entry[1]
+        return result
+
+    async def put_config(self, path: str, version: ConfigVersion):
+        await self.run(self.storage.put_config, path, version)
+
+    async def commit_version(
+        self,
+        path: str,
+        version: ConfigVersion,
+        expected_revision: Optional[int] = None,
+    ) -> int:
+        return await self.run(
+            self.storage.commit_version, path, version, expected_revision
+        )
+
+    async def get_versions(self, path: str) -> List[ConfigVersion]:
+        return await self.run(self.storage.get_versions, path)
+
+    async def add_audit_log(self, log: AuditLog):
+        await self.run(self.storage.add_audit_log, log)
+
+    async def get_audit_logs(
+        self,
+        path: Optional[str] = None,
+        user: Optional[str] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        limit: int = 100,
+    ) -> List[AuditLog]:
+        return await self.run(
+            self.storage.get_audit_logs, path, user, start_time, end_time, limit
+        )
+
+    async def get_audit_page(
+        self,
+        path: Optional[str] = None,
+        user: Optional[str] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[AuditLog], Optional[str]]:
+        return await self.run(
+            self.storage.get_audit_page,
+            path,
+            user,
+            start_time,
+            end_time,
+            limit,
+            cursor,
+        )
+
+    async def ping(self) -> bool:
+        return await self.run(self.storage.ping)
+
+    async def dump_all(self) -> Dict:
+        return await self.run(self.storage.dump_all)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.storage.close()
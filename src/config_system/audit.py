@@ -0,0 +1,253 @@
+import base64
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+_INSERT = """
+    INSERT INTO audit_log
+    (action, path, user, timestamp, details)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_audit_log_time ON audit_log (timestamp, id)",
+    "CREATE INDEX IF NOT EXISTS idx_audit_log_path "
+    "ON audit_log (path, timestamp, id)",
+    "CREATE INDEX IF NOT EXISTS idx_audit_log_user "
+    "ON audit_log (user, timestamp, id)",
+)
+
+
+def encode_cursor(log: AuditLog) -> str:
+    raw = f"{log.timestamp.isoformat()}|{log.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor).decode().split("|")
+        return timestamp, int(row_id)
+    except Exception:
+        raise ValueError(f"Invalid audit log cursor: {cursor}")
+
+
+class AuditLogStore:
+    """
+    SQLite audit log with one long-lived writer thread and pooled readers.
+
+    Writes are queued and committed in batches of up to ``batch_size`` rows or
+    whatever arrived within ``flush_interval`` seconds of the first one, so a
+    burst of updates costs one fsync instead of one per row. The database runs
+    in WAL mode so readers never block the writer.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        batch_size: int = 200,
+        flush_interval: float = 0.05,
+        readers: int = 4,
+    ):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._init_db()
+
+        self._queue: "queue.Queue[Optional[Tuple[AuditLog, Future]]]" = queue.Queue()
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._reader_slots = threading.BoundedSemaphore(readers)
+        self._writer = threading.Thread(
+            target=self._run, name="audit-writer", daemon=True
+        )
+        self._writer.start()
+
+    # For monitoring purposes,
+    #    - who made the request when
+    #    - what action was performed
+    #    - ..
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS audit_log (
+                    id INTEGER PRIMARY KEY,
+                    action TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    user TEXT NOT NULL,
+                    timestamp TIMESTAMP NOT NULL,
+                    details TEXT
+                )
+            """
+            )
+            for statement in _INDEXES:
+                conn.execute(statement)
+
+    def _connect(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=check_same_thread)
+        # WAL keeps the database consistent with NORMAL sync, fsyncing only at
+        # checkpoints rather than on every commit
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def write(self, log: AuditLog) -> Future:
+        """Queue ``log`` for the writer; the future resolves once it is committed."""
+        future: Future = Future()
+        self._queue.put((log, future))
+        return future
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        with self._reader_slots:
+            try:
+                conn = self._readers.get_nowait()
+            except queue.Empty:
+                conn = self._connect(check_same_thread=False)
+            try:
+                yield conn
+            finally:
+                self._readers.put(conn)
+
+    def query(
+        self,
+        path: Optional[str] = None,
+        user: Optional[str] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[AuditLog], Optional[str]]:
+        """
+        Newest-first page of audit logs and the cursor of the next page.
+
+        Pages are addressed by the (timestamp, id) of the last row rather than
+        an offset, so every page is a bounded index range scan.
+        """
+        query = "SELECT * FROM audit_log WHERE 1=1"
+        params = []
+
+        if path:
+            query += " AND path = ?"
+            params.append(path)
+        if user:
+            query += " AND user = ?"
+            params.append(user)
+        if start_time:
+            query += " AND timestamp >= ?"
+            params.append(start_time.isoformat())
+        if end_time:
+            query += " AND timestamp <= ?"
+            params.append(end_time.isoformat())
+        if cursor:
+            query += " AND (timestamp, id) < (?, ?)"
+            params.extend(decode_cursor(cursor))
+
+        query += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+        params.append(limit)
+
+        with self.reader() as conn:
+            logs = [
+                AuditLog(
+                    id=row[0],
+                    action=row[1],
+                    path=row[2],
+                    user=row[3],
+                    timestamp=datetime.fromisoformat(row[4]),
+                    details=json.loads(row[5]) if row[5] else {},
+                )
+                for row in conn.execute(query, params)
+            ]
+
+        next_cursor = encode_cursor(logs[-1]) if len(logs) == limit else None
+        return logs, next_cursor
+
+    def iter(
+        self,
+        path: Optional[str] = None,
+        user: Optional[str] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        page_size: int = 500,
+    ) -> Iterator[AuditLog]:
+        cursor = None
+        while True:
+            logs, cursor = self.query(
+                path, user, start_time, end_time, page_size, cursor
+            )
+            yield from logs
+            if cursor is None:
+                return
+
+    def close(self, timeout: float = 5.0):
+        self._queue.put(None)
+        self._writer.join(timeout=timeout)
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                batch, stop = self._collect(item)
+                self._commit(conn, batch)
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _collect(
+        self, first: Tuple[AuditLog, Future]
+    ) -> Tuple[List[Tuple[AuditLog, Future]], bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _commit(self, conn: sqlite3.Connection, batch: List[Tuple[AuditLog, Future]]):
+        try:
+            with conn:
+                conn.executemany(
+                    _INSERT,
+                    [
+                        (
+                            log.action,
+                            log.path,
+                            log.user,
+                            log.timestamp.isoformat(),
+                            json.dumps(log.details),
+                        )
+                        for log, _ in batch
+                    ],
+                )
+        except Exception as e:
+            logger.error(f"Error writing {len(batch)} audit logs: {str(e)}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for _, future in batch:
+            future.set_result(None)
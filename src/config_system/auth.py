@@ -1,15 +1,28 @@
+import hashlib
+import time
 from datetime import datetime, timedelta
 from typing import List, Optional
 
 import jwt
 from fastapi import HTTPException
 
+from .cache import LRUCache
+
 
 class AuthManager:
-    def __init__(self, secret_key: str):
+    def __init__(self, secret_key: str, cache_size: int = 10000):
         self.secret_key = secret_key
         self.api_keys = {}
         self.token_blacklist = set()
+        # token hash -> (roles, exp) of keys whose signature was already checked
+        self._verified = LRUCache(cache_size)
+        self.storage = None
+
+    def attach_storage(self, storage):
+        """Share revocations with every worker through etcd."""
+        self.storage = storage
+        # Loads the revocation list and keeps it current in the background
+        storage.revocations.start()
 
     def create_api_key(self, roles: List[str]) -> str:
         api_key = jwt.encode(
@@ -24,11 +37,21 @@ class AuthManager:
         self, api_key: str, required_roles: Optional[List[str]] = None
     ) -> bool:
         try:
-            if api_key in self.token_blacklist:
+            token_hash = self._hash(api_key)
+            if self._is_revoked(token_hash):
                 return False
 
-            decoded = jwt.decode(api_key, self.secret_key, algorithms=["HS256"])
-            roles = decoded.get("roles", [])
+            cached = self._verified.get(token_hash)
+            if cached is None:
+                decoded = jwt.decode(api_key, self.secret_key, algorithms=["HS256"])
+                roles = decoded.get("roles", [])
+                expires_at = decoded.get("exp")
+                self._verified.put(token_hash, (roles, expires_at))
+            else:
+                roles, expires_at = cached
+                if expires_at is not None and time.time() >= expires_at:
+                    self._verified.pop(token_hash)
+                    raise jwt.ExpiredSignatureError("Signature has expired")
 
             if not required_roles:
                 return True
@@ -40,6 +63,29 @@ class AuthManager:
             return False
 
     def revoke_api_key(self, api_key: str):
-        if api_key in self.api_keys:
-            del self.api_keys[api_key]
-            self.token_blacklist.add(api_key)
+        self.api_keys.pop(api_key, None)
+        token_hash = self._hash(api_key)
+        self.token_blacklist.add(token_hash)
+        self._verified.pop(token_hash)
+
+        if self.storage is not None:
+            try:
+                claims = jwt.decode(
+                    api_key,
+                    self.secret_key,
+                    algorithms=["HS256"],
+                    options={"verify_exp": False},
+                )
+            except jwt.InvalidTokenError:
+                # Not a key we issued, nothing to publish
+                return
+            self.storage.revoke_token(token_hash, claims.get("exp"))
+
+    def _is_revoked(self, token_hash: str) -> bool:
+        if token_hash in self.token_blacklist:
+            return True
+        return self.storage is not None and self.storage.is_token_revoked(token_hash)
+
+    @staticmethod
+    def _hash(api_key: str) -> str:
+        return hashlib.sha256(api_key.encode()).hexdigest()
@@ -1,54 +1,327 @@
+import gzip
+import hashlib
 import json
 import logging
-import shutil
-from datetime import datetime
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .storage import MAX_TXN_OPS
 
 logger = logging.getLogger(__name__)
 
+BACKUP_PREFIX = "config_backup_"
+
 
 class BackupManager:
-    def __init__(self, backup_dir: str, retention_days: int = 30):
+    """
+    Streams etcd snapshots to gzipped newline-delimited JSON and back.
+
+    A backup file starts with a header line carrying the etcd revision it was
+    taken at, followed by one ``{"key": ..., "value": ...}`` line per key.
+    Neither backups nor plain restores ever hold the whole keyspace in
+    memory; ``parallel_restore`` keeps one hash per key for its verification.
+
+    Incremental backups only contain keys modified since the previous backup
+    (``{"key": ..., "deleted": true}`` for removed ones) and name that backup
+    as their ``base``. Every backup also gets a sorted ``.keys.gz`` index of
+    all keys at its revision, which is what deletions are detected against.
+    """
+
+    def __init__(
+        self,
+        backup_dir: str,
+        retention_days: int = 30,
+        page_size: int = 1000,
+        batch_size: int = MAX_TXN_OPS,
+    ):
         self.backup_dir = Path(backup_dir)
         self.backup_dir.mkdir(parents=True, exist_ok=True)
         self.retention_days = retention_days
+        self.page_size = page_size
+        self.batch_size = batch_size
 
     def create_backup(self, storage) -> Optional[Path]:
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_file = self.backup_dir / f"config_backup_{timestamp}.json"
-
-            with backup_file.open("w") as f:
-                json.dump(storage.dump_all(), f, indent=2)
-
-            self._cleanup_old_backups()
-            return backup_file
+            return self._write_backup(storage, None)
         except Exception as e:
             logger.error(f"Backup creation failed: {str(e)}")
             return None
 
+    def create_incremental_backup(self, storage) -> Optional[Path]:
+        """Back up changes since the latest backup, or everything if none exists."""
+        try:
+            return self._write_backup(storage, self.latest_backup())
+        except Exception as e:
+            logger.error(f"Incremental backup creation failed: {str(e)}")
+            return None
+
+    def latest_backup(self) -> Optional[Path]:
+        backups = sorted(
+            path
+            for path in self.backup_dir.glob(f"{BACKUP_PREFIX}*.ndjson.gz")
+            if self._index_file(path).exists()
+        )
+        return backups[-1] if backups else None
+
     def restore_backup(self, storage, backup_file: Path) -> bool:
         try:
             if not backup_file.exists():
                 raise FileNotFoundError(f"Backup file not found: {backup_file}")
 
-            with backup_file.open("r") as f:
-                data = json.load(f)
+            if backup_file.suffix == ".json":
+                # Backups written before the streaming format
+                with backup_file.open("r") as f:
+                    storage.restore_from_backup(json.load(f))
+                return True
 
-            storage.restore_from_backup(data)
+            # Replay the full backup first, then every delta on top of it
+            for link in self.backup_chain(backup_file):
+                for batch in self._batches(link, {}):
+                    storage.restore_batch(batch)
             return True
         except Exception as e:
             logger.error(f"Backup restoration failed: {str(e)}")
             return False
 
+    def parallel_restore(
+        self,
+        storage,
+        backup_file: Path,
+        workers: int = 8,
+        checkpoint_file: Optional[Path] = None,
+    ) -> bool:
+        """
+        Restore ``backup_file`` with concurrent batched transactions.
+
+        Each completed batch is appended to a checkpoint file, so running the
+        same restore again after an interruption skips the batches already
+        applied. Batches are numbered, so the checkpoint records the batch
+        size and a resume with a different one is refused. Chain links are
+        applied one after another so deltas always land on top of their base.
+        Once everything is written the keyspace is compared key by key against
+        hashes of the backup contents (held in memory, one per key); the
+        restore only counts as successful (and the checkpoint is removed) if
+        they match.
+        """
+        checkpoint_file = checkpoint_file or backup_file.with_name(
+            backup_file.name + ".checkpoint"
+        )
+        try:
+            completed = set()
+            header = json.dumps({"batch_size": self.batch_size})
+            if checkpoint_file.exists():
+                lines = checkpoint_file.read_text().splitlines()
+                if not lines or lines[0] != header:
+                    raise ValueError(
+                        f"Checkpoint {checkpoint_file} was not written with "
+                        f"batch size {self.batch_size}; restore with the original "
+                        f"batch size or delete the checkpoint to start over"
+                    )
+                completed = set(lines[1:])
+            else:
+                checkpoint_file.write_text(header + "\n")
+
+            expected: Dict[str, Optional[str]] = {}
+            lock = threading.Lock()
+            with ThreadPoolExecutor(max_workers=workers) as executor, open(
+                checkpoint_file, "a"
+            ) as checkpoint:
+
+                def apply(batch, marker):
+                    storage.restore_batch(batch)
+                    with lock:
+                        checkpoint.write(marker + "\n")
+                        checkpoint.flush()
+
+                for link in self.backup_chain(backup_file):
+                    pending = set()
+                    for number, batch in enumerate(self._batches(link, expected)):
+                        marker = f"{link.name}:{number}"
+                        if marker in completed:
+                            continue
+                        if len(pending) >= workers * 2:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                future.result()
+                        pending.add(executor.submit(apply, batch, marker))
+                    for future in wait(pending).done:
+                        future.result()
+
+            mismatches = self.verify_restore(storage, expected)
+            if mismatches:
+                logger.error(
+                    f"Restore verification failed for {len(mismatches)} keys, "
+                    f"e.g. {mismatches[:10]}"
+                )
+                return False
+
+            checkpoint_file.unlink()
+            return True
+        except Exception as e:
+            logger.error(f"Parallel backup restoration failed: {str(e)}")
+            return False
+
+    def verify_restore(self, storage, expected: Dict[str, Optional[str]]) -> List[str]:
+        """Keys whose stored value does not hash to ``expected`` (None = absent)."""
+        remaining = dict(expected)
+        mismatches = []
+        for key, value in storage.iter_all(self.page_size):
+            if key in remaining and remaining.pop(key) != _hash(value):
+                mismatches.append(key)
+        mismatches.extend(key for key, digest in remaining.items() if digest)
+        return mismatches
+
+    def _batches(
+        self, backup_file: Path, expected: Dict[str, Optional[str]]
+    ) -> Iterator[List[Tuple[str, Optional[str]]]]:
+        batch = []
+        for key, value in self.read_backup(backup_file):
+            expected[key] = None if value is None else _hash(value)
+            batch.append((key, value))
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def backup_chain(self, backup_file: Path) -> List[Path]:
+        """The full backup ``backup_file`` builds on, then each delta in order."""
+        chain = [backup_file]
+        while True:
+            base = self.read_header(chain[-1]).get("base")
+            if base is None:
+                return list(reversed(chain))
+            base_file = self.backup_dir / base
+            if not base_file.exists():
+                raise FileNotFoundError(f"Base backup not found: {base_file}")
+            chain.append(base_file)
+
+    def _write_backup(self, storage, base_file: Optional[Path]) -> Path:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        backup_file = self.backup_dir / f"{BACKUP_PREFIX}{timestamp}.ndjson.gz"
+        suffix = 0
+        while backup_file.exists():
+            suffix += 1
+            backup_file = backup_file.with_name(
+                f"{BACKUP_PREFIX}{timestamp}_{suffix}.ndjson.gz"
+            )
+        index_file = self._index_file(backup_file)
+        partial_file = backup_file.with_name(backup_file.name + ".partial")
+        partial_index = index_file.with_name(index_file.name + ".partial")
+
+        revision = storage.current_revision()
+        header = {"revision": revision}
+        if base_file is not None:
+            base_revision = self.read_header(base_file)["revision"]
+            header.update(base=base_file.name, base_revision=base_revision)
+
+        with gzip.open(partial_file, "wt", encoding="utf-8") as f:
+            f.write(json.dumps(header) + "\n")
+            if base_file is None:
+                entries = storage.iter_all(self.page_size, revision)
+            else:
+                entries = storage.iter_all(
+                    self.page_size, revision, min_mod_revision=base_revision + 1
+                )
+            for key, value in entries:
+                f.write(json.dumps({"key": key, "value": value}) + "\n")
+
+            with gzip.open(partial_index, "wt", encoding="utf-8") as index:
+                keys = storage.iter_keys(self.page_size, revision)
+                if base_file is None:
+                    for key in keys:
+                        index.write(json.dumps(key) + "\n")
+                else:
+                    previous = self._read_index(self._index_file(base_file))
+                    for key in _deleted_keys(previous, keys, index):
+                        f.write(json.dumps({"key": key, "deleted": True}) + "\n")
+
+        partial_index.rename(index_file)
+        partial_file.rename(backup_file)
+
+        self._cleanup_old_backups()
+        return backup_file
+
+    @staticmethod
+    def read_header(backup_file: Path) -> dict:
+        with gzip.open(backup_file, "rt", encoding="utf-8") as f:
+            return json.loads(f.readline())
+
+    @staticmethod
+    def read_backup(backup_file: Path) -> Iterator[Tuple[str, Optional[str]]]:
+        """Yield (key, value) entries; deleted keys come back with a None value."""
+        with gzip.open(backup_file, "rt", encoding="utf-8") as f:
+            f.readline()  # header
+            for line in f:
+                entry = json.loads(line)
+                yield entry["key"], entry.get("value")
+
+    @staticmethod
+    def _index_file(backup_file: Path) -> Path:
+        return backup_file.with_name(backup_file.name.replace(".ndjson.gz", ".keys.gz"))
+
+    @staticmethod
+    def _read_index(index_file: Path) -> Iterator[str]:
+        with gzip.open(index_file, "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
     def _cleanup_old_backups(self):
         cutoff_date = datetime.now() - timedelta(days=self.retention_days)
 
-        for backup_file in self.backup_dir.glob("config_backup_*.json"):
+        expired = set()
+        for backup_file in self.backup_dir.glob(f"{BACKUP_PREFIX}*"):
             try:
-                file_date = datetime.strptime(backup_file.stem[13:], "%Y%m%d_%H%M%S")
+                file_date = datetime.strptime(
+                    backup_file.name[len(BACKUP_PREFIX) :][:15], "%Y%m%d_%H%M%S"
+                )
                 if file_date < cutoff_date:
-                    backup_file.unlink()
+                    expired.add(backup_file)
             except Exception as e:
                 logger.warning(f"Error cleaning up backup {backup_file}: {str(e)}")
+
+        # Keep anything a retained incremental backup still builds on
+        for backup_file in self.backup_dir.glob(f"{BACKUP_PREFIX}*.ndjson.gz"):
+            if backup_file in expired:
+                continue
+            try:
+                for link in self.backup_chain(backup_file):
+                    expired.discard(link)
+                    expired.discard(self._index_file(link))
+            except Exception as e:
+                logger.warning(f"Error reading backup chain {backup_file}: {str(e)}")
+
+        for backup_file in expired:
+            try:
+                backup_file.unlink()
+            except Exception as e:
+                logger.warning(f"Error cleaning up backup {backup_file}: {str(e)}")
+
+
+def _hash(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def _deleted_keys(
+    previous: Iterator[str], current: Iterator[str], index
+) -> Iterator[str]:
+    """
+    Merge two sorted key streams, yielding keys only present in ``previous``.
+
+    Every current key is written to ``index`` on the way through so the new
+    key index is produced in the same pass.
+    """
+    pending = next(previous, None)
+    for key in current:
+        index.write(json.dumps(key) + "\n")
+        while pending is not None and pending < key:
+            yield pending
+            pending = next(previous, None)
+        if pending == key:
+            pending = next(previous, None)
+    while pending is not None:
+        yield pending
+        pending = next(previous, None)
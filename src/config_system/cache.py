@@ -0,0 +1,359 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from etcd3.events import DeleteEvent
+
+from .metrics import track_cache
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe bounded mapping with least-recently-used eviction."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class WatchedCache:
+    """
+    Read-through cache for an etcd key prefix kept coherent by a prefix watch.
+
+    Entries are stored together with the etcd revision they were read at, so a
+    slow direct read can never overwrite a newer value delivered by the watch.
+    While the watch is down every lookup goes straight to the loader.
+
+    Reads are only cached if no watch response arrived and the watch did not
+    restart while they were in flight: otherwise the value might predate an
+    event that was already applied (and possibly evicted again) or one that
+    was missed while the watch was down, and nothing would correct it.
+    """
+
+    def __init__(
+        self,
+        watcher,
+        prefix: str,
+        decode: Callable[[bytes], Any],
+        maxsize: int = 10000,
+        retry_interval: float = 5.0,
+    ):
+        self.watcher = watcher
+        self.prefix = prefix
+        self.decode = decode
+        self.retry_interval = retry_interval
+        self._entries = LRUCache(maxsize)
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._watch_id = None
+        self._last_attempt = 0.0
+        # Bumped on every watch response and (re)start, see _store
+        self._generation = 0
+
+    @property
+    def watching(self) -> bool:
+        return self._watch_id is not None
+
+    def start(self) -> bool:
+        with self._start_lock:
+            if self._watch_id is not None:
+                return True
+            self._last_attempt = time.monotonic()
+            try:
+                watch_id = self.watcher.add_watch_prefix_callback(
+                    self.prefix, self._on_watch_response
+                )
+            except Exception as e:
+                logger.warning(f"Failed to watch {self.prefix}: {str(e)}")
+                return False
+            with self._lock:
+                # Anything cached before the watch existed may have missed events
+                self._entries.clear()
+                self._watch_id = watch_id
+                self._generation += 1
+            return True
+
+    def stop(self):
+        with self._lock:
+            watch_id, self._watch_id = self._watch_id, None
+            self._entries.clear()
+            self._generation += 1
+        if watch_id is not None:
+            try:
+                self.watcher.cancel_watch(watch_id)
+            except Exception as e:
+                logger.warning(f"Failed to cancel watch on {self.prefix}: {str(e)}")
+
+    def get(self, key: str, loader: Callable[[str], Tuple[Any, int]]) -> Any:
+        if not self._ensure_watch():
+            return loader(key)[0]
+
+        entry = self._entries.get(key)
+        track_cache(self.prefix, entry is not None)
+        if entry is not None:
+            return entry[1]
+
+        generation = self._generation
+        value, revision = loader(key)
+        self._store(key, revision, value, generation)
+        return value
+
+    @property
+    def generation(self) -> int:
+        """Token to pass to ``set`` for values read outside of ``get``."""
+        return self._generation
+
+    def peek(self, key: str) -> Optional[Tuple[int, Any]]:
+        """Return the cached (revision, value) entry without loading."""
+        if self._watch_id is None:
+            return None
+        return self._entries.get(key)
+
+    def lookup(self, key: str) -> Optional[Tuple[int, Any]]:
+        """
+        Like ``peek``, but counted as a cache hit or miss and, like ``get``,
+        (re)starting the watch, for callers that load misses themselves.
+        """
+        if not self._ensure_watch():
+            return None
+        entry = self._entries.get(key)
+        track_cache(self.prefix, entry is not None)
+        return entry
+
+    def set(
+        self, key: str, revision: int, value: Any, generation: Optional[int] = None
+    ):
+        """
+        Cache a value read or written at ``revision``.
+
+        ``generation`` is the ``generation`` from before the read or write
+        started; the value is dropped if the watch delivered anything since.
+        """
+        self._store(key, revision, value, generation)
+
+    def invalidate(self, key: str):
+        self._entries.pop(key)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _ensure_watch(self) -> bool:
+        if self._entries.maxsize <= 0:
+            return False
+        if self._watch_id is not None:
+            return True
+        if time.monotonic() - self._last_attempt < self.retry_interval:
+            return False
+        return self.start()
+
+    def _store(
+        self, key: str, revision: int, value: Any, generation: Optional[int] = None
+    ):
+        with self._lock:
+            # Without a live watch nothing would ever invalidate the entry
+            if self._watch_id is None:
+                return
+            if generation is not None and generation != self._generation:
+                return
+            current = self._entries.get(key)
+            if current is None or current[0] < revision:
+                self._entries.put(key, (revision, value))
+
+    def _on_watch_response(self, response):
+        if isinstance(response, Exception):
+            logger.warning(
+                f"Watch on {self.prefix} dropped, falling back to direct reads: "
+                f"{str(response)}"
+            )
+            with self._lock:
+                self._watch_id = None
+                self._entries.clear()
+                self._generation += 1
+            return
+
+        with self._lock:
+            self._generation += 1
+        for event in response.events:
+            key = event.key.decode()
+            if isinstance(event, DeleteEvent):
+                self._store(key, event.mod_revision, None)
+            else:
+                try:
+                    value = self.decode(event.value)
+                except Exception as e:
+                    logger.error(f"Failed to decode watched key {key}: {str(e)}")
+                    self.invalidate(key)
+                    continue
+                self._store(key, event.mod_revision, value)
+
+
+class WatchedKeySet:
+    """
+    Every key under a small etcd prefix, held in memory and kept current by a
+    prefix watch.
+
+    The whole prefix is loaded whenever the watch (re)starts, so membership
+    checks never touch etcd. If the watch drops the last known keys stay in
+    place while a background thread re-creates the watch and reloads every
+    ``retry_interval`` seconds. Meant for small, bounded prefixes such as the
+    lease-bound revocation list.
+    """
+
+    def __init__(
+        self,
+        watcher,
+        prefix: str,
+        loader: Callable[[], Tuple[Iterable[str], int]],
+        retry_interval: float = 5.0,
+    ):
+        self.watcher = watcher
+        self.prefix = prefix
+        self.loader = loader
+        self.retry_interval = retry_interval
+        # key -> mod revision it was last seen at
+        self._keys: Dict[str, int] = {}
+        # key -> revision of deletes seen while a load is in flight
+        self._deleted: Optional[Dict[str, int]] = None
+        self._lock = threading.Lock()
+        self._watch_id = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def watching(self) -> bool:
+        return self._watch_id is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self.sync()
+        self._thread = threading.Thread(
+            target=self._run, name=f"watch{self.prefix.rstrip('/')}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.retry_interval)
+            self._thread = None
+        with self._lock:
+            watch_id, self._watch_id = self._watch_id, None
+        if watch_id is not None:
+            try:
+                self.watcher.cancel_watch(watch_id)
+            except Exception as e:
+                logger.warning(f"Failed to cancel watch on {self.prefix}: {str(e)}")
+
+    def sync(self) -> bool:
+        """Start the watch if it is not running and reload the whole prefix."""
+        if self._watch_id is not None:
+            return True
+        with self._lock:
+            self._deleted = {}
+        try:
+            # Watch first, so nothing written during the load is missed
+            watch_id = self.watcher.add_watch_prefix_callback(
+                self.prefix, self._on_watch_response
+            )
+            try:
+                keys, revision = self.loader()
+            except Exception:
+                self.watcher.cancel_watch(watch_id)
+                raise
+        except Exception as e:
+            logger.warning(f"Failed to load {self.prefix}: {str(e)}")
+            with self._lock:
+                self._deleted = None
+            return False
+
+        with self._lock:
+            loaded = {
+                key: revision for key in keys if self._deleted.get(key, 0) <= revision
+            }
+            # Events newer than the load win over it
+            loaded.update(
+                (key, mod_revision)
+                for key, mod_revision in self._keys.items()
+                if mod_revision > revision
+            )
+            self._keys = loaded
+            self._deleted = None
+            self._watch_id = watch_id
+        return True
+
+    def add(self, key: str, revision: int):
+        with self._lock:
+            if self._keys.get(key, 0) < revision:
+                self._keys[key] = revision
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _run(self):
+        while not self._stop.wait(self.retry_interval):
+            self.sync()
+
+    def _on_watch_response(self, response):
+        if isinstance(response, Exception):
+            logger.warning(
+                f"Watch on {self.prefix} dropped, keeping the last known keys: "
+                f"{str(response)}"
+            )
+            with self._lock:
+                self._watch_id = None
+            return
+
+        with self._lock:
+            for event in response.events:
+                key = event.key.decode()
+                if isinstance(event, DeleteEvent):
+                    if self._keys.get(key, 0) <= event.mod_revision:
+                        self._keys.pop(key, None)
+                    if self._deleted is not None:
+                        self._deleted[key] = event.mod_revision
+                elif self._keys.get(key, 0) < event.mod_revision:
+                    self._keys[key] = event.mod_revision
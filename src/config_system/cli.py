@@ -1,10 +1,17 @@
 import json
 import os
-from typing import Optional
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
 
 import click
 
+from .audit import AuditLogStore
 from .config_manager import ConfigManager
+from .encryption import EncryptionManager, FieldEncryptor
+from .models import RetentionConfig
+from .retention import VersionCompactor
+from .rotation import KeyRotator
 from .storage import Storage
 
 
@@ -15,14 +22,17 @@ def cli():
 
 
 @cli.command()
-@click.argument("path")
+@click.argument("paths", nargs=-1, required=True)
 @click.option("--environment", "-e", default="prod")
 @click.option("--api-key", envvar="CONFIG_API_KEY")
-def get(path: str, environment: str, api_key: str):
-    """Get configuration value"""
+def get(paths: Tuple[str, ...], environment: str, api_key: str):
+    """Get configuration value(s)"""
     config_manager = _get_config_manager(api_key)
     try:
-        config = config_manager.get_config(path, environment)
+        if len(paths) == 1:
+            config = config_manager.get_config(paths[0], environment)
+        else:
+            config = config_manager.get_configs(list(paths), environment)
         click.echo(json.dumps(config, indent=2))
     except Exception as e:
         click.echo(f"Error: {str(e)}", err=True)
@@ -43,6 +53,150 @@ def update(path: str, config_file, api_key: str):
     except Exception as e:
         click.echo(f"Error: {str(e)}", err=True)
         exit(1)
+    finally:
+        # Waits for the queued audit entry to be committed
+        config_manager.storage.close()
+
+
+@cli.command("import")
+@click.argument("source", type=click.Path(exists=True))
+@click.option("--environment", "-e", default="prod")
+@click.option("--comment", "-m", default=None)
+@click.option("--workers", "-w", default=8, show_default=True)
+@click.option(
+    "--processes",
+    "-p",
+    default=0,
+    show_default=True,
+    help="Processes for schema validation (0: on the worker threads)",
+)
+@click.option("--api-key", envvar="CONFIG_API_KEY")
+def import_configs(
+    source: str,
+    environment: str,
+    comment: Optional[str],
+    workers: int,
+    processes: int,
+    api_key: str,
+):
+    """Import configurations from a directory of JSON files or an NDJSON file
+
+    In a directory every *.json file is stored under its relative path without
+    the suffix. NDJSON lines look like {"path": "app/db", "config": {...}}.
+    """
+    config_manager = _get_config_manager(api_key)
+    try:
+        result = config_manager.import_configs(
+            _read_import_source(Path(source)),
+            api_key,
+            environment,
+            comment=comment,
+            workers=workers,
+            processes=processes,
+        )
+        click.echo(json.dumps(result, indent=2))
+        if result["failed"]:
+            exit(1)
+    except Exception as e:
+        click.echo(f"Error: {str(e)}", err=True)
+        exit(1)
+    finally:
+        # Waits for the queued audit entries to be committed
+        config_manager.storage.close()
+
+
+def _read_import_source(source: Path) -> Iterator[Tuple[str, Dict]]:
+    if source.is_dir():
+        for config_file in sorted(source.rglob("*.json")):
+            path = config_file.relative_to(source).with_suffix("").as_posix()
+            with config_file.open("r") as f:
+                yield path, json.load(f)
+        return
+
+    with source.open("r") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                yield entry["path"], entry["config"]
+
+
+@cli.command()
+@click.option("--path", "-p", default=None, help="Full path, e.g. prod/app")
+@click.option("--user", "-u", default=None)
+@click.option("--since", type=click.DateTime(), default=None)
+@click.option("--until", type=click.DateTime(), default=None)
+@click.option("--audit-db", envvar="AUDIT_DB", default="audit.db")
+def audit(
+    path: Optional[str],
+    user: Optional[str],
+    since: Optional[datetime],
+    until: Optional[datetime],
+    audit_db: str,
+):
+    """Stream audit log entries, newest first, as JSON lines"""
+    audit_log = AuditLogStore(audit_db)
+    try:
+        for log in audit_log.iter(path, user, since, until):
+            click.echo(log.json())
+    except Exception as e:
+        click.echo(f"Error: {str(e)}", err=True)
+        exit(1)
+    finally:
+        audit_log.close()
+
+
+@cli.command()
+@click.option("--keep-last", default=RetentionConfig().keep_last, show_default=True)
+@click.option("--keep-days", default=RetentionConfig().keep_days, show_default=True)
+@click.option("--thin-daily/--no-thin-daily", default=True, show_default=True)
+@click.option("--compact/--no-compact", default=True, show_default=True)
+@click.option("--dry-run", is_flag=True, help="Only list what would be pruned")
+@click.option("--api-key", envvar="CONFIG_API_KEY")
+def prune(
+    keep_last: int,
+    keep_days: int,
+    thin_daily: bool,
+    compact: bool,
+    dry_run: bool,
+    api_key: str,
+):
+    """Delete old configuration versions according to a retention policy"""
+    config_manager = _get_config_manager(api_key)
+    policy = RetentionConfig(
+        keep_last=keep_last,
+        keep_days=keep_days,
+        thin_daily=thin_daily,
+        compact_etcd=compact,
+    )
+    try:
+        pruned = VersionCompactor(config_manager.storage, policy).run_once(dry_run)
+        click.echo(json.dumps(pruned, indent=2))
+    except Exception as e:
+        click.echo(f"Error: {str(e)}", err=True)
+        exit(1)
+    finally:
+        # Waits for the queued prune audit entries to be committed
+        config_manager.storage.close()
+
+
+@cli.command("rotate-keys")
+@click.option("--batch-size", default=100, show_default=True)
+@click.option("--pause", default=0.1, show_default=True, help="Seconds per batch")
+@click.option("--api-key", envvar="CONFIG_API_KEY")
+def rotate_keys(batch_size: int, pause: float, api_key: str):
+    """Re-wrap stored data keys with the primary ENCRYPTION_KEY (resumable)"""
+    config_manager = _get_config_manager(api_key)
+    try:
+        rotator = KeyRotator(
+            config_manager.storage,
+            EncryptionManager.from_environment(),
+            batch_size=batch_size,
+            pause=pause,
+        )
+        click.echo(f"Rewrote {rotator.run()} keys")
+    except Exception as e:
+        click.echo(f"Error: {str(e)}", err=True)
+        exit(1)
 
 
 def _get_config_manager(api_key: Optional[str] = None) -> ConfigManager:
@@ -52,8 +206,18 @@ def _get_config_manager(api_key: Optional[str] = None) -> ConfigManager:
     storage = Storage(
         host=os.getenv("ETCD_HOST", "localhost"),
         port=int(os.getenv("ETCD_PORT", "2379")),
+        cache_size=0,
+    )
+    # Same mapping as AppConfig.environments, e.g. '{"prod": "base"}'
+    environments = json.loads(os.getenv("CONFIG_ENVIRONMENTS", "{}"))
+    # Same mapping as SecurityConfig.secret_fields
+    secret_fields = json.loads(os.getenv("CONFIG_SECRET_FIELDS", "{}"))
+    encryptor = None
+    if secret_fields:
+        encryptor = FieldEncryptor(EncryptionManager.from_environment(), secret_fields)
+    return ConfigManager(
+        storage, api_key, environments=environments, encryptor=encryptor
     )
-    return ConfigManager(storage, api_key)
 
 
 if __name__ == "__main__":
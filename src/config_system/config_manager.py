@@ -1,14 +1,33 @@
-import json
+import itertools
 import logging
-from datetime import datetime
-from typing import Dict, List, Optional
-
-from jinja2 import Template
+import multiprocessing
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import nullcontext
+from functools import partial
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
+from . import tracing
+from .async_storage import AsyncStorage
 from .auth import AuthManager
-from .models import AuditLog, ConfigVersion
-from .storage import Storage, StorageError
-from .validation import validate_config_schema
+from .diff import diff
+from .encryption import FieldEncryptor
+from .environments import EnvironmentLayers, deep_merge
+from .metrics import time_validation
+from .models import AuditLog, ConfigVersion, new_version_id
+from .schemas import SchemaRegistry
+from .storage import MAX_TXN_OPS, Storage, StorageError
+from .templates import ConfigRenderer
+from .validation import (
+    SchemaValidationError,
+    document_errors,
+    get_validator,
+    schema_errors,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -19,32 +38,180 @@ class ConfigManager:
         storage: Storage,
         auth_manager: AuthManager,
         default_schema: Optional[Dict] = None,
+        async_storage: Optional[AsyncStorage] = None,
+        schema_registry: Optional[SchemaRegistry] = None,
+        environments: Optional[Dict[str, str]] = None,
+        encryptor: Optional[FieldEncryptor] = None,
     ):
         self.storage = storage
+        self.async_storage = async_storage or AsyncStorage(storage)
+        self.schema_registry = schema_registry
         self.auth_manager = auth_manager
         self.default_schema = default_schema
+        self._default_validator = (
+            get_validator(default_schema) if default_schema else None
+        )
+        self.renderer = ConfigRenderer()
+        # environment -> parent environment it inherits unset keys from
+        self.layers = EnvironmentLayers(environments)
+        self.encryptor = encryptor
 
     def _get_full_path(self, path: str, environment: str) -> str:
         return f"{environment}/{path}"
 
+    def _layer_paths(self, path: str, environment: str) -> List[str]:
+        return [
+            self._get_full_path(path, layer) for layer in self.layers.chain(environment)
+        ]
+
+    def get_stored_config(
+        self, path: str, environment: str = "prod"
+    ) -> Optional[ConfigVersion]:
+        """Current stored (unrendered) version, merged over inherited layers."""
+        layer_paths = self._layer_paths(path, environment)
+        if len(layer_paths) == 1:
+            return self.decrypt_config(
+                layer_paths[0], self.storage.get_config(layer_paths[0])
+            )
+        configs = self.storage.get_configs(layer_paths)
+        return self._merge(layer_paths, configs)
+
+    async def get_stored_config_async(
+        self, path: str, environment: str = "prod"
+    ) -> Optional[ConfigVersion]:
+        """Like ``get_stored_config``, usually straight from the cache."""
+        layer_paths = self._layer_paths(path, environment)
+        if len(layer_paths) == 1:
+            return self.decrypt_config(
+                layer_paths[0], await self.async_storage.get_config(layer_paths[0])
+            )
+        configs = await self.async_storage.get_configs(layer_paths)
+        return self._merge(layer_paths, configs)
+
+    def _merge(
+        self, layer_paths: List[str], configs: Dict[str, Optional[ConfigVersion]]
+    ) -> Optional[ConfigVersion]:
+        return self.layers.merge(
+            layer_paths[-1],
+            [self.decrypt_config(layer, configs.get(layer)) for layer in layer_paths],
+        )
+
+    def resolve_change(
+        self,
+        path: str,
+        environment: str,
+        changed_path: str,
+        changed: Optional[ConfigVersion],
+    ) -> Optional[Tuple[ConfigVersion, Dict]]:
+        """
+        Merged and rendered config of ``environment`` right after the layer
+        at ``changed_path`` became ``changed`` (None once deleted).
+
+        The changed layer is taken from the event itself, as the config cache
+        may not have seen it yet; the others are read from storage.
+        """
+        layer_paths = self._layer_paths(path, environment)
+        configs = {
+            layer: changed if layer == changed_path else self.storage.get_config(layer)
+            for layer in layer_paths
+        }
+        config = self._merge(layer_paths, configs)
+        if config is None:
+            return None
+        return config, self.renderer.render(layer_paths[-1], config, environment)
+
+    def decrypt_config(
+        self, full_path: str, config: Optional[ConfigVersion]
+    ) -> Optional[ConfigVersion]:
+        """``config`` with its secret fields decrypted (memoized per version)."""
+        if config is None or self.encryptor is None:
+            return config
+        return self.encryptor.decrypt(full_path, config)
+
     def get_config(self, path: str, environment: str = "prod") -> Optional[Dict]:
         try:
-            full_path = self._get_full_path(path, environment)
-            config = self.storage.get_config(full_path)
+            config = self.get_stored_config(path, environment)
 
             if not config:
                 return None
 
             # Apply template substitution
-            template = Template(json.dumps(config.data))
-            rendered = template.render(env=environment)
+            return self.render_config(path, config, environment)
 
-            return json.loads(rendered)
+        except Exception as e:
+            logger.error(f"Error getting config {path}: {str(e)}")
+            raise
+
+    def get_configs(
+        self, paths: List[str], environment: str = "prod"
+    ) -> Dict[str, Optional[Dict]]:
+        try:
+            layer_paths = {path: self._layer_paths(path, environment) for path in paths}
+            configs = self.storage.get_configs(
+                [layer for layers in layer_paths.values() for layer in layers]
+            )
+            return self._render_all(layer_paths, configs, environment)
+        except Exception as e:
+            logger.error(f"Error getting configs {paths}: {str(e)}")
+            raise
+
+    async def get_configs_async(
+        self, paths: List[str], environment: str = "prod"
+    ) -> Dict[str, Optional[Dict]]:
+        try:
+            layer_paths = {path: self._layer_paths(path, environment) for path in paths}
+            configs = await self.async_storage.get_configs(
+                [layer for layers in layer_paths.values() for layer in layers]
+            )
+            return self._render_all(layer_paths, configs, environment)
+        except Exception as e:
+            logger.error(f"Error getting configs {paths}: {str(e)}")
+            raise
+
+    def _render_all(
+        self,
+        layer_paths: Dict[str, List[str]],
+        configs: Dict[str, Optional[ConfigVersion]],
+        environment: str,
+    ) -> Dict[str, Optional[Dict]]:
+        result = {}
+        for path, layers in layer_paths.items():
+            config = self._merge(layers, configs)
+            result[path] = (
+                self.renderer.render(layers[-1], config, environment)
+                if config
+                else None
+            )
+        return result
+
+    def render_config(
+        self, path: str, config: ConfigVersion, environment: str = "prod"
+    ) -> Dict:
+        full_path = self._get_full_path(path, environment)
+        return self.renderer.render(full_path, config, environment)
+
+    @staticmethod
+    def etag(config: ConfigVersion) -> str:
+        return f'"{config.version}"'
+
+    async def get_config_async(
+        self, path: str, environment: str = "prod"
+    ) -> Optional[Dict]:
+        try:
+            config = await self.get_stored_config_async(path, environment)
+
+            if not config:
+                return None
+
+            return self.render_config(path, config, environment)
 
         except Exception as e:
             logger.error(f"Error getting config {path}: {str(e)}")
             raise
 
+    async def update_config_async(self, *args, **kwargs) -> int:
+        return await self.async_storage.run(self.update_config, *args, **kwargs)
+
     def update_config(
         self,
         path: str,
@@ -53,27 +220,30 @@ class ConfigManager:
         environment: str = "prod",
         schema: Optional[Dict] = None,
         comment: Optional[str] = None,
-    ) -> None:
+        expected_revision: Optional[int] = None,
+    ) -> int:
         try:
-            # Validate schema if provided
-            validate_schema = schema or self.default_schema
-            if validate_schema and not validate_config_schema(
-                config_data, validate_schema
-            ):
-                raise ValueError("Configuration does not match schema")
+            # Validate against the given, registered or default schema
+            errors = self._validation_errors(path, config_data, environment, schema)
+            if errors:
+                raise SchemaValidationError(errors)
+
+            full_path = self._get_full_path(path, environment)
 
             # Create new version of the configuration
+            data, data_key = self._encrypt(path, full_path, config_data, True)
             version = ConfigVersion(
-                version=datetime.utcnow().isoformat(), data=config_data, comment=comment
+                version=new_version_id(),
+                data=data,
+                comment=comment,
+                data_key=data_key,
             )
 
-            full_path = self._get_full_path(path, environment)
-
-            # Store current version
-            self.storage.put_config(full_path, version)
-
-            # Store in version history
-            self.storage.put_config(f"versions/{full_path}/{version.version}", version)
+            # Store current version and version history in one transaction
+            revision = self.storage.commit_version(
+                full_path, version, expected_revision
+            )
+            self.renderer.invalidate(full_path)
 
             log = AuditLog(
                 action="update",
@@ -81,11 +251,199 @@ class ConfigManager:
                 user=user,
                 details={"version": version.version, "comment": comment},
             )
-            self.storage.add_audit_log(log)
+            self.storage.enqueue_audit_log(log)
+            return revision
         except Exception as e:
             logger.error(f"Error updating config {path}: {str(e)}")
             raise
 
+    def import_configs(
+        self,
+        entries: Iterable[Tuple[str, Dict]],
+        user: str,
+        environment: str = "prod",
+        comment: Optional[str] = None,
+        batch_size: int = MAX_TXN_OPS // 2,
+        workers: int = 8,
+        processes: int = 0,
+    ) -> Dict:
+        """
+        Validate and store many (path, config) entries streamed from ``entries``.
+
+        Each batch is validated and then written in one etcd transaction while
+        the next batch is being validated, with at most ``workers``
+        transactions in flight. Validation runs on the same thread pool, which
+        overlaps the reads of inherited layers but not jsonschema itself, as
+        that holds the GIL; with ``processes`` the schema checks run on that
+        many processes instead. Every written batch gets a single aggregated
+        audit entry. Unlike ``update_config`` there is no revision check: the
+        input wins. Returns how many configs were imported and the errors of
+        the ones that were not.
+        """
+        result = {"imported": 0, "failed": {}}
+
+        def collect(futures):
+            for future in futures:
+                paths, error = future.result()
+                if error is None:
+                    result["imported"] += len(paths)
+                else:
+                    result["failed"].update(dict.fromkeys(paths, error))
+
+        # spawn: forking would copy the gRPC and audit writer threads' locks
+        validators = (
+            ProcessPoolExecutor(processes, multiprocessing.get_context("spawn"))
+            if processes
+            else nullcontext()
+        )
+        with ThreadPoolExecutor(max_workers=workers) as executor, validators:
+            pending = set()
+            for batch in _chunks(entries, batch_size):
+                if processes:
+                    documents = executor.map(
+                        partial(self._import_document, environment=environment), batch
+                    )
+                    batch_errors = validators.map(
+                        document_errors,
+                        documents,
+                        chunksize=max(len(batch) // processes, 1),
+                    )
+                else:
+                    batch_errors = executor.map(
+                        partial(self._import_errors, environment=environment), batch
+                    )
+                versions = []
+                for (path, config_data), errors in zip(batch, batch_errors):
+                    if errors:
+                        result["failed"][path] = errors
+                        continue
+                    full_path = self._get_full_path(path, environment)
+                    data, data_key = self._encrypt(path, full_path, config_data, False)
+                    version = ConfigVersion(
+                        version=new_version_id(),
+                        data=data,
+                        comment=comment,
+                        data_key=data_key,
+                    )
+                    versions.append((full_path, version))
+                if not versions:
+                    continue
+
+                if len(pending) >= workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending.add(
+                    executor.submit(
+                        self._commit_import, versions, user, environment, comment
+                    )
+                )
+            collect(wait(pending).done)
+
+        return result
+
+    def _import_errors(
+        self, entry: Tuple[str, Dict], environment: str
+    ) -> Optional[List[str]]:
+        path, config_data = entry
+        if not isinstance(config_data, dict):
+            return ["config must be an object"]
+        return self._validation_errors(path, config_data, environment, None) or None
+
+    def _import_document(self, entry: Tuple[str, Dict], environment: str) -> Tuple:
+        """What ``document_errors`` needs to check ``entry`` in another process."""
+        path, config_data = entry
+        if not isinstance(config_data, dict):
+            return ["config must be an object"], None, None
+        validator, document = self._validation_document(
+            path, config_data, environment, None
+        )
+        return None, getattr(validator, "schema", None), document
+
+    def _commit_import(
+        self,
+        versions: List[Tuple[str, ConfigVersion]],
+        user: str,
+        environment: str,
+        comment: Optional[str],
+    ) -> Tuple[List[str], Optional[str]]:
+        paths = [full_path[len(environment) + 1 :] for full_path, _ in versions]
+        try:
+            revision = self.storage.commit_versions(versions)
+        except Exception as e:
+            logger.error(f"Error importing {len(versions)} configs: {str(e)}")
+            return paths, str(e)
+
+        for full_path, _ in versions:
+            self.renderer.invalidate(full_path)
+        log = AuditLog(
+            action="import",
+            path=f"{environment}/*",
+            user=user,
+            details={
+                "count": len(versions),
+                "revision": revision,
+                "comment": comment,
+                "versions": {
+                    full_path: version.version for full_path, version in versions
+                },
+            },
+        )
+        self.storage.enqueue_audit_log(log)
+        return paths, None
+
+    def _encrypt(
+        self, path: str, full_path: str, config_data: Dict, reuse_key: bool
+    ) -> Tuple[Dict, Optional[str]]:
+        if self.encryptor is None or not self.encryptor.fields_for(path):
+            return config_data, None
+        # Reusing the current data key keeps unchanged secrets byte-identical
+        previous = self.storage.get_config(full_path) if reuse_key else None
+        return self.encryptor.encrypt(full_path, config_data, previous)
+
+    def _validation_errors(
+        self,
+        path: str,
+        config_data: Dict,
+        environment: str,
+        schema: Optional[Dict],
+    ) -> List[str]:
+        validator, document = self._validation_document(
+            path, config_data, environment, schema
+        )
+        if validator is None:
+            return []
+        with time_validation(), tracing.span("schema.validate", path=path):
+            return schema_errors(document, validator)
+
+    def _validation_document(
+        self,
+        path: str,
+        config_data: Dict,
+        environment: str,
+        schema: Optional[Dict],
+    ) -> Tuple[Any, Dict]:
+        """The validator for ``path`` and the document it has to accept."""
+        validator = self._validator_for(path, schema)
+        if validator is None:
+            return None, config_data
+        # An inheriting environment only stores overrides; what has to be
+        # valid is the document they produce on top of the parent.
+        parent = self.layers.parents.get(environment)
+        if parent is not None:
+            inherited = self.get_stored_config(path, parent)
+            if inherited is not None:
+                config_data = deep_merge(inherited.data, config_data)
+        return validator, config_data
+
+    def _validator_for(self, path: str, schema: Optional[Dict]):
+        if schema:
+            return get_validator(schema)
+        if self.schema_registry is not None:
+            validator = self.schema_registry.validator_for(path)
+            if validator is not None:
+                return validator
+        return self._default_validator
+
     def rollback(
         self, path: str, version: str, user: str, environment: str = "prod"
     ) -> None:
@@ -93,12 +451,13 @@ class ConfigManager:
             full_path = self._get_full_path(path, environment)
 
             # Get specific version
-            target_version = self.storage.get_config(f"versions/{full_path}/{version}")
+            target_version = self.storage.get_version(full_path, version)
             if not target_version:
                 raise ValueError(f"Version {version} not found")
 
             # Update current version
-            self.storage.put_config(path, target_version)
+            self.storage.put_config(full_path, target_version)
+            self.renderer.invalidate(full_path)
 
             # Add audit log
             log = AuditLog(
@@ -107,7 +466,7 @@ class ConfigManager:
                 user=user,
                 details={"version": version},
             )
-            self.storage.add_audit_log(log)
+            self.storage.enqueue_audit_log(log)
         except Exception as e:
             logger.error(f"Error rolling back {path} to {version}: {str(e)}")
             raise
@@ -117,7 +476,47 @@ class ConfigManager:
 
         return self.storage.get_versions(full_path)
 
+    def get_version_page(
+        self,
+        path: str,
+        environment: str = "prod",
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        include_data: bool = False,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        full_path = self._get_full_path(path, environment)
+        return self.storage.get_version_page(full_path, limit, cursor, include_data)
+
+    def diff_versions(
+        self,
+        path: str,
+        from_version: str,
+        to_version: str,
+        environment: str = "prod",
+    ) -> Optional[List[Dict]]:
+        """JSON patch from one stored version to another, None if either is missing."""
+        full_path = self._get_full_path(path, environment)
+        source = self.decrypt_config(
+            full_path, self.storage.get_version(full_path, from_version)
+        )
+        target = self.decrypt_config(
+            full_path, self.storage.get_version(full_path, to_version)
+        )
+        if source is None or target is None:
+            return None
+        return diff(source.data, target.data)
+
     def verify_api_key(
         self, api_key: str, required_roles: Optional[List[str]] = None
     ) -> bool:
-        return self.auth_manager.verify_api_key(api_key, required_roles)
+        with tracing.span("auth.verify"):
+            return self.auth_manager.verify_api_key(api_key, required_roles)
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
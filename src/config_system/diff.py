@@ -0,0 +1,98 @@
+import copy
+from typing import Any, Dict, List
+
+# A small subset of JSON Patch (RFC 6902): add, remove and replace. Objects
+# are diffed key by key, lists element-wise when their length is unchanged
+# and replaced wholesale otherwise.
+
+
+def _escape(token: str) -> str:
+    return token.replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def _identical(source: Any, target: Any) -> bool:
+    # Plain == treats 1, 1.0 and True as equal, but JSON does not
+    if type(source) is not type(target):
+        return False
+    if isinstance(source, dict):
+        return source.keys() == target.keys() and all(
+            _identical(value, target[key]) for key, value in source.items()
+        )
+    if isinstance(source, list):
+        return len(source) == len(target) and all(map(_identical, source, target))
+    return source == target
+
+
+def diff(source: Any, target: Any, pointer: str = "") -> List[Dict]:
+    """JSON patch operations turning ``source`` into ``target``."""
+    if _identical(source, target):
+        return []
+
+    if isinstance(source, dict) and isinstance(target, dict):
+        operations = []
+        for key, value in source.items():
+            path = f"{pointer}/{_escape(str(key))}"
+            if key not in target:
+                operations.append({"op": "remove", "path": path})
+            else:
+                operations.extend(diff(value, target[key], path))
+        for key, value in target.items():
+            if key not in source:
+                operations.append(
+                    {
+                        "op": "add",
+                        "path": f"{pointer}/{_escape(str(key))}",
+                        "value": value,
+                    }
+                )
+        return operations
+
+    if (
+        isinstance(source, list)
+        and isinstance(target, list)
+        and len(source) == len(target)
+    ):
+        operations = []
+        for index, (old, new) in enumerate(zip(source, target)):
+            operations.extend(diff(old, new, f"{pointer}/{index}"))
+        return operations
+
+    return [{"op": "replace", "path": pointer, "value": target}]
+
+
+def apply_patch(document: Any, patch: List[Dict]) -> Any:
+    """Return a copy of ``document`` with the operations of ``patch`` applied."""
+    document = copy.deepcopy(document)
+    for operation in patch:
+        op, path = operation["op"], operation["path"]
+        if op not in ("add", "remove", "replace"):
+            raise ValueError(f"Unsupported patch operation: {op}")
+        value = copy.deepcopy(operation.get("value"))
+        if path == "":
+            if op == "remove":
+                raise ValueError("Cannot remove the document root")
+            document = value
+            continue
+
+        tokens = [_unescape(token) for token in path.split("/")[1:]]
+        parent = document
+        for token in tokens[:-1]:
+            parent = parent[int(token) if isinstance(parent, list) else token]
+
+        last = tokens[-1]
+        if isinstance(parent, list):
+            if op == "add":
+                parent.insert(len(parent) if last == "-" else int(last), value)
+            elif op == "remove":
+                del parent[int(last)]
+            else:
+                parent[int(last)] = value
+        elif op == "remove":
+            del parent[last]
+        else:
+            parent[last] = value
+    return document
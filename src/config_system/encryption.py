@@ -1,14 +1,44 @@
+import copy
+import fnmatch
+import hashlib
+import json
 import os
 from base64 import b64decode, b64encode
-from typing import Optional
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet
+
+from .cache import LRUCache
+from .models import ConfigVersion
+
+# Marks encrypted field values inside stored documents
+ENCRYPTED_PREFIX = "$enc:"
+
+
+def key_id(key: bytes) -> str:
+    """Short fingerprint identifying a master key inside wrapped data keys."""
+    return hashlib.sha256(key).hexdigest()[:8]
 
 
 class EncryptionManager:
-    def __init__(self, key: Optional[bytes] = None):
+    """
+    Keyring of Fernet master keys.
+
+    ``key`` is the primary key used for everything new; ``old_keys`` can
+    still decrypt. Wrapped data keys are prefixed with the id of the key that
+    wrapped them, so unwrapping is a dictionary lookup instead of trying every
+    key, and rotation can tell which ones still need re-wrapping.
+    """
+
+    def __init__(self, key: Optional[bytes] = None, old_keys: Sequence[bytes] = ()):
         self.key = key or Fernet.generate_key()
         self.cipher = Fernet(self.key)
+        self.key_id = key_id(self.key)
+        self._ciphers = {key_id(k): Fernet(k) for k in old_keys}
+        self._ciphers[self.key_id] = self.cipher
+        self._multi = MultiFernet(
+            [self.cipher] + [Fernet(k) for k in old_keys if k != self.key]
+        )
 
     def encrypt_value(self, value: str) -> str:
         encrypted = self.cipher.encrypt(value.encode())
@@ -17,16 +47,202 @@ class EncryptionManager:
     def decrypt_value(self, encrypted_value: str) -> str:
         try:
             decoded = b64decode(encrypted_value)
-            decrypted = self.cipher.decrypt(decoded)
+            decrypted = self._multi.decrypt(decoded)
             return decrypted.decode()
         except Exception as e:
             raise ValueError(f"Failed to decrypt value: {str(e)}")
 
+    def wrap_key(self, data_key: bytes) -> str:
+        # Fernet tokens are already URL-safe base64, no need for another layer
+        return f"{self.key_id}:{self.cipher.encrypt(data_key).decode()}"
+
+    def unwrap_key(self, wrapped_key: str) -> bytes:
+        kid, _, token = wrapped_key.rpartition(":")
+        try:
+            if not kid:
+                # Wrapped before keys had ids
+                return self._multi.decrypt(token.encode())
+            cipher = self._ciphers.get(kid)
+            if cipher is None:
+                raise ValueError(f"unknown key id {kid}")
+            return cipher.decrypt(token.encode())
+        except Exception as e:
+            raise ValueError(f"Failed to unwrap data key: {str(e)}")
+
+    def needs_rewrap(self, wrapped_key: str) -> bool:
+        return not wrapped_key.startswith(f"{self.key_id}:")
+
+    def rewrap(self, wrapped_key: str) -> str:
+        """The same data key wrapped by the primary key."""
+        return self.wrap_key(self.unwrap_key(wrapped_key))
+
     @classmethod
-    def from_environment(cls, env_var: str = "ENCRYPTION_KEY"):
+    def from_environment(
+        cls,
+        env_var: str = "ENCRYPTION_KEY",
+        old_keys_var: str = "ENCRYPTION_OLD_KEYS",
+    ):
         key = os.environ.get(env_var)
         if not key:
             raise ValueError(
                 f"Missing encryption key in environment variable {env_var}"
             )
-        return cls(key.encode())
+        old_keys = [
+            old_key.strip().encode()
+            for old_key in os.environ.get(old_keys_var, "").split(",")
+            if old_key.strip()
+        ]
+        return cls(key.encode(), old_keys)
+
+
+class FieldEncryptor:
+    """
+    Envelope encryption of the secret fields of config documents.
+
+    ``secret_fields`` maps config path patterns (shell-style, without the
+    environment) to JSON pointers of the fields to encrypt; ``*`` matches any
+    key or list index. Every config gets its own data key, stored wrapped by
+    the master key on the ``ConfigVersion`` and reused by later versions so
+    unchanged secrets keep their ciphertext (and version deltas stay small).
+    Unwrapped data keys and decrypted documents are kept in memory, so a
+    version is only decrypted once, all of its fields in one pass.
+    """
+
+    def __init__(
+        self,
+        manager: EncryptionManager,
+        secret_fields: Dict[str, List[str]],
+        cache_size: int = 10000,
+    ):
+        self.manager = manager
+        self.secret_fields = {
+            pattern: [_parse_pointer(pointer) for pointer in pointers]
+            for pattern, pointers in secret_fields.items()
+        }
+        self._ciphers = LRUCache(cache_size)
+        self._decrypted = LRUCache(cache_size)
+
+    def fields_for(self, path: str) -> List[List[str]]:
+        return [
+            tokens
+            for pattern, pointers in self.secret_fields.items()
+            if fnmatch.fnmatchcase(path, pattern)
+            for tokens in pointers
+        ]
+
+    def encrypt(
+        self, full_path: str, data: Dict, previous: Optional[ConfigVersion] = None
+    ) -> Tuple[Dict, Optional[str]]:
+        """
+        Encrypt the secret fields of ``data``; returns it with the wrapped key.
+
+        ``previous`` is the stored (encrypted) current version of the config,
+        whose data key and ciphertexts are reused where possible.
+        """
+        fields = self.fields_for(full_path.split("/", 1)[1])
+        if not fields:
+            return data, None
+
+        if previous is not None and previous.data_key:
+            data_key = previous.data_key
+            if self.manager.needs_rewrap(data_key):
+                # Same data key, so the old ciphertexts stay valid
+                data_key = self.manager.rewrap(data_key)
+            old = previous.data
+            old_plain = self.decrypt(full_path, previous).data
+        else:
+            data_key = self.manager.wrap_key(Fernet.generate_key())
+            old = old_plain = {}
+        cipher = self._cipher(data_key)
+
+        data = copy.deepcopy(data)
+        for tokens in fields:
+            for location, container, key, value in _locate(data, tokens, ()):
+                reused = _unchanged_ciphertext(old, old_plain, location, value)
+                if reused is not None:
+                    container[key] = reused
+                    continue
+                token = cipher.encrypt(json.dumps(value).encode()).decode()
+                container[key] = ENCRYPTED_PREFIX + token
+        return data, data_key
+
+    def decrypt(self, full_path: str, config: ConfigVersion) -> ConfigVersion:
+        """``config`` with every encrypted field of its document decrypted."""
+        if not config.data_key:
+            return config
+        cached = self._decrypted.get((full_path, config.version))
+        if cached is not None:
+            return cached
+
+        cipher = self._cipher(config.data_key)
+        plain = config.copy(update={"data": _decrypt_all(config.data, cipher)})
+        self._decrypted.put((full_path, config.version), plain)
+        return plain
+
+    def _cipher(self, data_key: str) -> Fernet:
+        cipher = self._ciphers.get(data_key)
+        if cipher is None:
+            cipher = Fernet(self.manager.unwrap_key(data_key))
+            self._ciphers.put(data_key, cipher)
+        return cipher
+
+
+def _parse_pointer(pointer: str) -> List[str]:
+    if not pointer.startswith("/"):
+        raise ValueError(f"Invalid JSON pointer: {pointer}")
+    return [
+        token.replace("~1", "/").replace("~0", "~") for token in pointer.split("/")[1:]
+    ]
+
+
+def _locate(
+    document: Any, tokens: List[str], path: Tuple
+) -> Iterator[Tuple[Tuple, Any, Any, Any]]:
+    """Yield (path, container, key, value) for every field ``tokens`` points at."""
+    if not tokens:
+        return
+    token, rest = tokens[0], tokens[1:]
+    if isinstance(document, dict):
+        keys = list(document) if token == "*" else [token]
+        keys = [key for key in keys if key in document]
+    elif isinstance(document, list):
+        if token == "*":
+            keys = list(range(len(document)))
+        elif token.isdigit() and int(token) < len(document):
+            keys = [int(token)]
+        else:
+            keys = []
+    else:
+        return
+
+    for key in keys:
+        if rest:
+            yield from _locate(document[key], rest, path + (key,))
+        else:
+            yield path + (key,), document, key, document[key]
+
+
+def _unchanged_ciphertext(old: Any, old_plain: Any, path: Tuple, value: Any):
+    """The previous ciphertext of the field at ``path`` if it still holds ``value``."""
+    try:
+        for step in path:
+            old, old_plain = old[step], old_plain[step]
+    except (KeyError, IndexError, TypeError):
+        return None
+    if old_plain == value and isinstance(old, str) and old.startswith(ENCRYPTED_PREFIX):
+        return old
+    return None
+
+
+def _decrypt_all(document: Any, cipher: Fernet) -> Any:
+    if isinstance(document, dict):
+        return {key: _decrypt_all(value, cipher) for key, value in document.items()}
+    if isinstance(document, list):
+        return [_decrypt_all(value, cipher) for value in document]
+    if isinstance(document, str) and document.startswith(ENCRYPTED_PREFIX):
+        token = document[len(ENCRYPTED_PREFIX) :]
+        try:
+            return json.loads(cipher.decrypt(token.encode()))
+        except Exception as e:
+            raise ValueError(f"Failed to decrypt field: {str(e)}")
+    return document
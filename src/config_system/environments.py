@@ -0,0 +1,86 @@
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+from .cache import LRUCache
+from .models import ConfigVersion
+
+
+def deep_merge(base: Dict, override: Dict) -> Dict:
+    """``override`` on top of ``base``; nested objects merge, anything else replaces."""
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class EnvironmentLayers:
+    """
+    Resolves configs through chains of parent environments.
+
+    ``parents`` maps an environment to the one it inherits from, e.g.
+    ``{"prod": "base", "prod-eu": "prod"}``; each environment then only
+    stores the keys it overrides. Merged documents are cached per config and
+    reused for as long as the versions of all layers stay the same. Those
+    versions come from the watched config cache, so a read only merges again
+    after one of its layers actually changed.
+    """
+
+    def __init__(self, parents: Optional[Dict[str, str]] = None, maxsize: int = 10000):
+        self.parents = dict(parents or {})
+        self._chains = {env: self._build_chain(env) for env in self.parents}
+        self._merged = LRUCache(maxsize)
+
+    def chain(self, environment: str) -> List[str]:
+        """Environments to read, from the root ancestor down to ``environment``."""
+        return self._chains.get(environment) or [environment]
+
+    def dependents(self, environment: str) -> List[str]:
+        """``environment`` and every environment inheriting from it."""
+        return [environment] + [
+            env
+            for env, chain in self._chains.items()
+            if env != environment and environment in chain
+        ]
+
+    def merge(
+        self, full_path: str, layers: List[Optional[ConfigVersion]]
+    ) -> Optional[ConfigVersion]:
+        present = [layer for layer in layers if layer is not None]
+        if len(present) <= 1:
+            return present[0] if present else None
+
+        versions = tuple(layer.version for layer in present)
+        cached = self._merged.get(full_path)
+        if cached is not None and cached[0] == versions:
+            return cached[1]
+
+        data: Dict = {}
+        for layer in present:
+            data = deep_merge(data, layer.data)
+        merged = ConfigVersion(
+            version=_merged_version(versions),
+            data=data,
+            created_at=max(layer.created_at for layer in present),
+            comment=present[-1].comment,
+        )
+        self._merged.put(full_path, (versions, merged))
+        return merged
+
+    def _build_chain(self, environment: str) -> List[str]:
+        chain = [environment]
+        while chain[-1] in self.parents:
+            parent = self.parents[chain[-1]]
+            if parent in chain:
+                raise ValueError(
+                    f"Environment inheritance cycle: {' -> '.join(chain + [parent])}"
+                )
+            chain.append(parent)
+        return chain[::-1]
+
+
+def _merged_version(versions: Tuple[str, ...]) -> str:
+    # Stable and short, so it can double as the ETag of the merged document
+    return hashlib.sha256("|".join(versions).encode()).hexdigest()[:32]
@@ -1,6 +1,37 @@
+import os
+import threading
 import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
 
-from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# In-process operations (cache lookups, renders, validation) take micro- to
+# milliseconds, far below the default buckets
+FAST_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
 
 
 class Metrics:
@@ -12,7 +43,115 @@ class Metrics:
         "request_duration_seconds", "Request latency in seconds", ["endpoint"]
     )
 
-    active_connections = Gauge("active_connections", "Number of active connections")
+    # One series per live worker process when running multiprocess
+    active_connections = Gauge(
+        "active_connections",
+        "Number of active connections",
+        multiprocess_mode="liveall",
+    )
+
+    cache_requests = Counter(
+        "config_cache_requests_total", "Cache lookups", ["cache", "result"]
+    )
+
+    etcd_duration = Histogram(
+        "etcd_request_duration_seconds",
+        "etcd request latency in seconds",
+        ["operation"],
+        buckets=FAST_BUCKETS,
+    )
+
+    render_duration = Histogram(
+        "config_render_duration_seconds",
+        "Template compilation and rendering latency in seconds",
+        buckets=FAST_BUCKETS,
+    )
+
+    validation_duration = Histogram(
+        "config_validation_duration_seconds",
+        "Schema validation latency in seconds",
+        buckets=FAST_BUCKETS,
+    )
+
+
+class PathBucketer:
+    """
+    Maps config paths onto a bounded set of metric label values.
+
+    A path is labelled with the longest configured prefix it starts with, or
+    else its first ``depth`` segments. Once ``max_buckets`` distinct labels
+    have been handed out every new one becomes ``other``.
+    """
+
+    def __init__(
+        self,
+        prefixes: Optional[List[str]] = None,
+        depth: int = 1,
+        max_buckets: int = 100,
+    ):
+        self.prefixes = sorted(prefixes or [], key=len, reverse=True)
+        self.depth = depth
+        self.max_buckets = max_buckets
+        self._buckets = set()
+        self._lock = threading.Lock()
+
+    def bucket(self, path: str) -> str:
+        path = path.strip("/")
+        for prefix in self.prefixes:
+            if path == prefix.strip("/") or path.startswith(prefix.rstrip("/") + "/"):
+                label = prefix
+                break
+        else:
+            segments = path.split("/")
+            label = "/".join(segments[: self.depth]) if self.depth > 0 else ""
+            if len(segments) > self.depth:
+                label = f"{label}/*" if label else "*"
+
+        if label in self._buckets:
+            return label
+        with self._lock:
+            if len(self._buckets) >= self.max_buckets:
+                return "other"
+            self._buckets.add(label)
+        return label
+
+
+_bucketer = PathBucketer()
+
+
+def configure(
+    prefixes: Optional[List[str]] = None, depth: int = 1, max_buckets: int = 100
+):
+    global _bucketer
+    _bucketer = PathBucketer(prefixes, depth, max_buckets)
+
+
+def _multiprocess_dir() -> Optional[str]:
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.environ.get(
+        "prometheus_multiproc_dir"
+    )
+
+
+def latest() -> Tuple[bytes, str]:
+    """
+    Current metrics in the Prometheus text format, and its content type.
+
+    With ``PROMETHEUS_MULTIPROC_DIR`` set (before the workers start) every
+    process writes its values to memory-mapped files in that directory, and
+    they are aggregated here, so any worker can answer for all of them.
+    """
+    if _multiprocess_dir():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: Optional[int] = None):
+    """Drop the live gauges of an exited worker (call from the server's hooks)."""
+    if _multiprocess_dir():
+        multiprocess.mark_process_dead(pid or os.getpid())
 
 
 def track_request_duration(endpoint: str, duration: float):
@@ -20,7 +159,7 @@ def track_request_duration(endpoint: str, duration: float):
 
 
 def increment_config_updates(path: str, status: str):
-    Metrics.config_updates.labels(path=path, status=status).inc()
+    Metrics.config_updates.labels(path=_bucketer.bucket(path), status=status).inc()
 
 
 def track_connection(active: bool = True):
@@ -28,3 +167,28 @@ def track_connection(active: bool = True):
         Metrics.active_connections.inc()
     else:
         Metrics.active_connections.dec()
+
+
+def track_cache(cache: str, hit: bool):
+    Metrics.cache_requests.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+@contextmanager
+def timed(histogram) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start)
+
+
+def time_etcd(operation: str):
+    return timed(Metrics.etcd_duration.labels(operation=operation))
+
+
+def time_render():
+    return timed(Metrics.render_duration)
+
+
+def time_validation():
+    return timed(Metrics.validation_duration)
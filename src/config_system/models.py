@@ -3,6 +3,14 @@ from typing import Dict, List, Optional
 
 from pydantic import BaseModel, Field
 
+# Fixed-width so version ids (and the history keys built from them) sort
+# chronologically as plain strings
+VERSION_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+def new_version_id() -> str:
+    return datetime.utcnow().strftime(VERSION_FORMAT)
+
 
 class ConfigVersion(BaseModel):
     version: str
@@ -10,6 +18,7 @@ class ConfigVersion(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     comment: Optional[str] = None
     user: Optional[str] = None
+    data_key: Optional[str] = None  # wrapped key of encrypted secret fields
 
     class Config:
         json_encoders = {datetime: lambda v: v.isoformat()}
@@ -49,17 +58,62 @@ class StorageConfig(BaseModel):
     port: int = 2379
     username: Optional[str] = None
     password: Optional[str] = None
+    cache_size: int = 10000  # cached config keys per worker, 0 disables
+    io_workers: int = 32  # threads for blocking etcd/sqlite calls per worker
+
+
+class RetentionConfig(BaseModel):
+    enabled: bool = False  # run the compactor in this process
+    keep_last: int = 50  # newest versions always kept per path
+    keep_days: int = 30  # every version younger than this is kept
+    thin_daily: bool = True  # older versions: keep one per day instead of none
+    interval: float = 3600.0  # seconds between compaction runs
+    compact_etcd: bool = True  # compact etcd's revision history after pruning
+    # revisions of history left uncompacted, so scans pinned to a revision
+    # (backups, restore verification) still finish while writes continue
+    compact_lag: int = 10000
+
+
+class MetricsConfig(BaseModel):
+    # config path label values: the longest matching prefix, otherwise the
+    # first path_depth segments; at most max_path_buckets distinct values
+    path_prefixes: List[str] = []
+    path_depth: int = 1
+    max_path_buckets: int = 100
+    endpoint: bool = True  # serve GET /metrics
+
+
+class TracingConfig(BaseModel):
+    enabled: bool = False
+    sample_rate: float = 0.01  # fraction of requests traced
+    export_path: str = "traces.jsonl"  # OTLP/JSON, one export request per line
+    service_name: str = "config-system"
+    max_queue: int = 10000  # spans waiting for export before new ones are dropped
 
 
 class SecurityConfig(BaseModel):
     secret_key: str
     token_expiry: int = 3600  # seconds
     min_password_length: int = 8
+    # config path pattern -> JSON pointers of fields stored encrypted,
+    # e.g. {"*/db": ["/password"]}; needs ENCRYPTION_KEY to be set
+    secret_fields: Dict[str, List[str]] = {}
+    # re-wrap stored data keys still using ENCRYPTION_OLD_KEYS in the background
+    rotate_keys: bool = False
 
 
 class AppConfig(BaseModel):
     cors: CORSConfig = CORSConfig()
     storage: StorageConfig = StorageConfig()
     security: SecurityConfig
+    retention: RetentionConfig = RetentionConfig()
+    metrics: MetricsConfig = MetricsConfig()
+    tracing: TracingConfig = TracingConfig()
+    # environment -> parent it inherits from, e.g. {"prod": "base"}
+    environments: Dict[str, str] = {}
     rate_limit_read: str = "100/minute"
     rate_limit_write: str = "20/minute"
+    batch_read_limit: int = 100  # max paths per POST /configs request
+    batch_write_limit: int = 1000  # max configs per PUT /configs request
+    watch_buffer_size: int = 16  # pending changes per subscriber before dropping
+    watch_keepalive: float = 15.0  # seconds between SSE keepalive comments
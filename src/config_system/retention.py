@@ -0,0 +1,133 @@
+import itertools
+import logging
+import threading
+from datetime import datetime, timedelta
+from operator import itemgetter
+from typing import Dict, List, Optional, Set
+
+from .models import AuditLog, RetentionConfig
+from .storage import StorageError
+
+logger = logging.getLogger(__name__)
+
+
+def versions_to_keep(
+    versions: List[str], policy: RetentionConfig, now: datetime
+) -> Set[str]:
+    """
+    Version ids (oldest first) of one path that ``policy`` retains.
+
+    The newest ``keep_last`` and everything younger than ``keep_days`` are
+    kept; of the older ones only the newest of each day when ``thin_daily``
+    is set. Ids that are not timestamps are always kept.
+    """
+    keep = set(versions[-max(policy.keep_last, 1) :])
+    cutoff = now - timedelta(days=policy.keep_days)
+    days = set()
+    for version in reversed(versions):
+        try:
+            created_at = datetime.fromisoformat(version)
+        except ValueError:
+            keep.add(version)
+            continue
+        if created_at >= cutoff:
+            keep.add(version)
+        elif policy.thin_daily and created_at.date() not in days:
+            days.add(created_at.date())
+            keep.add(version)
+    return keep
+
+
+class VersionCompactor:
+    """
+    Periodically prunes version history according to a retention policy.
+
+    Every run walks the history keys (keys only), deletes what the policy no
+    longer retains in batched transactions, records one ``prune`` audit entry
+    per path and finally compacts etcd ``compact_lag`` revisions behind the
+    one the run started from, so the deleted values are eventually released
+    without invalidating scans that are still reading at an older revision.
+    """
+
+    def __init__(self, storage, policy: RetentionConfig):
+        self.storage = storage
+        self.policy = policy
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._compacted = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="version-compactor", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def run_once(self, dry_run: bool = False) -> Dict[str, List[str]]:
+        """Prune every path once; returns the pruned version ids per path."""
+        now = datetime.utcnow()
+        revision = self.storage.current_revision()
+        pruned = {}
+        for path, entries in itertools.groupby(
+            self.storage.iter_history_keys(), key=itemgetter(0)
+        ):
+            versions = [version for _, version in entries]
+            keep = versions_to_keep(versions, self.policy, now)
+            # Exactly what was listed: versions committed since are not ours to judge
+            remove = [version for version in versions if version not in keep]
+            if not remove:
+                continue
+            if dry_run:
+                pruned[path] = remove
+                continue
+
+            try:
+                removed = self.storage.prune_versions(path, set(remove))
+            except StorageError as e:
+                logger.error(f"Skipping version pruning of {path}: {str(e)}")
+                continue
+            if removed:
+                pruned[path] = removed
+                self.storage.enqueue_audit_log(
+                    AuditLog(
+                        action="prune",
+                        path=path,
+                        user="compactor",
+                        details={"versions": removed},
+                    )
+                )
+
+        if pruned and not dry_run and self.policy.compact_etcd:
+            self._compact(revision - self.policy.compact_lag)
+        return pruned
+
+    def _compact(self, revision: int):
+        # Pruning already succeeded; a compaction that is not due yet or
+        # fails is simply left to a later run
+        if revision <= self._compacted:
+            return
+        try:
+            self.storage.compact(revision)
+            self._compacted = revision
+        except StorageError as e:
+            logger.error(f"Skipping etcd compaction at {revision}: {str(e)}")
+
+    def _run(self):
+        while not self._stop.wait(self.policy.interval):
+            try:
+                pruned = self.run_once()
+                if pruned:
+                    logger.info(
+                        f"Pruned {sum(map(len, pruned.values()))} versions "
+                        f"of {len(pruned)} configs"
+                    )
+            except Exception as e:
+                logger.error(f"Version compaction failed: {str(e)}")
@@ -0,0 +1,143 @@
+import json
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+from .encryption import EncryptionManager
+from .storage import MAX_TXN_OPS
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT = "key-rotation"
+
+# Every place a ConfigVersion (and so a wrapped data key) is stored
+ROTATED_PREFIXES = ("/config/", "/versions/")
+
+RETRY_INTERVAL = 10.0
+
+
+class KeyRotator:
+    """
+    Re-wraps every stored data key with the current primary master key.
+
+    The keyspace is walked in pages of ``batch_size`` keys with a pause after
+    each, and every page is written back in one transaction that only applies
+    if none of its keys changed in the meantime (a concurrent update already
+    wraps its data key with the primary key). Progress is checkpointed in
+    etcd after every page, so an interrupted rotation resumes where it
+    stopped, from any process. Because only the small wrapped data keys
+    change, secret fields themselves are not re-encrypted and reads keep
+    hitting their caches.
+    """
+
+    def __init__(
+        self,
+        storage,
+        manager: EncryptionManager,
+        batch_size: int = 100,
+        pause: float = 0.1,
+    ):
+        self.storage = storage
+        self.manager = manager
+        self.batch_size = min(batch_size, MAX_TXN_OPS)
+        self.pause = pause
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._failed = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="key-rotator", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def run(self) -> int:
+        """Rotate until done or stopped; returns the number of rewritten keys."""
+        checkpoint = self.storage.get_checkpoint(CHECKPOINT) or {}
+        if checkpoint.get("key_id") != self.manager.key_id:
+            checkpoint = {"key_id": self.manager.key_id, "done": []}
+        if checkpoint.get("complete"):
+            return 0
+
+        rewritten = 0
+        self._failed = 0
+        for prefix in ROTATED_PREFIXES:
+            if prefix in checkpoint["done"]:
+                continue
+            start_after = (
+                checkpoint.get("after") if checkpoint.get("prefix") == prefix else None
+            )
+            for page in self.storage.iter_pages(prefix, start_after, self.batch_size):
+                if self._stop.is_set():
+                    return rewritten
+                rewritten += self._rotate(page)
+                checkpoint.update(prefix=prefix, after=page[-1][0])
+                self.storage.put_checkpoint(CHECKPOINT, checkpoint)
+                self._stop.wait(self.pause)
+            checkpoint["done"].append(prefix)
+            checkpoint.pop("after", None)
+            self.storage.put_checkpoint(CHECKPOINT, checkpoint)
+
+        if self._failed:
+            # Start over next time rather than claiming the old keys are unused
+            self.storage.put_checkpoint(
+                CHECKPOINT, {"key_id": self.manager.key_id, "done": []}
+            )
+            logger.error(
+                f"{self._failed} data keys could not be re-wrapped, "
+                f"keep the old encryption keys"
+            )
+            return rewritten
+
+        checkpoint["complete"] = True
+        self.storage.put_checkpoint(CHECKPOINT, checkpoint)
+        logger.info(
+            f"Key rotation to {self.manager.key_id} complete, "
+            f"rewrote {rewritten} keys in this run"
+        )
+        return rewritten
+
+    def _rotate(self, page: List[Tuple[str, bytes, int]]) -> int:
+        items = []
+        for key, value, mod_revision in page:
+            rewrapped = self._rewrap(value)
+            if rewrapped is not None:
+                items.append((key, rewrapped, mod_revision))
+        if not items or self.storage.compare_and_put(items):
+            return len(items)
+
+        # Something in the page changed underneath; keep whatever still applies
+        return sum(self.storage.compare_and_put([item]) for item in items)
+
+    def _rewrap(self, value: bytes) -> Optional[str]:
+        if b'"data_key"' not in value:
+            return None
+        try:
+            record = json.loads(value)
+            data_key = record.get("data_key")
+            if not data_key or not self.manager.needs_rewrap(data_key):
+                return None
+            record["data_key"] = self.manager.rewrap(data_key)
+        except Exception as e:
+            logger.error(f"Cannot rewrap stored data key: {str(e)}")
+            self._failed += 1
+            return None
+        return json.dumps(record)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run()
+                return
+            except Exception as e:
+                logger.error(f"Key rotation failed, retrying: {str(e)}")
+                self._stop.wait(RETRY_INTERVAL)
@@ -0,0 +1,112 @@
+import fnmatch
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+from .cache import LRUCache
+from .validation import get_validator
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_PREFIX = "/schemas/"
+
+_MISSING = object()
+
+
+class SchemaRegistry:
+    """
+    Schemas stored in etcd and bound to config path patterns.
+
+    Every worker compiles the registered schemas once and keeps them until the
+    watch on the registry prefix reports a change. When several patterns match
+    a path the longest (most specific) one wins.
+    """
+
+    def __init__(self, storage, cache_size: int = 4096):
+        self.storage = storage
+        self._schemas: Optional[Dict[str, Tuple[str, object]]] = None
+        self._resolved = LRUCache(cache_size)
+        self._lock = threading.Lock()
+        self._watch_id = None
+        # Bumped on every change so loads racing an invalidation are discarded
+        self._generation = 0
+
+    def register(self, name: str, pattern: str, schema: Dict):
+        # Fails early on schemas that are not valid against their meta-schema
+        get_validator(schema)
+        self.storage.put_schema(name, {"pattern": pattern, "schema": schema})
+        self.invalidate()
+
+    def unregister(self, name: str):
+        self.storage.delete_schema(name)
+        self.invalidate()
+
+    def list(self) -> Dict[str, Dict]:
+        return self.storage.get_schemas()
+
+    def validator_for(self, path: str):
+        """Compiled validator registered for ``path``, or None."""
+        validator = self._resolved.get(path, _MISSING)
+        if validator is not _MISSING:
+            return validator
+
+        generation = self._generation
+        schemas = self._load()
+        matches = [
+            (pattern, validator)
+            for pattern, validator in schemas.values()
+            if fnmatch.fnmatchcase(path, pattern)
+        ]
+        validator = (
+            max(matches, key=lambda match: len(match[0]))[1] if matches else None
+        )
+        with self._lock:
+            if self._watch_id is not None and generation == self._generation:
+                self._resolved.put(path, validator)
+        return validator
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._schemas = None
+            self._resolved.clear()
+
+    def close(self):
+        with self._lock:
+            watch_id, self._watch_id = self._watch_id, None
+        if watch_id is not None:
+            self.storage.watch_hub.cancel_watch(watch_id)
+
+    def _load(self) -> Dict[str, Tuple[str, object]]:
+        schemas = self._schemas
+        if schemas is not None:
+            return schemas
+        generation = self._generation
+
+        if self._watch_id is None:
+            try:
+                self._watch_id = self.storage.watch_hub.add_watch_prefix_callback(
+                    SCHEMA_PREFIX, self._on_watch_response
+                )
+            except Exception as e:
+                logger.warning(f"Failed to watch schema registry: {str(e)}")
+
+        schemas = {}
+        for name, entry in self.storage.get_schemas().items():
+            try:
+                schemas[name] = (entry["pattern"], get_validator(entry["schema"]))
+            except Exception as e:
+                logger.error(f"Skipping invalid registered schema {name}: {str(e)}")
+
+        # Without a watch nothing would tell us about changes, so only keep
+        # the compiled schemas while one is active.
+        with self._lock:
+            if self._watch_id is not None and generation == self._generation:
+                self._schemas = schemas
+        return schemas
+
+    def _on_watch_response(self, response):
+        if isinstance(response, Exception):
+            logger.warning(f"Schema registry watch dropped: {str(response)}")
+            self._watch_id = None
+        self.invalidate()
@@ -1,20 +1,43 @@
 import json
 import logging
-import sqlite3
+import time
 from datetime import datetime
-from typing import Dict, List, Optional
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
 
 import etcd3
+from etcd3 import etcdrpc
 
+from .audit import AuditLogStore
+from .cache import LRUCache, WatchedCache, WatchedKeySet
+from .diff import apply_patch, diff
+from . import tracing
+from .metrics import time_etcd
 from .models import AuditLog, ConfigVersion
+from .watch import WatchHub
 
 logger = logging.getLogger(__name__)
 
+# etcd rejects transactions with more operations than --max-txn-ops (128)
+MAX_TXN_OPS = 128
+
+# Fields of version listings; data is only rebuilt when asked for
+_VERSION_METADATA = ("version", "created_at", "comment", "user")
+# Fields that turn a history entry into a patch against another version
+_DELTA_FIELDS = ("base", "snapshot", "depth", "patch")
+# History record fields written last, so listings can stop decoding before them
+_PAYLOAD_FIELDS = ("data", "patch")
+_decoder = json.JSONDecoder()
+
 
 class StorageError(Exception):
     pass
 
 
+class ConfigConflictError(StorageError):
+    pass
+
+
 class Storage:
     def __init__(
         self,
@@ -23,81 +46,530 @@ class Storage:
         audit_db: str = "audit.db",
         username: Optional[str] = None,
         password: Optional[str] = None,
+        cache_size: int = 10000,
+        snapshot_interval: int = 16,
     ):
         self.etcd = etcd3.client(host=host, port=port)
+        self.snapshot_interval = snapshot_interval
+        # path -> (version, snapshot version, depth) of the newest history entry
+        self._history_heads = LRUCache(cache_size)
         self.audit_db = audit_db
-        self._init_audit_db()
-
-    # For monitoring purposes,
-    #    - who made the request when
-    #    - what action was performed
-    #    - ..
-    def _init_audit_db(self):
-        try:
-            with sqlite3.connect(self.audit_db) as conn:
-                conn.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS audit_log (
-                        id INTEGER PRIMARY KEY,
-                        action TEXT NOT NULL,
-                        path TEXT NOT NULL,
-                        user TEXT NOT NULL,
-                        timestamp TIMESTAMP NOT NULL,
-                        details TEXT
-                    )
-                """
-                )
+        self.watch_hub = WatchHub(self.etcd)
+        self.cache = WatchedCache(
+            self.watch_hub, "/config/", ConfigVersion.parse_raw, maxsize=cache_size
+        )
+        # Started by whoever checks revocations, see AuthManager.attach_storage
+        self.revocations = WatchedKeySet(
+            self.watch_hub, "/revoked/", self._load_revocations
+        )
+        try:
+            self.audit = AuditLogStore(audit_db)
         except Exception as e:
             logger.error(f"Failed to initialize audit database: {str(e)}")
             raise StorageError("Failed to initialize storage")
 
     def get_config(self, path: str) -> Optional[ConfigVersion]:
         try:
-            value = self.etcd.get(f"/config/{path}")
-            return ConfigVersion.parse_raw(value[0]) if value[0] else None
+            return self.cache.get(
+                f"/config/{path}", partial(self._load, decode=ConfigVersion.parse_raw)
+            )
         except Exception as e:
             logger.error(f"Error retrieving config {path}: {str(e)}")
             raise StorageError(f"Failed to get config: {str(e)}")
 
+    def get_configs(self, paths: List[str]) -> Dict[str, Optional[ConfigVersion]]:
+        try:
+            result = {}
+            missing = []
+            for path in paths:
+                entry = self.cache.lookup(f"/config/{path}")
+                if entry is None:
+                    missing.append(path)
+                else:
+                    result[path] = entry[1]
+
+            for start in range(0, len(missing), MAX_TXN_OPS):
+                chunk = missing[start : start + MAX_TXN_OPS]
+                generation = self.cache.generation
+                response = self._get_batch([f"/config/{path}" for path in chunk])
+                for path, op in zip(chunk, response.responses):
+                    kvs = op.response_range.kvs
+                    if not kvs:
+                        # Cached as absent, like single reads, so layers without
+                        # an override do not cost a round trip every time
+                        self.cache.set(
+                            f"/config/{path}",
+                            response.header.revision,
+                            None,
+                            generation,
+                        )
+                        result[path] = None
+                        continue
+                    with tracing.span("json.decode", bytes=len(kvs[0].value)):
+                        config = ConfigVersion.parse_raw(kvs[0].value)
+                    self.cache.set(
+                        f"/config/{path}", kvs[0].mod_revision, config, generation
+                    )
+                    result[path] = config
+            return result
+        except Exception as e:
+            logger.error(f"Error retrieving configs {paths}: {str(e)}")
+            raise StorageError(f"Failed to get configs: {str(e)}")
+
+    def _get_batch(self, keys: List[str]):
+        # etcd3's transaction() drops the response header, whose revision is
+        # what absent keys are cached at, so the Txn is built here.
+        request = etcdrpc.TxnRequest(
+            success=[
+                etcdrpc.RequestOp(request_range=etcdrpc.RangeRequest(key=key.encode()))
+                for key in keys
+            ]
+        )
+        with time_etcd("get_batch"), tracing.span("etcd.get_batch", keys=len(keys)):
+            return self.etcd.kvstub.Txn(
+                request,
+                self.etcd.timeout,
+                credentials=self.etcd.call_credentials,
+                metadata=self.etcd.metadata,
+            )
+
+    def _load(self, key: str, decode: Callable[[bytes], Any]) -> Tuple[Any, int]:
+        with time_etcd("get"), tracing.span("etcd.get", key=key):
+            response = self.etcd.get_response(key)
+        if response.count < 1:
+            return None, response.header.revision
+        kv = response.kvs[0]
+        with tracing.span("json.decode", bytes=len(kv.value)):
+            return decode(kv.value), kv.mod_revision
+
     def put_config(self, path: str, version: ConfigVersion):
         try:
-            self.etcd.put(f"/config/{path}", version.json())
+            key = f"/config/{path}"
+            generation = self.cache.generation
+            response = self.etcd.put(key, version.json())
+            self.cache.set(key, response.header.revision, version, generation)
         except Exception as e:
             logger.error(f"Error storing config {path}: {str(e)}")
             raise StorageError(f"Failed to store config: {str(e)}")
 
+    def commit_version(
+        self,
+        path: str,
+        version: ConfigVersion,
+        expected_revision: Optional[int] = None,
+    ) -> int:
+        """
+        Atomically store a new current version and its history entry.
+
+        The transaction only applies if the current key is still at
+        ``expected_revision`` (0 when it must not exist yet). Without an
+        explicit revision the last known one is used, so concurrent writers
+        racing on the same path fail instead of interleaving. As that may
+        only be this worker's cache lagging behind another worker's write, a
+        failed compare is retried once against the revision read from etcd.
+
+        The history entry is a JSON patch against the previous version unless
+        that would exceed ``snapshot_interval`` patches since the last full
+        snapshot, or the patch is no smaller than the document itself.
+        """
+        key = f"/config/{path}"
+        generation = self.cache.generation
+        attempts = 1 if expected_revision is not None else 2
+        for attempt in range(attempts):
+            responses, expected, head = self._try_commit(
+                path, version, expected_revision, fresh=attempt > 0
+            )
+            if responses is not None:
+                break
+        else:
+            raise ConfigConflictError(
+                f"Config {path} was modified concurrently "
+                f"(expected revision {expected})"
+            )
+
+        revision = responses[0].response_put.header.revision
+        self.cache.set(key, revision, version, generation)
+        self._history_heads.put(path, head)
+        return revision
+
+    def _try_commit(
+        self,
+        path: str,
+        version: ConfigVersion,
+        expected_revision: Optional[int],
+        fresh: bool,
+    ) -> Tuple[Optional[List], int, Tuple[str, str, int]]:
+        key = f"/config/{path}"
+        try:
+            current, revision = self._current(key, fresh)
+            if expected_revision is None:
+                expected_revision = revision
+            record, head = self._history_record(
+                path, version, current if revision == expected_revision else None
+            )
+            with tracing.span("json.encode"):
+                value, history = version.json(), json.dumps(record)
+
+            with time_etcd("commit"), tracing.span("etcd.commit", key=key):
+                succeeded, responses = self.etcd.transaction(
+                    compare=[self.etcd.transactions.mod(key) == expected_revision],
+                    success=[
+                        self.etcd.transactions.put(key, value),
+                        self.etcd.transactions.put(
+                            f"/versions/{path}/{version.version}", history
+                        ),
+                    ],
+                    failure=[],
+                )
+        except Exception as e:
+            logger.error(f"Error committing config {path}: {str(e)}")
+            raise StorageError(f"Failed to store config: {str(e)}")
+        return (responses if succeeded else None), expected_revision, head
+
+    def _current(
+        self, key: str, fresh: bool = False
+    ) -> Tuple[Optional[ConfigVersion], int]:
+        entry = None if fresh else self.cache.peek(key)
+        if entry is None:
+            value, revision = self._load(key, ConfigVersion.parse_raw)
+        else:
+            revision, value = entry
+        return value, revision if value is not None else 0
+
+    def _history_record(
+        self, path: str, version: ConfigVersion, previous: Optional[ConfigVersion]
+    ) -> Tuple[Dict, Tuple[str, str, int]]:
+        record = _snapshot_record(version)
+        head = (version.version, version.version, 0)
+        if previous is None:
+            return record, head
+
+        snapshot, depth = self._history_head(path, previous.version)
+        if snapshot is None or depth + 1 >= self.snapshot_interval:
+            return record, head
+
+        patch = diff(previous.data, version.data)
+        if len(json.dumps(patch)) >= len(json.dumps(version.data)):
+            return record, head
+
+        del record["data"]
+        record.update(
+            base=previous.version, snapshot=snapshot, depth=depth + 1, patch=patch
+        )
+        return record, (version.version, snapshot, depth + 1)
+
+    def _history_head(self, path: str, version: str) -> Tuple[Optional[str], int]:
+        head = self._history_heads.get(path)
+        if head is not None and head[0] == version:
+            return head[1], head[2]
+        value, _ = self.etcd.get(f"/versions/{path}/{version}")
+        if value is None:
+            return None, 0
+        record = json.loads(value)
+        return record.get("snapshot", version), record.get("depth", 0)
+
+    def commit_versions(self, items: List[Tuple[str, ConfigVersion]]) -> int:
+        """
+        Store new current versions for many paths in one transaction.
+
+        Unlike ``commit_version`` this does not compare revisions: it is meant
+        for bulk imports where the input is the source of truth. ``items`` must
+        fit into a single transaction (``MAX_TXN_OPS // 2`` paths).
+        """
+        success = []
+        for path, version in items:
+            success.append(
+                self.etcd.transactions.put(f"/config/{path}", version.json())
+            )
+            success.append(
+                self.etcd.transactions.put(
+                    f"/versions/{path}/{version.version}",
+                    json.dumps(_snapshot_record(version)),
+                )
+            )
+        generation = self.cache.generation
+        try:
+            with time_etcd("commit_batch"):
+                _, responses = self.etcd.transaction(
+                    compare=[], success=success, failure=[]
+                )
+        except Exception as e:
+            logger.error(f"Error committing {len(items)} configs: {str(e)}")
+            raise StorageError(f"Failed to store configs: {str(e)}")
+
+        revision = responses[0].response_put.header.revision
+        for path, version in items:
+            self.cache.set(f"/config/{path}", revision, version, generation)
+            self._history_heads.put(path, (version.version, version.version, 0))
+        return revision
+
+    def get_version(self, path: str, version: str) -> Optional[ConfigVersion]:
+        prefix = f"/versions/{path}/"
+        try:
+            value, _ = self.etcd.get(prefix + version)
+            if value is None:
+                return None
+            record = json.loads(value)
+            if "patch" not in record:
+                return ConfigVersion.parse_obj(record)
+
+            # Versions sort chronologically, so the snapshot and every patch
+            # leading up to this version form one contiguous key range.
+            response = self._range(
+                (prefix + record["snapshot"]).encode(),
+                (prefix + version).encode() + b"\0",
+            )
+            return _rebuild(_history_records(prefix, response.kvs), version)
+        except Exception as e:
+            logger.error(f"Error retrieving version {version} of {path}: {str(e)}")
+            raise StorageError(f"Failed to get version: {str(e)}")
+
     def get_versions(self, path: str) -> List[ConfigVersion]:
+        prefix = f"/versions/{path}/"
         try:
             versions = []
-            kvs = self.etcd.get_prefix(f"/versions/{path}/")
-            for kv in kvs:
-                versions.append(ConfigVersion.parse_raw(kv[0]))
-            return sorted(versions, key=lambda x: x.created_at, reverse=True)
+            data = {}
+            kvs = self._iter_range(prefix.encode(), _prefix_end(prefix.encode()))
+            for record in _history_records(prefix, kvs).values():
+                if "patch" in record:
+                    record["data"] = apply_patch(
+                        data[record.pop("base")], record.pop("patch")
+                    )
+                data[record["version"]] = record["data"]
+                versions.append(ConfigVersion.parse_obj(record))
+            # Keys sort chronologically, so newest first is just reversed
+            return versions[::-1]
         except Exception as e:
             logger.error(f"Error retrieving versions for {path}: {str(e)}")
             raise StorageError(f"Failed to get versions: {str(e)}")
 
-    def add_audit_log(self, log: AuditLog):
+    def get_version_page(
+        self,
+        path: str,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        include_data: bool = False,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Newest-first page of version metadata and the cursor of the next page.
+
+        etcd returns the history keys already sorted, and the cursor is simply
+        the last version id of the page. Entries carry ``version``,
+        ``created_at``, ``comment`` and ``user``; ``data`` is only rebuilt
+        when ``include_data`` is set.
+        """
+        prefix = f"/versions/{path}/"
+        range_end = (
+            (prefix + cursor).encode() if cursor else _prefix_end(prefix.encode())
+        )
         try:
-            with sqlite3.connect(self.audit_db) as conn:
-                conn.execute(
-                    """
-                    INSERT INTO audit_log 
-                    (action, path, user, timestamp, details)
-                    VALUES (?, ?, ?, ?, ?)
-                    """,
-                    (
-                        log.action,
-                        log.path,
-                        log.user,
-                        log.timestamp.isoformat(),
-                        json.dumps(log.details),
-                    ),
+            # Versions of nested config paths share the prefix and are
+            # skipped, so keep reading until the page is full.
+            records: Dict[str, Dict] = {}
+            more = True
+            while more and len(records) < limit:
+                response = self._range(
+                    prefix.encode(),
+                    range_end,
+                    limit=limit - len(records),
+                    sort_order=etcdrpc.RangeRequest.DESCEND,
+                    sort_target=etcdrpc.RangeRequest.KEY,
+                )
+                records.update(
+                    _history_records(prefix, response.kvs, full=include_data)
+                )
+                more = response.more and bool(response.kvs)
+                if response.kvs:
+                    range_end = response.kvs[-1].key
+
+            page = list(records)
+            if include_data:
+                self._add_history_bases(prefix, records)
+
+            versions = []
+            for version in page:
+                record = records[version]
+                entry = {field: record.get(field) for field in _VERSION_METADATA}
+                if include_data:
+                    entry["data"] = _rebuild(records, version).data
+                versions.append(entry)
+        except Exception as e:
+            logger.error(f"Error retrieving versions for {path}: {str(e)}")
+            raise StorageError(f"Failed to get versions: {str(e)}")
+
+        next_cursor = range_end.decode()[len(prefix) :] if more else None
+        return versions, next_cursor
+
+    def _add_history_bases(self, prefix: str, records: Dict[str, Dict]):
+        """Fetch the older snapshots and patches the patch records build on."""
+        snapshots = [
+            record["snapshot"] for record in records.values() if "patch" in record
+        ]
+        if not snapshots:
+            return
+        oldest = min(records)
+        start = min(snapshots)
+        if start < oldest:
+            response = self._range(
+                (prefix + start).encode(), (prefix + oldest).encode()
+            )
+            records.update(_history_records(prefix, response.kvs))
+
+    def iter_history_keys(self, page_size: int = 1000) -> Iterator[Tuple[str, str]]:
+        """(config path, version id) of every history entry, in key order."""
+        prefix = b"/versions/"
+        try:
+            for kv in self._iter_range(
+                prefix, _prefix_end(prefix), page_size, keys_only=True
+            ):
+                path, version = kv.key[len(prefix) :].decode().rsplit("/", 1)
+                yield path, version
+        except StorageError:
+            raise
+        except Exception as e:
+            logger.error(f"Error reading version history: {str(e)}")
+            raise StorageError(f"Failed to read version history: {str(e)}")
+
+    def prune_versions(self, path: str, versions: Set[str]) -> List[str]:
+        """
+        Delete the given history entries of ``path``.
+
+        Only the named versions are deleted, so entries committed since the
+        caller listed the history are never touched. Remaining patches whose
+        base is about to be deleted are first rewritten as full snapshots, so
+        every remaining version can still be rebuilt even if a later delete
+        batch fails. Returns the deleted version ids.
+        """
+        prefix = f"/versions/{path}/"
+        try:
+            kvs = self._iter_range(prefix.encode(), _prefix_end(prefix.encode()))
+            records = _history_records(prefix, kvs)
+
+            data = {}
+            rewrites = []
+            for version, record in records.items():
+                if "patch" not in record:
+                    data[version] = record["data"]
+                elif record["base"] in data:
+                    data[version] = apply_patch(data[record["base"]], record["patch"])
+
+                if version not in versions and record.get("base") in versions:
+                    if version not in data:
+                        logger.error(f"Cannot rebuild version {version} of {path}")
+                        continue
+                    snapshot = {
+                        field: value
+                        for field, value in record.items()
+                        if field not in _DELTA_FIELDS
+                    }
+                    snapshot["data"] = data[version]
+                    rewrites.append(
+                        self.etcd.transactions.put(
+                            prefix + version, json.dumps(snapshot)
+                        )
+                    )
+
+            pruned = [version for version in records if version in versions]
+            operations = rewrites + [
+                self.etcd.transactions.delete(prefix + version) for version in pruned
+            ]
+            for start in range(0, len(operations), MAX_TXN_OPS):
+                self.etcd.transaction(
+                    compare=[],
+                    success=operations[start : start + MAX_TXN_OPS],
+                    failure=[],
                 )
+        except Exception as e:
+            logger.error(f"Error pruning versions of {path}: {str(e)}")
+            raise StorageError(f"Failed to prune versions: {str(e)}")
+
+        self._history_heads.pop(path)
+        return pruned
+
+    def iter_pages(
+        self, prefix: str, start_after: Optional[str] = None, page_size: int = 100
+    ) -> Iterator[List[Tuple[str, bytes, int]]]:
+        """
+        Pages of (key, value, mod revision) under ``prefix``, in key order.
+
+        Unlike ``_iter_range`` every page is read at the latest revision, so
+        slow consumers are not affected by compaction in the meantime.
+        """
+        key = (start_after or prefix).encode()
+        if start_after:
+            key += b"\0"
+        range_end = _prefix_end(prefix.encode())
+        while True:
+            try:
+                response = self._range(key, range_end, limit=page_size)
+            except Exception as e:
+                logger.error(f"Error reading {prefix}: {str(e)}")
+                raise StorageError(f"Failed to read {prefix}: {str(e)}")
+            if response.kvs:
+                yield [
+                    (kv.key.decode(), kv.value, kv.mod_revision) for kv in response.kvs
+                ]
+            if not response.more or not response.kvs:
+                return
+            key = response.kvs[-1].key + b"\0"
+
+    def compare_and_put(self, items: List[Tuple[str, str, int]]) -> bool:
+        """Put every (key, value) only if all keys are still at their mod revision."""
+        try:
+            succeeded, _ = self.etcd.transaction(
+                compare=[
+                    self.etcd.transactions.mod(key) == mod_revision
+                    for key, _, mod_revision in items
+                ],
+                success=[
+                    self.etcd.transactions.put(key, value) for key, value, _ in items
+                ],
+                failure=[],
+            )
+            return succeeded
+        except Exception as e:
+            logger.error(f"Error rewriting {len(items)} keys: {str(e)}")
+            raise StorageError(f"Failed to rewrite keys: {str(e)}")
+
+    def get_checkpoint(self, name: str) -> Optional[Dict]:
+        try:
+            value, _ = self.etcd.get(f"/checkpoints/{name}")
+            return json.loads(value) if value else None
+        except Exception as e:
+            logger.error(f"Error reading checkpoint {name}: {str(e)}")
+            raise StorageError(f"Failed to read checkpoint: {str(e)}")
+
+    def put_checkpoint(self, name: str, checkpoint: Dict):
+        try:
+            self.etcd.put(f"/checkpoints/{name}", json.dumps(checkpoint))
+        except Exception as e:
+            logger.error(f"Error storing checkpoint {name}: {str(e)}")
+            raise StorageError(f"Failed to store checkpoint: {str(e)}")
+
+    def compact(self, revision: int):
+        """Drop etcd's history of key revisions older than ``revision``."""
+        try:
+            self.etcd.compact(revision)
+        except Exception as e:
+            logger.error(f"Error compacting etcd at revision {revision}: {str(e)}")
+            raise StorageError(f"Failed to compact: {str(e)}")
+
+    def add_audit_log(self, log: AuditLog):
+        try:
+            with tracing.span("audit.write", action=log.action):
+                self.audit.write(log).result()
         except Exception as e:
             logger.error(f"Error adding audit log: {str(e)}")
             raise StorageError(f"Failed to add audit log: {str(e)}")
 
+    def enqueue_audit_log(self, log: AuditLog):
+        """Record an audit entry in the background without blocking the caller."""
+        span = tracing.start_span("audit.write", action=log.action)
+        future = self.audit.write(log)
+        if span is not None:
+            # Covers the time queued for the writer as well as the commit
+            future.add_done_callback(lambda f: span.end(f.exception()))
+
     def get_audit_logs(
         self,
         path: Optional[str] = None,
@@ -106,43 +578,65 @@ class Storage:
         end_time: Optional[datetime] = None,
         limit: int = 100,
     ) -> List[AuditLog]:
+        return self.get_audit_page(path, user, start_time, end_time, limit)[0]
+
+    def get_audit_page(
+        self,
+        path: Optional[str] = None,
+        user: Optional[str] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[AuditLog], Optional[str]]:
         try:
-            query = "SELECT * FROM audit_log WHERE 1=1"
-            params = []
-
-            if path:
-                query += " AND path = ?"
-                params.append(path)
-            if user:
-                query += " AND user = ?"
-                params.append(user)
-            if start_time:
-                query += " AND timestamp >= ?"
-                params.append(start_time.isoformat())
-            if end_time:
-                query += " AND timestamp <= ?"
-                params.append(end_time.isoformat())
-
-            query += " ORDER BY timestamp DESC LIMIT ?"
-            params.append(limit)
-
-            with sqlite3.connect(self.audit_db) as conn:
-                cursor = conn.execute(query, params)
-                return [
-                    AuditLog(
-                        id=row[0],
-                        action=row[1],
-                        path=row[2],
-                        user=row[3],
-                        timestamp=datetime.fromisoformat(row[4]),
-                        details=json.loads(row[5]) if row[5] else {},
-                    )
-                    for row in cursor.fetchall()
-                ]
+            return self.audit.query(path, user, start_time, end_time, limit, cursor)
+        except ValueError:
+            raise
         except Exception as e:
             logger.error(f"Error retrieving audit logs: {str(e)}")
             raise StorageError(f"Failed to get audit logs: {str(e)}")
 
+    def revoke_token(self, token_hash: str, expires_at: Optional[float] = None):
+        """
+        Publish a revoked API key to every worker.
+
+        Entries are attached to a lease that ends when the key would have
+        expired anyway, so the revocation list does not grow without bound.
+        """
+        key = f"/revoked/{token_hash}"
+        try:
+            lease = None
+            if expires_at is not None:
+                ttl = int(expires_at - time.time()) + 1
+                if ttl <= 0:
+                    return
+                lease = self.etcd.lease(ttl)
+            response = self.etcd.put(key, str(expires_at or ""), lease=lease)
+            self.revocations.add(key, response.header.revision)
+        except Exception as e:
+            logger.error(f"Error revoking token {token_hash}: {str(e)}")
+            raise StorageError(f"Failed to revoke token: {str(e)}")
+
+    def is_token_revoked(self, token_hash: str) -> bool:
+        """Checked against the in-memory revocation list, never etcd."""
+        return f"/revoked/{token_hash}" in self.revocations
+
+    def _load_revocations(self) -> Tuple[List[str], int]:
+        prefix = b"/revoked/"
+        revision = self.current_revision()
+        kvs = self._iter_range(
+            prefix, _prefix_end(prefix), revision=revision, keys_only=True
+        )
+        return [kv.key.decode() for kv in kvs], revision
+
+    def close(self):
+        self.audit.close()
+        self.revocations.stop()
+        self.cache.stop()
+        self.watch_hub.close()
+        self.etcd.close()
+
     def ping(self) -> bool:
         try:
             self.etcd.get("health_check")
@@ -150,22 +644,194 @@ class Storage:
         except Exception:
             return False
 
-    def dump_all(self) -> Dict:
+    def put_schema(self, name: str, entry: Dict):
         try:
-            result = {}
-            kvs = self.etcd.get_all()
-            for kv in kvs:
-                result[kv[1].key.decode()] = kv[0].decode()
-            return result
+            self.etcd.put(f"/schemas/{name}", json.dumps(entry))
         except Exception as e:
-            logger.error(f"Error dumping all configs: {str(e)}")
-            raise StorageError(f"Failed to dump configs: {str(e)}")
+            logger.error(f"Error storing schema {name}: {str(e)}")
+            raise StorageError(f"Failed to store schema: {str(e)}")
 
-    def restore_from_backup(self, backup_data: Dict):
+    def delete_schema(self, name: str):
+        try:
+            self.etcd.delete(f"/schemas/{name}")
+        except Exception as e:
+            logger.error(f"Error deleting schema {name}: {str(e)}")
+            raise StorageError(f"Failed to delete schema: {str(e)}")
+
+    def get_schemas(self) -> Dict[str, Dict]:
+        try:
+            return {
+                metadata.key.decode()[len("/schemas/") :]: json.loads(value)
+                for value, metadata in self.etcd.get_prefix("/schemas/")
+            }
+        except Exception as e:
+            logger.error(f"Error retrieving schemas: {str(e)}")
+            raise StorageError(f"Failed to get schemas: {str(e)}")
+
+    def current_revision(self) -> int:
+        try:
+            return self.etcd.get_response("health_check").header.revision
+        except Exception as e:
+            logger.error(f"Error reading current revision: {str(e)}")
+            raise StorageError(f"Failed to read revision: {str(e)}")
+
+    def _range(self, key: bytes, range_end: bytes, **fields):
+        # etcd3 0.12 silently drops limit, revision and the mod revision
+        # filters when it builds range requests, so build them here.
+        request = etcdrpc.RangeRequest(key=key, range_end=range_end, **fields)
+        with time_etcd("range"), tracing.span("etcd.range"):
+            return self.etcd.kvstub.Range(
+                request,
+                self.etcd.timeout,
+                credentials=self.etcd.call_credentials,
+                metadata=self.etcd.metadata,
+            )
+
+    def _iter_range(
+        self,
+        key: bytes,
+        range_end: bytes,
+        page_size: int = 1000,
+        revision: Optional[int] = None,
+        **fields,
+    ) -> Iterator:
+        """
+        Yield the raw key-values of a range in key order, one page at a time.
+
+        All pages are read at the same revision, so the result is a consistent
+        snapshot even while writes continue.
+        """
+        if revision is None:
+            revision = self.current_revision()
+        while True:
+            response = self._range(
+                key, range_end, limit=page_size, revision=revision, **fields
+            )
+            yield from response.kvs
+            if not response.more or not response.kvs:
+                return
+            key = response.kvs[-1].key + b"\0"
+
+    def iter_all(
+        self,
+        page_size: int = 1000,
+        revision: Optional[int] = None,
+        min_mod_revision: Optional[int] = None,
+    ) -> Iterator[Tuple[str, str]]:
+        """Every (key, value) pair, optionally only those modified since a revision."""
+        fields = {"min_mod_revision": min_mod_revision} if min_mod_revision else {}
+        try:
+            for kv in self._iter_range(b"\0", b"\0", page_size, revision, **fields):
+                yield kv.key.decode(), kv.value.decode()
+        except StorageError:
+            raise
+        except Exception as e:
+            logger.error(f"Error reading keyspace: {str(e)}")
+            raise StorageError(f"Failed to read keyspace: {str(e)}")
+
+    def iter_keys(
+        self, page_size: int = 1000, revision: Optional[int] = None
+    ) -> Iterator[str]:
+        try:
+            for kv in self._iter_range(
+                b"\0", b"\0", page_size, revision, keys_only=True
+            ):
+                yield kv.key.decode()
+        except StorageError:
+            raise
+        except Exception as e:
+            logger.error(f"Error reading keyspace: {str(e)}")
+            raise StorageError(f"Failed to read keyspace: {str(e)}")
+
+    def dump_all(self) -> Dict:
+        return dict(self.iter_all())
+
+    def restore_batch(self, items: List[Tuple[str, Optional[str]]]):
+        """Apply one transaction of puts; a value of None deletes the key."""
         try:
-            with self.etcd.transaction() as txn:
-                for key, value in backup_data.items():
-                    txn.put(key, value)
+            self.etcd.transaction(
+                compare=[],
+                success=[
+                    (
+                        self.etcd.transactions.delete(key)
+                        if value is None
+                        else self.etcd.transactions.put(key, value)
+                    )
+                    for key, value in items
+                ],
+                failure=[],
+            )
         except Exception as e:
-            logger.error(f"Error restoring from backup: {str(e)}")
+            logger.error(f"Error restoring {len(items)} keys: {str(e)}")
             raise StorageError(f"Failed to restore from backup: {str(e)}")
+
+    def restore_from_backup(self, backup_data: Dict):
+        items = list(backup_data.items())
+        for start in range(0, len(items), MAX_TXN_OPS):
+            self.restore_batch(items[start : start + MAX_TXN_OPS])
+
+
+def _prefix_end(prefix: bytes) -> bytes:
+    return prefix[:-1] + bytes([prefix[-1] + 1])
+
+
+def _snapshot_record(version: ConfigVersion) -> Dict:
+    record = json.loads(version.json())
+    record["data"] = record.pop("data")
+    return record
+
+
+def _history_records(prefix: str, kvs, full: bool = True) -> Dict[str, Dict]:
+    """
+    Decode history key-values, skipping those of nested config paths.
+
+    Unless ``full`` is set only the fields before the payload are decoded.
+    """
+    records = {}
+    for kv in kvs:
+        version = kv.key.decode()[len(prefix) :]
+        if "/" not in version:
+            records[version] = (
+                json.loads(kv.value) if full else _record_metadata(kv.value.decode())
+            )
+    return records
+
+
+def _record_metadata(value: str) -> Dict:
+    """The fields of a history record up to its ``data`` or ``patch``."""
+    record = {}
+    end = 1
+    while True:
+        end = _skip_whitespace(value, end)
+        if value[end] == "}":
+            return record
+        field, end = _decoder.raw_decode(value, end)
+        end = _skip_whitespace(value, _skip_whitespace(value, end) + 1)  # ':'
+        if field in _PAYLOAD_FIELDS:
+            break
+        record[field], end = _decoder.raw_decode(value, end)
+        end = _skip_whitespace(value, end)
+        if value[end] == ",":
+            end += 1
+    if all(field in record for field in _VERSION_METADATA):
+        return record
+    # Written before the payload was moved last
+    return json.loads(value)
+
+
+def _skip_whitespace(value: str, index: int) -> int:
+    while value[index] in " \t\n\r":
+        index += 1
+    return index
+
+
+def _rebuild(records: Dict[str, Dict], version: str) -> ConfigVersion:
+    """Apply the patches leading to ``version`` onto their full snapshot."""
+    chain = [records[version]]
+    while "patch" in chain[-1]:
+        chain.append(records[chain[-1]["base"]])
+
+    data = chain[-1]["data"]
+    for record in reversed(chain[:-1]):
+        data = apply_patch(data, record["patch"])
+    return ConfigVersion.parse_obj(dict(chain[0], data=data))
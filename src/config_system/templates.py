@@ -1,10 +1,18 @@
+import json
 import logging
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from jinja2 import BaseLoader, Environment, Template
 
+from . import tracing
+from .cache import LRUCache
+from .metrics import time_render
+from .models import ConfigVersion
+
 logger = logging.getLogger(__name__)
 
+TEMPLATE_MARKERS = ("{{", "{%", "{#")
+
 
 class TemplateRenderer:
     def __init__(self):
@@ -24,3 +32,60 @@ class TemplateRenderer:
             return True
         except Exception:
             return False
+
+
+_default_renderer = TemplateRenderer()
+
+
+def render_template(template_str: str, variables: Dict[str, Any]) -> str:
+    return _default_renderer.render(template_str, variables)
+
+
+class _CompiledConfig:
+    __slots__ = ("version", "template", "rendered")
+
+    def __init__(self, version: str, template: Optional[Template]):
+        self.version = version
+        self.template = template
+        self.rendered: Dict[str, Dict] = {}
+
+
+class ConfigRenderer:
+    """
+    Renders stored configuration documents with per-version caching.
+
+    Each path keeps the compiled template of its current version together with
+    the rendered result per environment. Documents without template markers
+    are returned as stored without going through Jinja at all. Rendered
+    results are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.env = Environment(loader=BaseLoader())
+        self._compiled = LRUCache(maxsize)
+
+    def render(self, path: str, config: ConfigVersion, environment: str) -> Dict:
+        compiled = self._compiled.get(path)
+        if compiled is None or compiled.version != config.version:
+            with time_render(), tracing.span("template.compile", path=path):
+                compiled = self._compile(config)
+            self._compiled.put(path, compiled)
+
+        rendered = compiled.rendered.get(environment)
+        if rendered is None:
+            if compiled.template is None:
+                rendered = config.data
+            else:
+                with time_render(), tracing.span("template.render", path=path):
+                    rendered = json.loads(compiled.template.render(env=environment))
+            compiled.rendered[environment] = rendered
+        return rendered
+
+    def invalidate(self, path: str):
+        self._compiled.pop(path)
+
+    def _compile(self, config: ConfigVersion) -> _CompiledConfig:
+        source = json.dumps(config.data)
+        if not any(marker in source for marker in TEMPLATE_MARKERS):
+            return _CompiledConfig(config.version, None)
+        return _CompiledConfig(config.version, self.env.from_string(source))
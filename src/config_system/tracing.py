@@ -0,0 +1,274 @@
+import contextvars
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_ERROR = 2
+
+# Span timestamps come from the monotonic clock, shifted onto the epoch once
+# so exported times still line up with other services
+_EPOCH_OFFSET_NS = time.time_ns() - time.perf_counter_ns()
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "config_system_span", default=None
+)
+_NOOP = nullcontext()
+
+
+class Span:
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "kind",
+        "attributes",
+        "start_ns",
+        "end_ns",
+        "error",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        kind: int,
+        attributes: Dict[str, Any],
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, error: Optional[BaseException] = None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.perf_counter_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        tracer = _tracer
+        if tracer is not None:
+            tracer.exporter.export(self)
+
+    def child(self, name: str, attributes: Dict[str, Any]) -> "Span":
+        return Span(name, self.trace_id, self.span_id, SPAN_KIND_INTERNAL, attributes)
+
+    def to_otlp(self) -> Dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            # 64-bit integers are strings in OTLP/JSON
+            "startTimeUnixNano": str(self.start_ns + _EPOCH_OFFSET_NS),
+            "endTimeUnixNano": str(self.end_ns + _EPOCH_OFFSET_NS),
+            "attributes": _attributes(self.attributes),
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.error:
+            span["status"] = {"code": STATUS_ERROR, "message": self.error}
+        return span
+
+
+class _Scope:
+    """Makes a span current for the duration of a ``with`` block."""
+
+    __slots__ = ("span", "_token")
+
+    def __init__(self, span: Span):
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        self.span.end(exc)
+        return False
+
+
+class FileSpanExporter:
+    """
+    Appends finished spans to a file in the OTLP/JSON format.
+
+    Each line is one ``ExportTraceServiceRequest``, which is what the
+    OpenTelemetry collector's ``otlpjsonfile`` receiver reads, so the file can
+    be shipped on to any tracing backend. Spans are queued and written by a
+    background thread every ``flush_interval`` seconds; when the queue is
+    full new spans are dropped rather than slowing down requests.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        service_name: str = "config-system",
+        max_queue: int = 10000,
+        flush_interval: float = 1.0,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._resource = {
+            "attributes": _attributes({"service.name": service_name}),
+        }
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(max_queue)
+        self._writer = threading.Thread(
+            target=self._run, name="span-exporter", daemon=True
+        )
+        self._writer.start()
+
+    def export(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 5.0):
+        self._queue.put(None)
+        self._writer.join(timeout=timeout)
+
+    def _run(self):
+        while True:
+            batch: List[Span] = []
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                try:
+                    span = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if span is None:
+                    stop = True
+                    break
+                batch.append(span)
+            if batch:
+                self._write(batch)
+            if stop:
+                return
+
+    def _write(self, spans: List[Span]):
+        request = {
+            "resourceSpans": [
+                {
+                    "resource": self._resource,
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "config_system"},
+                            "spans": [span.to_otlp() for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        try:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(request) + "\n")
+        except Exception as e:
+            logger.error(f"Error exporting {len(spans)} spans: {str(e)}")
+
+
+class Tracer:
+    def __init__(self, exporter, sample_rate: float = 0.01):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    def trace(self, name: str, attributes: Dict[str, Any]):
+        if random.random() >= self.sample_rate:
+            return _NOOP
+        trace_id = f"{random.getrandbits(128):032x}"
+        return _Scope(Span(name, trace_id, None, SPAN_KIND_SERVER, attributes))
+
+    def close(self):
+        self.exporter.close()
+
+
+_tracer: Optional[Tracer] = None
+
+
+def configure(
+    path: str,
+    sample_rate: float = 0.01,
+    service_name: str = "config-system",
+    max_queue: int = 10000,
+):
+    global _tracer
+    shutdown()
+    _tracer = Tracer(FileSpanExporter(path, service_name, max_queue), sample_rate)
+
+
+def shutdown():
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.close()
+
+
+def trace(name: str, **attributes):
+    """
+    Start a sampled trace; yields its root span, or None when not sampled.
+
+    Inside an already traced context this is just a child span.
+    """
+    if _current.get() is not None:
+        return span(name, **attributes)
+    tracer = _tracer
+    if tracer is None:
+        return _NOOP
+    return tracer.trace(name, attributes)
+
+
+def span(name: str, **attributes):
+    """Child span of the current one; a no-op outside sampled traces."""
+    parent = _current.get()
+    if parent is None:
+        return _NOOP
+    return _Scope(parent.child(name, attributes))
+
+
+def start_span(name: str, **attributes) -> Optional[Span]:
+    """
+    Child span of the current one that is not made current.
+
+    For work that completes elsewhere, e.g. on a background thread; the
+    caller has to ``end()`` it.
+    """
+    parent = _current.get()
+    if parent is None:
+        return None
+    return parent.child(name, attributes)
+
+
+def _attributes(attributes: Dict[str, Any]) -> List[Dict]:
+    result = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        result.append({"key": key, "value": typed})
+    return result
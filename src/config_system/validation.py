@@ -1,18 +1,79 @@
+import hashlib
+import json
 import logging
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
 
-from jsonschema import ValidationError, validate
+from jsonschema.exceptions import SchemaError
+from jsonschema.validators import validator_for
+
+from .cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
+# schema hash -> validator instance, checked against its meta-schema once
+_validators = LRUCache(256)
+
+
+class SchemaValidationError(ValueError):
+    def __init__(self, errors: List[str]):
+        super().__init__(f"Configuration does not match schema: {'; '.join(errors)}")
+        self.errors = errors
+
+
+class InvalidSchemaError(ValueError):
+    pass
+
+
+def schema_hash(schema: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(schema, sort_keys=True).encode()).hexdigest()
+
+
+def get_validator(schema: Dict[str, Any]):
+    """Compiled validator for ``schema``, built on first use and cached."""
+    key = schema_hash(schema)
+    validator = _validators.get(key)
+    if validator is None:
+        cls = validator_for(schema)
+        try:
+            cls.check_schema(schema)
+        except SchemaError as e:
+            raise InvalidSchemaError(f"Invalid schema: {e.message}")
+        validator = cls(schema)
+        _validators.put(key, validator)
+    return validator
+
+
+def schema_errors(config: Dict[str, Any], validator) -> List[str]:
+    """Every violation of ``config`` against a compiled validator, in one pass."""
+    errors = []
+    for error in validator.iter_errors(config):
+        location = "/".join(str(part) for part in error.absolute_path)
+        errors.append(f"{location or '<root>'}: {error.message}")
+    return errors
+
+
+def document_errors(
+    document: Tuple[Optional[List[str]], Optional[Dict[str, Any]], Any]
+) -> Optional[List[str]]:
+    """
+    Errors of an (errors, schema, config) triple, None when it is valid.
+
+    For process pools, which cannot be sent compiled validators; each
+    process compiles and caches its own.
+    """
+    errors, schema, config = document
+    if schema is not None:
+        errors = schema_errors(config, get_validator(schema))
+    return errors or None
+
 
 def validate_config_schema(config: Dict[str, Any], schema: Dict[str, Any]) -> bool:
     try:
-        validate(instance=config, schema=schema)
+        errors = schema_errors(config, get_validator(schema))
+        if errors:
+            logger.error(f"Schema validation failed: {'; '.join(errors)}")
+            return False
         return True
-    except ValidationError as e:
-        logger.error(f"Schema validation failed: {str(e)}")
-        return False
     except Exception as e:
         logger.error(f"Unexpected error during schema validation: {str(e)}")
         return False
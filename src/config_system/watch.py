@@ -0,0 +1,261 @@
+import asyncio
+import itertools
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from etcd3.events import DeleteEvent
+
+from .models import ConfigVersion
+
+logger = logging.getLogger(__name__)
+
+
+class WatchHub:
+    """
+    Multiplexes local subscribers onto one etcd watch per key prefix.
+
+    Exposes the same ``add_watch_prefix_callback``/``cancel_watch`` pair as the
+    etcd3 client so it can be handed to anything that expects one. When the
+    underlying watch fails every subscriber of that prefix receives the error
+    and is dropped; the next subscription re-creates the etcd watch.
+    """
+
+    def __init__(self, etcd):
+        self.etcd = etcd
+        self._lock = threading.Lock()
+        self._create_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._watches: Dict[str, int] = {}
+        self._callbacks: Dict[str, Dict[int, Callable]] = {}
+        self._prefixes: Dict[int, str] = {}
+
+    def add_watch_prefix_callback(self, prefix: str, callback: Callable) -> int:
+        # The etcd watcher thread must be able to take _lock while a new watch
+        # is being created, so creation is serialised on a separate lock.
+        with self._create_lock:
+            with self._lock:
+                watched = prefix in self._watches
+            if not watched:
+                watch_id = self.etcd.add_watch_prefix_callback(
+                    prefix, lambda response: self._dispatch(prefix, response)
+                )
+                with self._lock:
+                    self._watches[prefix] = watch_id
+                    self._callbacks[prefix] = {}
+
+            with self._lock:
+                subscription_id = next(self._ids)
+                self._callbacks.setdefault(prefix, {})[subscription_id] = callback
+                self._prefixes[subscription_id] = prefix
+                return subscription_id
+
+    def cancel_watch(self, subscription_id: int):
+        with self._lock:
+            prefix = self._prefixes.pop(subscription_id, None)
+            if prefix is None:
+                return
+            callbacks = self._callbacks[prefix]
+            callbacks.pop(subscription_id, None)
+            if callbacks:
+                return
+            del self._callbacks[prefix]
+            watch_id = self._watches.pop(prefix)
+        self.etcd.cancel_watch(watch_id)
+
+    def close(self):
+        with self._lock:
+            watch_ids = list(self._watches.values())
+            self._watches.clear()
+            self._callbacks.clear()
+            self._prefixes.clear()
+        for watch_id in watch_ids:
+            try:
+                self.etcd.cancel_watch(watch_id)
+            except Exception as e:
+                logger.warning(f"Failed to cancel watch: {str(e)}")
+
+    def _dispatch(self, prefix: str, response):
+        with self._lock:
+            callbacks = list(self._callbacks.get(prefix, {}).values())
+            if isinstance(response, Exception):
+                # etcd3 has already torn the watch down
+                self._watches.pop(prefix, None)
+                for subscription_id in self._callbacks.pop(prefix, {}):
+                    self._prefixes.pop(subscription_id, None)
+
+        for callback in callbacks:
+            try:
+                callback(response)
+            except Exception:
+                logger.exception(f"Watch subscriber on {prefix} failed")
+
+
+class Subscription:
+    def __init__(self, full_path: str, buffer_size: int):
+        self.full_path = full_path
+        self.queue: "asyncio.Queue[Optional[Dict]]" = asyncio.Queue(buffer_size)
+        self.dropped = False
+
+    async def get(self) -> Optional[Dict]:
+        """Next change notification, or None once the subscription was dropped."""
+        return await self.queue.get()
+
+    def _drop(self):
+        self.dropped = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class ChangeBroadcaster:
+    """
+    Fans config changes from a single shared watch out to async subscribers.
+
+    Each change is resolved and rendered once, on the etcd watcher thread,
+    then offered to the bounded queue of every subscriber of that path.
+    Subscribers whose queue is full are dropped rather than allowed to hold
+    back the others.
+
+    ``dependents`` maps an environment to every environment whose documents
+    include it (itself and those inheriting from it) and ``resolve`` returns
+    the (version, rendered document) of a subscribed path right after one of
+    its layers changed, or None once nothing is left. By default every
+    environment stands alone and notifications carry the changed document.
+    """
+
+    def __init__(
+        self,
+        hub: WatchHub,
+        renderer,
+        loop: asyncio.AbstractEventLoop,
+        prefix: str = "/config/",
+        buffer_size: int = 16,
+        resolve: Optional[
+            Callable[
+                [str, str, str, Optional[ConfigVersion]],
+                Optional[Tuple[ConfigVersion, Dict]],
+            ]
+        ] = None,
+        dependents: Optional[Callable[[str], List[str]]] = None,
+    ):
+        self.hub = hub
+        self.renderer = renderer
+        self.resolve = resolve or self._render_layer
+        self.dependents = dependents or (lambda environment: [environment])
+        self.loop = loop
+        self.prefix = prefix
+        self.buffer_size = buffer_size
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._watch_id = None
+
+    def subscribe(self, full_path: str) -> Subscription:
+        if self._watch_id is None:
+            self._watch_id = self.hub.add_watch_prefix_callback(
+                self.prefix, self._on_watch_response
+            )
+        subscription = Subscription(full_path, self.buffer_size)
+        self._subscribers.setdefault(full_path, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.full_path)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.full_path]
+
+    def close(self):
+        for subscribers in list(self._subscribers.values()):
+            for subscription in list(subscribers):
+                subscription._drop()
+        self._subscribers.clear()
+        if self._watch_id is not None:
+            self.hub.cancel_watch(self._watch_id)
+            self._watch_id = None
+
+    def _on_watch_response(self, response):
+        # Runs on the etcd watcher thread, which may block on the storage
+        # reads of other layers; the event loop only hands results out.
+        if isinstance(response, Exception):
+            self.loop.call_soon_threadsafe(self._publish, response)
+            return
+
+        notifications = []
+        for event in response.events:
+            changed_path = event.key.decode()[len(self.prefix) :]
+            environment, path = changed_path.split("/", 1)
+            changed = None
+            if not isinstance(event, DeleteEvent):
+                try:
+                    changed = ConfigVersion.parse_raw(event.value)
+                except Exception as e:
+                    logger.error(f"Failed to decode change of {changed_path}: {str(e)}")
+                    continue
+
+            for dependent in self.dependents(environment):
+                full_path = f"{dependent}/{path}"
+                if full_path not in self._subscribers:
+                    continue
+                notification = self._notification(
+                    full_path, changed_path, changed, event.mod_revision
+                )
+                if notification is not None:
+                    notifications.append((full_path, notification))
+        if notifications:
+            self.loop.call_soon_threadsafe(self._publish, notifications)
+
+    def _publish(self, notifications):
+        if isinstance(notifications, Exception):
+            logger.warning(f"Change stream watch dropped: {str(notifications)}")
+            self._watch_id = None
+            self.close()
+            return
+
+        for full_path, notification in notifications:
+            for subscription in list(self._subscribers.get(full_path, ())):
+                try:
+                    subscription.queue.put_nowait(notification)
+                except asyncio.QueueFull:
+                    logger.info(f"Dropping slow subscriber of {full_path}")
+                    subscription._drop()
+                    self.unsubscribe(subscription)
+
+    def _notification(
+        self,
+        full_path: str,
+        changed_path: str,
+        changed: Optional[ConfigVersion],
+        revision: int,
+    ) -> Optional[Dict]:
+        environment, path = full_path.split("/", 1)
+        notification = {
+            "path": path,
+            "environment": environment,
+            "revision": revision,
+        }
+        try:
+            resolved = self.resolve(path, environment, changed_path, changed)
+        except Exception as e:
+            logger.error(f"Failed to render change of {full_path}: {str(e)}")
+            return None
+        if resolved is None:
+            notification["deleted"] = True
+            return notification
+
+        config, rendered = resolved
+        notification["version"] = config.version
+        notification["config"] = rendered
+        return notification
+
+    def _render_layer(
+        self,
+        path: str,
+        environment: str,
+        changed_path: str,
+        changed: Optional[ConfigVersion],
+    ) -> Optional[Tuple[ConfigVersion, Dict]]:
+        if changed is None:
+            return None
+        return changed, self.renderer.render(changed_path, changed, environment)
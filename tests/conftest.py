@@ -4,6 +4,10 @@ from pathlib import Path
 import docker
 import pytest
 import yaml
+from etcd3 import etcdrpc
+
+from config_system.cache import LRUCache
+from config_system.storage import Storage
 
 
 @pytest.fixture(scope="session")
@@ -25,3 +29,64 @@ def get_docker_client(load_config):
         return docker.DockerClient(base_url=f"unix://{home}/.orbstack/run/docker.sock")
     else:
         return docker.from_env()
+
+
+class FakeKV:
+    def __init__(self, key, value):
+        self.key = key.encode()
+        self.value = value.encode()
+
+
+class FakeRangeResponse:
+    def __init__(self, kvs, more):
+        self.kvs = kvs
+        self.more = more
+
+
+class DictEtcd:
+    """A dict of keys behind etcd3's get and unconditional transactions."""
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.transactions = self
+
+    def get(self, key):
+        return self.keys.get(key), None
+
+    def put(self, key, value):
+        return ("put", key, value)
+
+    def delete(self, key):
+        return ("delete", key, None)
+
+    def transaction(self, compare, success, failure):
+        for operation, key, value in success:
+            if operation == "put":
+                self.keys[key] = value
+            else:
+                self.keys.pop(key, None)
+        return True, []
+
+
+@pytest.fixture
+def dict_storage():
+    """Builds a Storage over a dict of keys, with ranges read from it too."""
+
+    def build(keys):
+        storage = Storage.__new__(Storage)
+        storage.etcd = DictEtcd(keys)
+        storage._history_heads = LRUCache(16)
+        storage.current_revision = lambda: 7
+
+        def fake_range(key, range_end, limit=0, sort_order=0, **fields):
+            matching = sorted(k for k in keys if key.decode() <= k < range_end.decode())
+            if sort_order == etcdrpc.RangeRequest.DESCEND:
+                matching.reverse()
+            page = matching[:limit] if limit else matching
+            more = len(page) < len(matching)
+            return FakeRangeResponse([FakeKV(k, keys[k]) for k in page], more)
+
+        storage._range = fake_range
+        return storage
+
+    return build
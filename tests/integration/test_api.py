@@ -132,3 +132,27 @@ def test_can_not_access_with_wrong_api_key(test_client):
 
     assert response.status_code == HTTPStatus.UNAUTHORIZED
     assert response.json() == {"detail": "Invalid API key"}
+
+
+def test_can_not_batch_read_with_wrong_api_key(test_client):
+    headers = {"X-API-Key": "wrong-api-key"}
+
+    response = test_client.post(
+        "/configs", json={"paths": ["a", "b"]}, headers=headers
+    )
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_batch_read_marks_missing_paths(test_client, api_key):
+    headers = {"X-API-Key": api_key}
+
+    response = test_client.post(
+        "/configs", json={"paths": ["missing-a", "missing-b"]}, headers=headers
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {
+        "configs": {"missing-a": None, "missing-b": None},
+        "not_found": ["missing-a", "missing-b"],
+    }
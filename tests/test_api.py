@@ -0,0 +1,101 @@
+from http import HTTPStatus
+from types import SimpleNamespace
+
+import pytest
+
+from config_system.api import ConfigurationAPI, _etag_matches
+from config_system.auth import AuthManager
+from config_system.config_manager import ConfigManager
+from config_system.models import AppConfig, ConfigVersion, SecurityConfig
+
+
+def test_etag_matching_forms():
+    assert _etag_matches('"v1"', '"v1"')
+    assert _etag_matches('W/"v1"', '"v1"')
+    assert _etag_matches('"v0", W/"v1"', '"v1"')
+    assert _etag_matches("*", '"v1"')
+    assert not _etag_matches('"v0"', '"v1"')
+    assert not _etag_matches(None, '"v1"')
+
+
+class FakeStorage:
+    def __init__(self, configs):
+        self.configs = configs
+
+    def get_config(self, path):
+        return self.configs.get(path)
+
+    def get_configs(self, paths):
+        return {path: self.configs.get(path) for path in paths}
+
+
+class FakeAsyncStorage:
+    def __init__(self, storage):
+        self.storage = storage
+
+    async def get_config(self, path):
+        return self.storage.get_config(path)
+
+    async def get_configs(self, paths):
+        return self.storage.get_configs(paths)
+
+
+@pytest.fixture
+def api():
+    storage = FakeStorage(
+        {
+            "base/app": ConfigVersion(version="b1", data={"replicas": 1}),
+            "prod/app": ConfigVersion(version="p1", data={"env": "{{ env }}"}),
+        }
+    )
+    auth_manager = AuthManager("secret" * 8)
+    config_manager = ConfigManager(
+        storage,
+        auth_manager,
+        async_storage=FakeAsyncStorage(storage),
+        environments={"prod": "base"},
+    )
+    return SimpleNamespace(
+        api=ConfigurationAPI(
+            AppConfig(security=SecurityConfig(secret_key="secret" * 8))
+        ),
+        api_key=auth_manager.create_api_key(["read"]),
+        storage=storage,
+        state=SimpleNamespace(config_manager=config_manager),
+    )
+
+
+async def _get(api, if_none_match=None):
+    request = SimpleNamespace(
+        app=SimpleNamespace(state=api.state),
+        headers={"if-none-match": if_none_match} if if_none_match else {},
+    )
+    return await api.api._get_config(request, "app", "prod", api.api_key)
+
+
+@pytest.mark.asyncio
+async def test_config_read_sends_etag_and_honours_if_none_match(api):
+    response = await _get(api)
+    etag = response.headers["etag"]
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.body == b'{"replicas":1,"env":"prod"}'
+
+    for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        response = await _get(api, header)
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
+        assert response.headers["etag"] == etag
+
+    assert (await _get(api, '"other"')).status_code == HTTPStatus.OK
+
+
+@pytest.mark.asyncio
+async def test_etag_changes_when_an_inherited_layer_changes(api):
+    etag = (await _get(api)).headers["etag"]
+    api.storage.configs["base/app"] = ConfigVersion(version="b2", data={"replicas": 2})
+
+    response = await _get(api, etag)
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["etag"] != etag
+    assert response.body == b'{"replicas":2,"env":"prod"}'
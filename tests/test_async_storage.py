@@ -0,0 +1,67 @@
+import contextvars
+import threading
+
+import pytest
+
+from config_system.async_storage import AsyncStorage
+from config_system.models import ConfigVersion
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+class FakeCache:
+    prefix = "/config/"
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def peek(self, key):
+        return self.entries.get(key)
+
+
+class FakeStorage:
+    def __init__(self, entries):
+        self.cache = FakeCache(entries)
+        self.reads = []
+
+    def get_config(self, path):
+        self.reads.append((path, threading.current_thread().name, request_id.get()))
+        return ConfigVersion(version="stored", data={"path": path})
+
+    def get_configs(self, paths):
+        return {path: self.get_config(path) for path in paths}
+
+
+@pytest.mark.asyncio
+async def test_cache_hits_are_answered_inline():
+    cached = ConfigVersion(version="cached", data={})
+    storage = FakeStorage({"/config/prod/app": (3, cached)})
+    async_storage = AsyncStorage(storage, max_workers=1)
+
+    assert await async_storage.get_config("prod/app") is cached
+    assert await async_storage.get_configs(["prod/app"]) == {"prod/app": cached}
+    assert storage.reads == []
+
+
+@pytest.mark.asyncio
+async def test_misses_run_on_the_pool_in_the_callers_context():
+    storage = FakeStorage(
+        {"/config/prod/app": (3, ConfigVersion(version="c", data={}))}
+    )
+    async_storage = AsyncStorage(storage, max_workers=1)
+    request_id.set("req-1")
+
+    config = await async_storage.get_config("prod/other")
+    configs = await async_storage.get_configs(["prod/app", "prod/missing"])
+
+    assert config.version == "stored"
+    # One miss sends the whole batch to storage
+    assert set(configs) == {"prod/app", "prod/missing"}
+    assert [path for path, _, _ in storage.reads] == [
+        "prod/other",
+        "prod/app",
+        "prod/missing",
+    ]
+    for _, thread, context_value in storage.reads:
+        assert thread.startswith("storage")
+        assert context_value == "req-1"
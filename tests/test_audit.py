@@ -0,0 +1,41 @@
+from config_system.audit import AuditLogStore
+from config_system.models import AuditLog
+
+
+def test_writes_are_batched_and_readable(tmp_path):
+    store = AuditLogStore(str(tmp_path / "audit.db"), flush_interval=0.2)
+    futures = [
+        store.write(AuditLog(action="update", path=f"prod/app{i}", user="ci"))
+        for i in range(5)
+    ]
+    for future in futures:
+        future.result(timeout=5)
+
+    with store.reader() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM audit_log").fetchone()[0] == 5
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    store.close()
+
+
+def test_close_flushes_pending_writes(tmp_path):
+    store = AuditLogStore(str(tmp_path / "audit.db"), flush_interval=10)
+    future = store.write(AuditLog(action="update", path="prod/app", user="ci"))
+    store.close()
+
+    assert future.done()
+
+
+def test_query_pages_with_cursor(tmp_path):
+    store = AuditLogStore(str(tmp_path / "audit.db"))
+    for i in range(5):
+        store.write(AuditLog(action="update", path="prod/app", user=f"u{i}"))
+    store.write(AuditLog(action="update", path="prod/other", user="u9")).result()
+
+    first, cursor = store.query(path="prod/app", limit=3)
+    second, last_cursor = store.query(path="prod/app", limit=3, cursor=cursor)
+
+    assert [log.user for log in first + second] == ["u4", "u3", "u2", "u1", "u0"]
+    assert last_cursor is None
+    assert [log.user for log in store.iter(page_size=2)][0] == "u9"
+    store.close()
@@ -0,0 +1,43 @@
+from unittest import mock
+
+import jwt
+import pytest
+from fastapi import HTTPException
+
+from config_system.auth import AuthManager
+
+
+def test_verified_keys_skip_signature_check():
+    auth_manager = AuthManager(secret_key="test-secret-key")
+    api_key = auth_manager.create_api_key(roles=["read"])
+
+    with mock.patch("config_system.auth.jwt.decode", wraps=jwt.decode) as decode:
+        assert auth_manager.verify_api_key(api_key, ["read"])
+        assert auth_manager.verify_api_key(api_key, ["read"])
+        assert not auth_manager.verify_api_key(api_key, ["write"])
+
+    assert decode.call_count == 1
+
+
+def test_cached_key_still_expires():
+    auth_manager = AuthManager(secret_key="test-secret-key")
+    api_key = auth_manager.create_api_key(roles=["read"])
+    assert auth_manager.verify_api_key(api_key, ["read"])
+
+    with mock.patch("config_system.auth.time.time", return_value=2**40):
+        with pytest.raises(HTTPException):
+            auth_manager.verify_api_key(api_key, ["read"])
+
+
+def test_revoked_key_is_rejected_and_published():
+    auth_manager = AuthManager(secret_key="test-secret-key")
+    storage = mock.Mock()
+    storage.is_token_revoked.return_value = False
+    auth_manager.attach_storage(storage)
+    api_key = auth_manager.create_api_key(roles=["read"])
+    assert auth_manager.verify_api_key(api_key, ["read"])
+
+    auth_manager.revoke_api_key(api_key)
+
+    assert not auth_manager.verify_api_key(api_key, ["read"])
+    storage.revoke_token.assert_called_once()
@@ -0,0 +1,108 @@
+from config_system.backup import BackupManager
+
+
+class InMemoryStorage:
+    def __init__(self, data=None):
+        self.data = dict(data or {})
+        self.batches = []
+        self.snapshot = {}
+
+    def current_revision(self):
+        return 42
+
+    def iter_all(self, page_size=1000, revision=None, min_mod_revision=None):
+        for key, value in sorted(self.data.items()):
+            if min_mod_revision is None or self.snapshot.get(key) != value:
+                yield key, value
+        self.snapshot = dict(self.data)
+
+    def iter_keys(self, page_size=1000, revision=None):
+        yield from sorted(self.data)
+
+    def restore_batch(self, items):
+        self.batches.append(len(items))
+        for key, value in items:
+            if value is None:
+                self.data.pop(key, None)
+            else:
+                self.data[key] = value
+
+
+def test_backup_round_trip_in_bounded_batches(tmp_path):
+    source = InMemoryStorage({f"/config/prod/app{i}": f"v{i}" for i in range(10)})
+    backup_manager = BackupManager(str(tmp_path), batch_size=4)
+
+    backup_file = backup_manager.create_backup(source)
+    assert backup_file.name.endswith(".ndjson.gz")
+    assert backup_manager.read_header(backup_file) == {"revision": 42}
+
+    target = InMemoryStorage()
+    assert backup_manager.restore_backup(target, backup_file)
+    assert target.data == source.data
+    assert target.batches == [4, 4, 2]
+
+
+def test_incremental_backup_replays_changes_and_deletions(tmp_path):
+    storage = InMemoryStorage({"/config/a": "1", "/config/b": "1", "/config/c": "1"})
+    backup_manager = BackupManager(str(tmp_path))
+    full = backup_manager.create_incremental_backup(storage)
+
+    storage.data["/config/b"] = "2"
+    storage.data["/config/d"] = "1"
+    del storage.data["/config/c"]
+    delta = backup_manager.create_incremental_backup(storage)
+
+    assert backup_manager.read_header(delta)["base"] == full.name
+    assert dict(backup_manager.read_backup(delta)) == {
+        "/config/b": "2",
+        "/config/d": "1",
+        "/config/c": None,
+    }
+
+    target = InMemoryStorage()
+    assert backup_manager.restore_backup(target, delta)
+    assert target.data == storage.data
+
+
+def test_parallel_restore_resumes_from_checkpoint(tmp_path):
+    source = InMemoryStorage({f"/config/prod/app{i}": f"v{i}" for i in range(20)})
+    backup_manager = BackupManager(str(tmp_path), batch_size=3)
+    backup_file = backup_manager.create_backup(source)
+
+    class FlakyStorage(InMemoryStorage):
+        def restore_batch(self, items):
+            if len(self.batches) == 2:
+                raise ConnectionError("etcd unavailable")
+            super().restore_batch(items)
+
+    target = FlakyStorage()
+    assert not backup_manager.parallel_restore(target, backup_file, workers=1)
+    assert len(target.batches) == 2
+
+    target.__class__ = InMemoryStorage
+    assert backup_manager.parallel_restore(target, backup_file, workers=4)
+    assert target.data == source.data
+    assert len(target.batches) == 7
+
+
+def test_parallel_restore_refuses_checkpoint_of_another_batch_size(tmp_path):
+    source = InMemoryStorage({f"/config/prod/app{i}": f"v{i}" for i in range(6)})
+    backup_file = BackupManager(str(tmp_path), batch_size=3).create_backup(source)
+
+    class FailingStorage(InMemoryStorage):
+        def restore_batch(self, items):
+            if self.batches:
+                raise ConnectionError("etcd unavailable")
+            super().restore_batch(items)
+
+    target = FailingStorage()
+    manager = BackupManager(str(tmp_path), batch_size=3)
+    assert not manager.parallel_restore(target, backup_file, workers=1)
+
+    target.__class__ = InMemoryStorage
+    assert not BackupManager(str(tmp_path), batch_size=2).parallel_restore(
+        target, backup_file
+    )
+    assert target.batches == [3]
+    assert manager.parallel_restore(target, backup_file)
+    assert target.data == source.data
@@ -0,0 +1,167 @@
+from types import SimpleNamespace
+
+from etcd3.events import DeleteEvent, PutEvent
+
+from config_system.cache import LRUCache, WatchedCache, WatchedKeySet
+
+
+class FakeEtcd:
+    def __init__(self):
+        self.callbacks = {}
+
+    def add_watch_prefix_callback(self, prefix, callback):
+        watch_id = len(self.callbacks) + 1
+        self.callbacks[watch_id] = callback
+        return watch_id
+
+    def cancel_watch(self, watch_id):
+        self.callbacks.pop(watch_id, None)
+
+    def emit(self, *events):
+        for callback in list(self.callbacks.values()):
+            callback(SimpleNamespace(events=list(events)))
+
+
+def _event(cls, key, value, revision):
+    return cls(
+        SimpleNamespace(
+            kv=SimpleNamespace(
+                key=key.encode(), value=value.encode(), mod_revision=revision
+            )
+        )
+    )
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert len(cache) == 2
+
+
+def test_watched_cache_serves_from_memory_and_follows_watch():
+    etcd = FakeEtcd()
+    cache = WatchedCache(etcd, "/config/", lambda raw: raw.decode())
+    loads = []
+
+    def loader(key):
+        loads.append(key)
+        return "v1", 1
+
+    assert cache.get("/config/a", loader) == "v1"
+    assert cache.get("/config/a", loader) == "v1"
+    assert loads == ["/config/a"]
+
+    etcd.emit(_event(PutEvent, "/config/a", "v2", 2))
+    assert cache.get("/config/a", loader) == "v2"
+
+    etcd.emit(_event(DeleteEvent, "/config/a", "", 3))
+    assert cache.get("/config/a", loader) is None
+    assert loads == ["/config/a"]
+
+
+def test_watched_cache_ignores_stale_reads():
+    etcd = FakeEtcd()
+    cache = WatchedCache(etcd, "/config/", lambda raw: raw.decode())
+    cache.start()
+
+    etcd.emit(_event(PutEvent, "/config/a", "new", 5))
+    cache.set("/config/a", 4, "old")
+
+    assert cache.get("/config/a", lambda key: ("direct", 6)) == "new"
+
+
+def test_watched_cache_falls_back_to_direct_reads_when_watch_drops():
+    etcd = FakeEtcd()
+    cache = WatchedCache(etcd, "/config/", lambda raw: raw.decode(), retry_interval=60)
+    cache.get("/config/a", lambda key: ("v1", 1))
+
+    for callback in list(etcd.callbacks.values()):
+        callback(ConnectionError("stream reset"))
+
+    assert not cache.watching
+    assert len(cache) == 0
+    assert cache.get("/config/a", lambda key: ("v2", 2)) == "v2"
+    assert cache.get("/config/a", lambda key: ("v3", 3)) == "v3"
+
+
+def test_watched_cache_drops_reads_that_raced_a_watch_restart():
+    etcd = FakeEtcd()
+    cache = WatchedCache(etcd, "/config/", lambda raw: raw.decode(), retry_interval=0)
+    cache.start()
+
+    def slow_loader(key):
+        # The watch drops and restarts while this read is in flight; the
+        # write at revision 6 happened in between and no event reports it
+        for callback in list(etcd.callbacks.values()):
+            callback(ConnectionError("stream reset"))
+        cache.start()
+        return "v1", 5
+
+    assert cache.get("/config/a", slow_loader) == "v1"
+    assert cache.peek("/config/a") is None
+    assert cache.get("/config/a", lambda key: ("v2", 6)) == "v2"
+
+
+def test_watched_cache_drops_reads_that_raced_an_evicted_event():
+    etcd = FakeEtcd()
+    cache = WatchedCache(etcd, "/config/", lambda raw: raw.decode(), maxsize=1)
+    cache.start()
+
+    def slow_loader(key):
+        etcd.emit(_event(PutEvent, "/config/a", "v2", 6))
+        # Evicts the fresh entry again
+        cache.set("/config/b", 7, "other")
+        return "v1", 5
+
+    assert cache.get("/config/a", slow_loader) == "v1"
+    assert cache.peek("/config/a") is None
+
+
+def test_watched_key_set_loads_prefix_and_follows_watch():
+    etcd = FakeEtcd()
+    keys = WatchedKeySet(etcd, "/revoked/", lambda: (["/revoked/a"], 3))
+
+    assert keys.sync()
+    assert "/revoked/a" in keys
+    etcd.emit(_event(PutEvent, "/revoked/b", "", 4))
+    etcd.emit(_event(DeleteEvent, "/revoked/a", "", 5))
+    assert "/revoked/b" in keys
+    assert "/revoked/a" not in keys
+
+
+def test_watched_key_set_prefers_events_newer_than_the_load():
+    etcd = FakeEtcd()
+
+    def loader():
+        # Both events land while the (older) load is in flight
+        etcd.emit(_event(DeleteEvent, "/revoked/a", "", 4))
+        etcd.emit(_event(PutEvent, "/revoked/b", "", 5))
+        return ["/revoked/a"], 3
+
+    keys = WatchedKeySet(etcd, "/revoked/", loader)
+
+    assert keys.sync()
+    assert "/revoked/a" not in keys
+    assert "/revoked/b" in keys
+
+
+def test_watched_key_set_keeps_keys_while_watch_is_down():
+    etcd = FakeEtcd()
+    keys = WatchedKeySet(etcd, "/revoked/", lambda: (["/revoked/a"], 3))
+    keys.sync()
+
+    for callback in list(etcd.callbacks.values()):
+        callback(ConnectionError("stream reset"))
+
+    assert not keys.watching
+    assert "/revoked/a" in keys
+    keys.loader = lambda: (["/revoked/b"], 9)
+    assert keys.sync()
+    assert "/revoked/a" not in keys
+    assert "/revoked/b" in keys
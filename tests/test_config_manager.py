@@ -0,0 +1,75 @@
+from config_system.config_manager import ConfigManager
+
+
+class FakeStorage:
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.data = {}
+        self.transactions = []
+        self.audit_logs = []
+
+    def commit_versions(self, items):
+        if any(path == self.fail_on for path, _ in items):
+            raise RuntimeError("etcd unavailable")
+        self.transactions.append(len(items))
+        for path, version in items:
+            self.data[path] = version.data
+        return len(self.transactions)
+
+    def enqueue_audit_log(self, log):
+        self.audit_logs.append(log)
+
+
+def test_import_writes_batches_with_one_audit_entry_each():
+    storage = FakeStorage()
+    schema = {"type": "object", "required": ["port"]}
+    config_manager = ConfigManager(storage, None, default_schema=schema)
+
+    entries = ((f"app{i}", {"port": i}) for i in range(10))
+    result = config_manager.import_configs(
+        list(entries) + [("broken", {})], "alice", "staging", batch_size=4
+    )
+
+    assert result["imported"] == 10
+    assert list(result["failed"]) == ["broken"]
+    assert sorted(storage.transactions) == [2, 4, 4]
+    assert storage.data["staging/app3"] == {"port": 3}
+    assert len(storage.audit_logs) == 3
+    assert {log.action for log in storage.audit_logs} == {"import"}
+    assert sum(log.details["count"] for log in storage.audit_logs) == 10
+
+
+def test_import_reports_failed_transactions():
+    storage = FakeStorage(fail_on="prod/app1")
+    config_manager = ConfigManager(storage, None)
+
+    result = config_manager.import_configs(
+        [(f"app{i}", {}) for i in range(4)], "alice", batch_size=2
+    )
+
+    assert result["imported"] == 2
+    assert result["failed"] == {
+        "app0": "etcd unavailable",
+        "app1": "etcd unavailable",
+    }
+
+
+def test_import_validates_merged_documents_on_processes():
+    storage = FakeStorage()
+    storage.get_config = lambda path: None
+    schema = {"type": "object", "required": ["port"]}
+    config_manager = ConfigManager(
+        storage, None, default_schema=schema, environments={"prod": "base"}
+    )
+
+    result = config_manager.import_configs(
+        [("app", {"port": 1}), ("broken", {}), ("list", [])],
+        "alice",
+        processes=2,
+    )
+
+    assert result["imported"] == 1
+    assert result["failed"] == {
+        "broken": ["<root>: 'port' is a required property"],
+        "list": ["config must be an object"],
+    }
@@ -0,0 +1,55 @@
+import pytest
+
+from config_system.diff import apply_patch, diff
+from config_system.storage import _rebuild
+
+OLD = {"db": {"host": "a", "port": 5432}, "hosts": ["x", "y"], "a/b": 1, "gone": True}
+NEW = {"db": {"host": "b", "port": 5432}, "hosts": ["x", "z"], "a/b": 2, "tags": []}
+
+
+def test_patch_round_trip():
+    patch = diff(OLD, NEW)
+
+    assert {"op": "replace", "path": "/db/host", "value": "b"} in patch
+    assert {"op": "replace", "path": "/a~1b", "value": 2} in patch
+    assert {"op": "remove", "path": "/gone"} in patch
+    assert apply_patch(OLD, patch) == NEW
+    assert OLD["db"]["host"] == "a"
+
+
+def test_lists_of_different_length_are_replaced():
+    assert diff({"l": [1]}, {"l": [1, 2]}) == [
+        {"op": "replace", "path": "/l", "value": [1, 2]}
+    ]
+
+
+@pytest.mark.parametrize(
+    "old, new", [(1, True), (True, 1), (0, False), (1, 1.0), (2.0, 2), ([1], [True])]
+)
+def test_type_changes_are_not_equal(old, new):
+    patch = diff({"a": old}, {"a": new})
+
+    assert patch != []
+    patched = apply_patch({"a": old}, patch)["a"]
+    assert patched == new
+    assert type(patched) is type(new)
+    if isinstance(new, list):
+        assert type(patched[0]) is type(new[0])
+
+
+def test_unknown_operations_are_rejected():
+    with pytest.raises(ValueError):
+        apply_patch({}, [{"op": "move", "path": "/a", "from": "/b"}])
+
+
+def test_versions_are_rebuilt_from_their_snapshot():
+    third = {"db": {"host": "c", "port": 5432}, "hosts": ["x"], "a/b": 2}
+    records = {
+        "v1": {"version": "v1", "data": OLD},
+        "v2": {"version": "v2", "base": "v1", "patch": diff(OLD, NEW)},
+        "v3": {"version": "v3", "base": "v2", "patch": diff(NEW, third)},
+    }
+
+    assert _rebuild(records, "v3").data == third
+    assert _rebuild(records, "v2").data == NEW
+    assert _rebuild(records, "v1").data == OLD
@@ -0,0 +1,60 @@
+import pytest
+
+from config_system.encryption import (
+    ENCRYPTED_PREFIX,
+    EncryptionManager,
+    FieldEncryptor,
+)
+from config_system.models import ConfigVersion
+
+DATA = {
+    "host": "db",
+    "password": "hunter2",
+    "replicas": [{"password": "a"}, {"password": 42}],
+}
+
+
+def _encryptor():
+    return FieldEncryptor(
+        EncryptionManager(), {"db*": ["/password", "/replicas/*/password"]}
+    )
+
+
+def test_secret_fields_round_trip():
+    encryptor = _encryptor()
+    data, data_key = encryptor.encrypt("prod/db", DATA)
+
+    assert data["host"] == "db"
+    assert data["password"].startswith(ENCRYPTED_PREFIX)
+    assert data["replicas"][1]["password"].startswith(ENCRYPTED_PREFIX)
+    assert DATA["password"] == "hunter2"
+
+    stored = ConfigVersion(version="v1", data=data, data_key=data_key)
+    plain = encryptor.decrypt("prod/db", stored)
+    assert plain.data == DATA
+    assert encryptor.decrypt("prod/db", stored) is plain
+
+
+def test_unchanged_secrets_keep_their_ciphertext():
+    encryptor = _encryptor()
+    data, data_key = encryptor.encrypt("prod/db", DATA)
+    previous = ConfigVersion(version="v1", data=data, data_key=data_key)
+
+    changed = dict(DATA, password="changed")
+    new_data, new_key = encryptor.encrypt("prod/db", changed, previous)
+
+    assert new_key == data_key
+    assert new_data["replicas"] == data["replicas"]
+    assert new_data["password"] != data["password"]
+
+
+def test_paths_without_secret_fields_are_untouched():
+    assert _encryptor().encrypt("prod/app", DATA) == (DATA, None)
+
+
+def test_wrong_master_key_fails_loudly():
+    data, data_key = _encryptor().encrypt("prod/db", DATA)
+    with pytest.raises(ValueError):
+        _encryptor().decrypt(
+            "prod/db", ConfigVersion(version="v1", data=data, data_key=data_key)
+        )
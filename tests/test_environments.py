@@ -0,0 +1,74 @@
+import pytest
+
+from config_system.config_manager import ConfigManager
+from config_system.environments import EnvironmentLayers, deep_merge
+from config_system.models import ConfigVersion
+from config_system.validation import SchemaValidationError
+
+
+def test_deep_merge_merges_objects_and_replaces_everything_else():
+    base = {"db": {"host": "a", "port": 1}, "hosts": ["x"], "debug": True}
+    override = {"db": {"host": "b"}, "hosts": ["y"]}
+
+    assert deep_merge(base, override) == {
+        "db": {"host": "b", "port": 1},
+        "hosts": ["y"],
+        "debug": True,
+    }
+
+
+def test_inheritance_cycles_are_rejected():
+    with pytest.raises(ValueError):
+        EnvironmentLayers({"a": "b", "b": "a"})
+
+
+class FakeStorage:
+    def __init__(self, configs):
+        self.configs = {
+            path: ConfigVersion(version=f"v-{path}", data=data)
+            for path, data in configs.items()
+        }
+
+    def get_config(self, path):
+        return self.configs.get(path)
+
+    def get_configs(self, paths):
+        return {path: self.configs.get(path) for path in paths}
+
+
+def test_layers_are_merged_once_until_a_layer_changes():
+    storage = FakeStorage(
+        {
+            "base/app": {"db": {"host": "base", "port": 5432}, "replicas": 1},
+            "prod/app": {"replicas": 3},
+            "prod-eu/app": {"db": {"host": "eu"}},
+        }
+    )
+    config_manager = ConfigManager(
+        storage, None, environments={"prod": "base", "prod-eu": "prod"}
+    )
+
+    first = config_manager.get_stored_config("app", "prod-eu")
+    assert first.data == {"db": {"host": "eu", "port": 5432}, "replicas": 3}
+    assert config_manager.get_stored_config("app", "prod-eu") is first
+
+    storage.configs["prod/app"] = ConfigVersion(version="v2", data={"replicas": 5})
+    second = config_manager.get_stored_config("app", "prod-eu")
+    assert second.data["replicas"] == 5
+    assert second.version != first.version
+    assert config_manager.get_configs(["app", "missing"], "prod-eu") == {
+        "app": second.data,
+        "missing": None,
+    }
+
+
+def test_overrides_are_validated_on_top_of_their_parent():
+    storage = FakeStorage({"base/app": {"port": 80}})
+    schema = {"type": "object", "required": ["port", "host"]}
+    config_manager = ConfigManager(
+        storage, None, default_schema=schema, environments={"prod": "base"}
+    )
+
+    assert config_manager._validation_errors("app", {"host": "a"}, "prod", None) == []
+    with pytest.raises(SchemaValidationError):
+        config_manager.update_config("app", {}, "alice", "prod")
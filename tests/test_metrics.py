@@ -0,0 +1,45 @@
+from config_system.metrics import (
+    PathBucketer,
+    latest,
+    mark_process_dead,
+    track_connection,
+)
+
+
+def test_paths_are_bucketed_by_prefix_then_depth():
+    bucketer = PathBucketer(["payments", "payments/eu"], depth=1)
+
+    assert bucketer.bucket("payments/eu/stripe") == "payments/eu"
+    assert bucketer.bucket("payments/us") == "payments"
+    assert bucketer.bucket("search/index/shards") == "search/*"
+    assert bucketer.bucket("flags") == "flags"
+    assert PathBucketer(depth=0).bucket("a/b") == "*"
+
+
+def test_bucket_count_is_bounded():
+    bucketer = PathBucketer(depth=1, max_buckets=3)
+    labels = {bucketer.bucket(f"service{i}/config") for i in range(1000)}
+
+    assert labels == {"service0/*", "service1/*", "service2/*", "other"}
+    assert bucketer.bucket("service1/other") == "service1/*"
+
+
+def test_latest_exposes_connection_gauge(monkeypatch):
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    track_connection(True)
+    try:
+        content, content_type = latest()
+    finally:
+        track_connection(False)
+
+    assert content_type.startswith("text/plain")
+    assert b"active_connections 1.0" in content
+
+
+def test_latest_aggregates_multiprocess_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    content, _ = latest()
+
+    # Only what workers wrote to the directory, not this process' registry
+    assert b"active_connections" not in content
+    mark_process_dead(12345)
@@ -0,0 +1,137 @@
+import json
+from datetime import datetime, timedelta
+
+from config_system.diff import diff
+from config_system.models import VERSION_FORMAT, RetentionConfig
+from config_system.retention import VersionCompactor, versions_to_keep
+from config_system.storage import StorageError
+
+NOW = datetime(2024, 6, 30, 12, 0)
+
+
+def _versions(*ages):
+    return sorted((NOW - age).strftime(VERSION_FORMAT) for age in ages)
+
+
+def test_policy_keeps_recent_and_thins_old_versions_per_day():
+    recent = _versions(timedelta(hours=1), timedelta(days=2))
+    old = _versions(
+        timedelta(days=40, hours=1), timedelta(days=40, hours=2), timedelta(days=41)
+    )
+    policy = RetentionConfig(keep_last=1, keep_days=30)
+
+    keep = versions_to_keep(old + recent, policy, NOW)
+
+    assert keep == set(recent) | {old[0], old[2]}
+    assert versions_to_keep(
+        old + recent, RetentionConfig(keep_last=1, keep_days=30, thin_daily=False), NOW
+    ) == set(recent)
+    assert versions_to_keep(
+        old, RetentionConfig(keep_last=2, thin_daily=False), NOW
+    ) == set(old[1:])
+
+
+class FakeStorage:
+    def __init__(self, history):
+        self.history = history
+        self.audit_logs = []
+        self.compacted = None
+        self.revision = 7
+
+    def current_revision(self):
+        return self.revision
+
+    def iter_history_keys(self):
+        for path in sorted(self.history):
+            for version in self.history[path]:
+                yield path, version
+
+    def prune_versions(self, path, versions):
+        pruned = [v for v in self.history[path] if v in versions]
+        self.history[path] = [v for v in self.history[path] if v not in versions]
+        return pruned
+
+    def enqueue_audit_log(self, log):
+        self.audit_logs.append(log)
+
+    def compact(self, revision):
+        self.compacted = revision
+
+    def iter_all(self, page_size=1000, revision=None):
+        if self.compacted is not None and revision < self.compacted:
+            raise StorageError("required revision has been compacted")
+        return iter([])
+
+
+def test_compactor_prunes_audits_and_compacts():
+    old = _versions(*(timedelta(days=100 + i) for i in range(3)))
+    storage = FakeStorage({"prod/a": list(old), "prod/b": old[-1:]})
+    compactor = VersionCompactor(
+        storage, RetentionConfig(keep_last=1, thin_daily=False, compact_lag=2)
+    )
+
+    assert compactor.run_once(dry_run=True) == {"prod/a": old[:2]}
+    assert storage.history["prod/a"] == old
+
+    assert compactor.run_once() == {"prod/a": old[:2]}
+    assert storage.history == {"prod/a": old[-1:], "prod/b": old[-1:]}
+    assert [log.details["versions"] for log in storage.audit_logs] == [old[:2]]
+    assert storage.compacted == 5
+
+
+def test_compaction_lags_behind_pinned_scans():
+    old = _versions(*(timedelta(days=100 + i) for i in range(3)))
+    storage = FakeStorage({"prod/a": list(old)})
+    compactor = VersionCompactor(
+        storage, RetentionConfig(keep_last=1, thin_daily=False, compact_lag=100)
+    )
+    # A backup pinned to the revision it started at, still paging
+    pinned = storage.current_revision()
+    storage.revision = pinned + 50
+
+    compactor.run_once()
+    assert storage.compacted is None
+    list(storage.iter_all(revision=pinned))
+
+    storage.history["prod/a"] = list(old)
+    storage.revision = pinned + 150
+    compactor.run_once()
+    assert storage.compacted == pinned + 50
+    list(storage.iter_all(revision=pinned + 50))
+
+    # Not compacted again at or below what is already compacted
+    storage.history["prod/a"] = list(old)
+    storage.compacted = None
+    compactor.run_once()
+    assert storage.compacted is None
+
+
+def test_versions_committed_after_listing_survive_pruning(dict_storage):
+    v1, v2, v3 = _versions(*(timedelta(days=100 + i) for i in (2, 1, 0)))
+    prefix = "/versions/prod/app/"
+    keys = {
+        prefix + v1: json.dumps({"version": v1, "data": {"n": 1}}),
+        prefix
+        + v2: json.dumps(
+            {"version": v2, "base": v1, "snapshot": v1, "depth": 1}
+            | {"patch": diff({"n": 1}, {"n": 2})}
+        ),
+    }
+    storage = dict_storage(keys)
+    storage.enqueue_audit_log = lambda log: None
+    listed = list(storage.iter_history_keys())
+
+    # A write lands between the compactor's listing and its prune
+    keys[prefix + v3] = json.dumps(
+        {"version": v3, "base": v2, "snapshot": v1, "depth": 2}
+        | {"patch": diff({"n": 2}, {"n": 3})}
+    )
+    storage.iter_history_keys = lambda: iter(listed)
+    compactor = VersionCompactor(
+        storage, RetentionConfig(keep_last=1, thin_daily=False, compact_etcd=False)
+    )
+
+    assert compactor.run_once() == {"prod/app": [v1]}
+    assert sorted(keys) == [prefix + v2, prefix + v3]
+    assert json.loads(keys[prefix + v2])["data"] == {"n": 2}
+    assert storage.get_version("prod/app", v3).data == {"n": 3}
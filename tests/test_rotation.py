@@ -0,0 +1,84 @@
+import json
+
+from cryptography.fernet import Fernet
+
+from config_system.encryption import EncryptionManager, FieldEncryptor
+from config_system.models import ConfigVersion
+from config_system.rotation import CHECKPOINT, KeyRotator
+
+
+class FakeStorage:
+    def __init__(self, data):
+        self.data = {key: (value, 1) for key, value in data.items()}
+        self.checkpoints = {}
+        self.transactions = 0
+
+    def iter_pages(self, prefix, start_after=None, page_size=100):
+        keys = sorted(
+            key
+            for key in self.data
+            if key.startswith(prefix) and (start_after is None or key > start_after)
+        )
+        for start in range(0, len(keys), page_size):
+            yield [
+                (key, self.data[key][0].encode(), self.data[key][1])
+                for key in keys[start : start + page_size]
+            ]
+
+    def compare_and_put(self, items):
+        self.transactions += 1
+        if any(self.data[key][1] != revision for key, _, revision in items):
+            return False
+        for key, value, revision in items:
+            self.data[key] = (value, revision + 1)
+        return True
+
+    def get_checkpoint(self, name):
+        return self.checkpoints.get(name)
+
+    def put_checkpoint(self, name, checkpoint):
+        self.checkpoints[name] = json.loads(json.dumps(checkpoint))
+
+
+def test_wrapped_keys_carry_their_key_id():
+    old = EncryptionManager()
+    wrapped = old.wrap_key(b"data-key")
+    assert wrapped.startswith(old.key_id + ":")
+
+    new = EncryptionManager(Fernet.generate_key(), [old.key])
+    assert new.needs_rewrap(wrapped)
+    assert new.unwrap_key(new.rewrap(wrapped)) == b"data-key"
+
+
+def test_rotation_rewraps_everything_and_resumes():
+    old = EncryptionManager()
+    encryptor = FieldEncryptor(old, {"*": ["/password"]})
+    values = {}
+    for i in range(5):
+        data, data_key = encryptor.encrypt(f"prod/app{i}", {"password": str(i)})
+        version = ConfigVersion(version="v1", data=data, data_key=data_key)
+        values[f"/config/prod/app{i}"] = version.json()
+        values[f"/versions/prod/app{i}/v1"] = version.json()
+    values["/config/prod/plain"] = ConfigVersion(version="v1", data={}).json()
+    storage = FakeStorage(values)
+
+    new = EncryptionManager(Fernet.generate_key(), [old.key])
+    rotator = KeyRotator(storage, new, batch_size=2, pause=0)
+    storage.checkpoints[CHECKPOINT] = {
+        "key_id": new.key_id,
+        "done": [],
+        "prefix": "/config/",
+        "after": "/config/prod/app1",
+    }
+
+    assert rotator.run() == 8
+    assert storage.checkpoints[CHECKPOINT]["complete"]
+    assert rotator.run() == 0
+
+    storage.checkpoints.clear()
+    assert rotator.run() == 2
+
+    rotated = FieldEncryptor(EncryptionManager(new.key), {"*": ["/password"]})
+    for i in range(5):
+        stored = ConfigVersion.parse_raw(storage.data[f"/config/prod/app{i}"][0])
+        assert rotated.decrypt(f"prod/app{i}", stored).data == {"password": str(i)}
@@ -0,0 +1,64 @@
+import pytest
+
+from config_system.schemas import SchemaRegistry
+from config_system.validation import InvalidSchemaError
+
+
+class FakeWatchHub:
+    def __init__(self):
+        self.callbacks = {}
+
+    def add_watch_prefix_callback(self, prefix, callback):
+        self.callbacks[len(self.callbacks) + 1] = callback
+        return len(self.callbacks)
+
+    def cancel_watch(self, watch_id):
+        self.callbacks.pop(watch_id, None)
+
+
+class FakeStorage:
+    def __init__(self):
+        self.watch_hub = FakeWatchHub()
+        self.schemas = {}
+        self.loads = 0
+
+    def put_schema(self, name, entry):
+        self.schemas[name] = entry
+
+    def delete_schema(self, name):
+        self.schemas.pop(name, None)
+
+    def get_schemas(self):
+        self.loads += 1
+        return dict(self.schemas)
+
+
+def test_most_specific_pattern_wins_and_is_cached():
+    storage = FakeStorage()
+    registry = SchemaRegistry(storage)
+    registry.register("any", "*", {"type": "object"})
+    registry.register("payments", "payments/*", {"required": ["currency"]})
+
+    validator = registry.validator_for("payments/eu")
+    assert validator.schema == {"required": ["currency"]}
+    assert registry.validator_for("payments/eu") is validator
+    assert registry.validator_for("search").schema == {"type": "object"}
+    assert storage.loads == 1
+
+
+def test_watch_events_invalidate_compiled_schemas():
+    storage = FakeStorage()
+    registry = SchemaRegistry(storage)
+    assert registry.validator_for("payments/eu") is None
+
+    storage.schemas["payments"] = {"pattern": "payments/*", "schema": {}}
+    for callback in storage.watch_hub.callbacks.values():
+        callback(object())
+
+    assert registry.validator_for("payments/eu") is not None
+
+
+def test_invalid_schemas_are_rejected():
+    registry = SchemaRegistry(FakeStorage())
+    with pytest.raises(InvalidSchemaError):
+        registry.register("bad", "*", {"type": "not-a-type"})
@@ -1,4 +1,265 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from config_system.cache import LRUCache, WatchedCache
+from config_system.config_manager import ConfigManager
+from config_system.diff import diff
+from config_system.models import ConfigVersion
+from config_system.storage import ConfigConflictError, Storage, _record_metadata
+
+
 def test_get_config():
     assert True
+
+
 def test_put_config():
     assert True
+
+
+def test_version_page_is_newest_first_and_lazy(dict_storage):
+    data = [{"n": i} for i in range(5)]
+    records = [{"version": "2024-01-01T00:00:00.000000", "data": data[0]}]
+    for i in range(1, 5):
+        records.append(
+            {
+                "version": f"2024-01-0{i + 1}T00:00:00.000000",
+                "base": records[-1]["version"],
+                "snapshot": records[0]["version"],
+                "patch": diff(data[i - 1], data[i]),
+            }
+        )
+    keys = {f"/versions/prod/app/{r['version']}": json.dumps(r) for r in records}
+    keys["/versions/prod/app/nested/2024-01-01T00:00:00.000000"] = json.dumps(
+        records[0]
+    )
+    storage = dict_storage(keys)
+
+    page, cursor = storage.get_version_page("prod/app", limit=2)
+    assert [entry["version"] for entry in page] == [
+        "2024-01-05T00:00:00.000000",
+        "2024-01-04T00:00:00.000000",
+    ]
+    assert "data" not in page[0]
+
+    page, cursor = storage.get_version_page(
+        "prod/app", limit=2, cursor=cursor, include_data=True
+    )
+    assert [entry["data"] for entry in page] == [{"n": 2}, {"n": 1}]
+
+    page, cursor = storage.get_version_page("prod/app", limit=2, cursor=cursor)
+    assert [entry["version"] for entry in page] == ["2024-01-01T00:00:00.000000"]
+    assert cursor is None
+
+
+class FakeEtcd:
+    """Keys with mod revisions and compare-guarded transactions."""
+
+    def __init__(self):
+        self.keys = {}
+        self.revision = 1
+        self.transactions = self
+        self.kvstub = SimpleNamespace(Txn=self.txn)
+        self.timeout = self.call_credentials = self.metadata = None
+        self.callbacks = {}
+        self.txns = 0
+
+    def add_watch_prefix_callback(self, prefix, callback):
+        self.callbacks[len(self.callbacks) + 1] = callback
+        return len(self.callbacks)
+
+    def cancel_watch(self, watch_id):
+        self.callbacks.pop(watch_id, None)
+
+    def mod_revision(self, key):
+        return self.keys[key][1] if key in self.keys else 0
+
+    def mod(self, key):
+        etcd = self
+
+        class Mod:
+            def __eq__(self, revision):
+                return lambda: etcd.mod_revision(key) == revision
+
+        return Mod()
+
+    def put(self, key, value):
+        return key, value
+
+    def write(self, key, value):
+        self.revision += 1
+        self.keys[key] = (value, self.revision)
+
+    def get(self, key):
+        return (self.keys[key][0].encode() if key in self.keys else None), None
+
+    def get_response(self, key):
+        kvs = []
+        if key in self.keys:
+            value, mod_revision = self.keys[key]
+            kvs.append(SimpleNamespace(value=value.encode(), mod_revision=mod_revision))
+        return SimpleNamespace(
+            count=len(kvs), kvs=kvs, header=SimpleNamespace(revision=self.revision)
+        )
+
+    def txn(self, request, timeout, credentials=None, metadata=None):
+        self.txns += 1
+        return SimpleNamespace(
+            header=SimpleNamespace(revision=self.revision),
+            responses=[
+                SimpleNamespace(
+                    response_range=self.get_response(op.request_range.key.decode())
+                )
+                for op in request.success
+            ],
+        )
+
+    def transaction(self, compare, success, failure):
+        if not all(check() for check in compare):
+            return False, []
+        self.revision += 1
+        for key, value in success:
+            self.keys[key] = (value, self.revision)
+        header = SimpleNamespace(revision=self.revision)
+        return True, [SimpleNamespace(response_put=SimpleNamespace(header=header))]
+
+
+class FakeCache:
+    generation = 0
+
+    def __init__(self):
+        self.entries = {}
+
+    def peek(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, revision, value, generation=None):
+        self.entries[key] = (revision, value)
+
+
+def _commit_storage(snapshot_interval=16):
+    storage = Storage.__new__(Storage)
+    storage.etcd = FakeEtcd()
+    storage.cache = FakeCache()
+    storage._history_heads = LRUCache(16)
+    storage.snapshot_interval = snapshot_interval
+    return storage
+
+
+def _version(name, data):
+    return ConfigVersion(version=f"2024-01-01T00:00:0{name}.000000", data=data)
+
+
+def test_commit_retries_once_when_the_cache_lags_behind():
+    storage = _commit_storage()
+    storage.commit_version("prod/app", _version(1, {"n": 1}))
+    # Another worker's write this cache has not seen yet
+    storage.etcd.write("/config/prod/app", _version(2, {"n": 2}).json())
+
+    revision = storage.commit_version("prod/app", _version(3, {"n": 3}))
+
+    value, mod_revision = storage.etcd.keys["/config/prod/app"]
+    assert json.loads(value)["data"] == {"n": 3}
+    assert mod_revision == revision
+    assert storage.cache.peek("/config/prod/app")[0] == revision
+
+
+def test_commit_with_stale_explicit_revision_conflicts():
+    storage = _commit_storage()
+    revision = storage.commit_version("prod/app", _version(1, {"n": 1}))
+    storage.commit_version("prod/app", _version(2, {"n": 2}))
+
+    with pytest.raises(ConfigConflictError):
+        storage.commit_version("prod/app", _version(3, {"n": 3}), revision)
+
+    assert json.loads(storage.etcd.keys["/config/prod/app"][0])["data"] == {"n": 2}
+    assert "/versions/prod/app/" + _version(3, {}).version not in storage.etcd.keys
+
+
+def _history(storage, name):
+    return json.loads(
+        storage.etcd.keys["/versions/prod/app/" + _version(name, {}).version][0]
+    )
+
+
+def test_history_is_patched_until_the_snapshot_interval():
+    storage = _commit_storage(snapshot_interval=3)
+    document = {"padding": "x" * 100}
+    for n in range(1, 6):
+        storage.commit_version("prod/app", _version(n, dict(document, n=n)))
+
+    assert "patch" not in _history(storage, 1)
+    second, third = _history(storage, 2), _history(storage, 3)
+    assert second["patch"] == [{"op": "replace", "path": "/n", "value": 2}]
+    assert (second["base"], second["snapshot"], second["depth"]) == (
+        _version(1, {}).version,
+        _version(1, {}).version,
+        1,
+    )
+    assert third["depth"] == 2
+    # depth 3 would reach the interval, so a new snapshot starts the next chain
+    assert "patch" not in _history(storage, 4)
+    assert _history(storage, 5)["snapshot"] == _version(4, {}).version
+
+
+def test_history_stores_a_snapshot_when_the_patch_is_not_smaller():
+    storage = _commit_storage()
+    storage.commit_version("prod/app", _version(1, {"a": 1}))
+    storage.commit_version("prod/app", _version(2, {"b": 2}))
+
+    assert _history(storage, 2)["data"] == {"b": 2}
+    assert "patch" not in _history(storage, 2)
+
+
+def test_version_listings_stop_decoding_at_the_payload():
+    storage = _commit_storage()
+    storage.commit_version("prod/app", _version(1, {"padding": "x" * 100, "n": 1}))
+    storage.commit_version("prod/app", _version(2, {"padding": "x" * 100, "n": 2}))
+
+    for n, payload in ((1, '"data": '), (2, '"patch": ')):
+        value = storage.etcd.keys["/versions/prod/app/" + _version(n, {}).version][0]
+        # Anything after the payload's key is never looked at
+        truncated = value[: value.index(payload) + len(payload)] + "{broken"
+        metadata = _record_metadata(truncated)
+        assert metadata["version"] == _version(n, {}).version
+        assert metadata["user"] is None
+        assert not set(metadata) & {"data", "patch"}
+
+    legacy = json.dumps({"version": "v1", "data": {"n": 1}, "created_at": "t"})
+    assert _record_metadata(legacy)["data"] == {"n": 1}
+
+
+def _cached_storage():
+    storage = _commit_storage()
+    storage.cache = WatchedCache(storage.etcd, "/config/", ConfigVersion.parse_raw)
+    return storage
+
+
+def test_batch_reads_are_cached_including_missing_paths():
+    storage = _cached_storage()
+    storage.etcd.write("/config/prod/app", _version(1, {"n": 1}).json())
+
+    first = storage.get_configs(["prod/app", "prod/missing"])
+    assert first["prod/app"].data == {"n": 1}
+    assert first["prod/missing"] is None
+    assert storage.cache.watching
+
+    second = storage.get_configs(["prod/app", "prod/missing"])
+    assert second == first
+    assert storage.etcd.txns == 1
+
+
+def test_inherited_reads_start_the_watch_and_stay_cached():
+    storage = _cached_storage()
+    storage.etcd.write("/config/base/app", _version(1, {"port": 80}).json())
+    storage.etcd.write("/config/prod/app", _version(2, {"host": "a"}).json())
+    config_manager = ConfigManager(
+        storage, None, environments={"prod": "base", "prod-eu": "prod"}
+    )
+
+    for _ in range(3):
+        merged = config_manager.get_stored_config("app", "prod-eu")
+        assert merged.data == {"port": 80, "host": "a"}
+    assert storage.cache.watching
+    assert storage.etcd.txns == 1
@@ -1,6 +1,37 @@
+from unittest import mock
+
 import pytest
-from config_system.templates import render_template
+from config_system.models import ConfigVersion
+from config_system.templates import ConfigRenderer, render_template
 
 def test_simple_template():
     template = "Hello {{ name }}"
     assert render_template(template, {"name": "World"}) == "Hello World"
+
+
+def test_documents_without_markers_skip_jinja():
+    renderer = ConfigRenderer()
+    config = ConfigVersion(version="1", data={"port": 8080})
+
+    with mock.patch.object(renderer.env, "from_string") as from_string:
+        assert renderer.render("prod/app", config, "prod") is config.data
+
+    from_string.assert_not_called()
+
+
+def test_templates_compile_once_per_version_and_render_once_per_environment():
+    renderer = ConfigRenderer()
+    config = ConfigVersion(version="1", data={"name": "{{ env }}-db"})
+
+    with mock.patch.object(
+        renderer.env, "from_string", wraps=renderer.env.from_string
+    ) as from_string:
+        assert renderer.render("prod/app", config, "prod") == {"name": "prod-db"}
+        first = renderer.render("prod/app", config, "prod")
+        assert renderer.render("prod/app", config, "staging") == {"name": "staging-db"}
+        assert from_string.call_count == 1
+        assert renderer.render("prod/app", config, "prod") is first
+
+        updated = ConfigVersion(version="2", data={"name": "{{ env }}-db2"})
+        assert renderer.render("prod/app", updated, "prod") == {"name": "prod-db2"}
+        assert from_string.call_count == 2
@@ -0,0 +1,62 @@
+import json
+import threading
+
+from config_system import tracing
+
+
+def _exported(path):
+    spans = []
+    for line in path.read_text().splitlines():
+        for resource in json.loads(line)["resourceSpans"]:
+            for scope in resource["scopeSpans"]:
+                spans.extend(scope["spans"])
+    return {span["name"]: span for span in spans}
+
+
+def test_sampled_trace_is_exported_as_otlp(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracing.configure(str(path), sample_rate=1.0)
+    try:
+        with tracing.trace("GET") as root:
+            with tracing.span("etcd.get", key="/config/prod/app"):
+                pass
+            pending = tracing.start_span("audit.write")
+            try:
+                with tracing.span("schema.validate"):
+                    raise ValueError("invalid")
+            except ValueError:
+                pass
+        thread = threading.Thread(target=pending.end)
+        thread.start()
+        thread.join()
+    finally:
+        tracing.shutdown()
+
+    spans = _exported(path)
+    assert set(spans) == {"GET", "etcd.get", "audit.write", "schema.validate"}
+    assert spans["GET"]["traceId"] == root.trace_id
+    assert "parentSpanId" not in spans["GET"]
+    for name in ("etcd.get", "audit.write", "schema.validate"):
+        assert spans[name]["traceId"] == root.trace_id
+        assert spans[name]["parentSpanId"] == root.span_id
+    assert spans["etcd.get"]["attributes"] == [
+        {"key": "key", "value": {"stringValue": "/config/prod/app"}}
+    ]
+    assert spans["schema.validate"]["status"]["code"] == tracing.STATUS_ERROR
+    assert int(spans["GET"]["endTimeUnixNano"]) >= int(
+        spans["etcd.get"]["endTimeUnixNano"]
+    )
+
+
+def test_unsampled_requests_record_nothing(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracing.configure(str(path), sample_rate=0.0)
+    try:
+        with tracing.trace("GET") as root:
+            with tracing.span("etcd.get") as child:
+                assert tracing.start_span("audit.write") is None
+    finally:
+        tracing.shutdown()
+
+    assert root is None and child is None
+    assert not path.exists()
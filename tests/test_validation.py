@@ -0,0 +1,29 @@
+from unittest import mock
+
+from config_system import validation
+from config_system.validation import get_validator, schema_errors
+
+SCHEMA = {
+    "type": "object",
+    "properties": {"port": {"type": "integer"}, "host": {"type": "string"}},
+    "required": ["port", "host"],
+}
+
+
+def test_validators_are_compiled_once_per_schema():
+    with mock.patch.object(
+        validation, "validator_for", wraps=validation.validator_for
+    ) as validator_for:
+        first = get_validator({"type": "object", "minProperties": 3})
+        second = get_validator({"minProperties": 3, "type": "object"})
+
+    assert first is second
+    assert validator_for.call_count == 1
+
+
+def test_schema_errors_reports_every_violation():
+    errors = schema_errors({"port": "80"}, get_validator(SCHEMA))
+
+    assert len(errors) == 2
+    assert any(error.startswith("port:") for error in errors)
+    assert schema_errors({"port": 80, "host": "a"}, get_validator(SCHEMA)) == []
@@ -0,0 +1,110 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from etcd3.events import PutEvent
+
+from config_system.config_manager import ConfigManager
+from config_system.models import ConfigVersion
+from config_system.templates import ConfigRenderer
+from config_system.watch import ChangeBroadcaster, WatchHub
+
+
+class FakeEtcd:
+    def __init__(self):
+        self.callbacks = {}
+
+    def add_watch_prefix_callback(self, prefix, callback):
+        watch_id = len(self.callbacks) + 1
+        self.callbacks[watch_id] = callback
+        return watch_id
+
+    def cancel_watch(self, watch_id):
+        self.callbacks.pop(watch_id, None)
+
+    def emit(self, key, config, revision):
+        event = PutEvent(
+            SimpleNamespace(
+                kv=SimpleNamespace(
+                    key=key.encode(),
+                    value=config.json().encode(),
+                    mod_revision=revision,
+                )
+            )
+        )
+        for callback in list(self.callbacks.values()):
+            callback(SimpleNamespace(events=[event]))
+
+
+def test_hub_shares_one_etcd_watch_per_prefix():
+    etcd = FakeEtcd()
+    hub = WatchHub(etcd)
+
+    first = hub.add_watch_prefix_callback("/config/", lambda response: None)
+    second = hub.add_watch_prefix_callback("/config/", lambda response: None)
+    assert len(etcd.callbacks) == 1
+
+    hub.cancel_watch(first)
+    assert len(etcd.callbacks) == 1
+    hub.cancel_watch(second)
+    assert len(etcd.callbacks) == 0
+
+
+@pytest.mark.asyncio
+async def test_broadcaster_fans_out_and_drops_slow_subscribers():
+    etcd = FakeEtcd()
+    broadcaster = ChangeBroadcaster(
+        WatchHub(etcd), ConfigRenderer(), asyncio.get_running_loop(), buffer_size=1
+    )
+    subscription = broadcaster.subscribe("prod/app")
+
+    config = ConfigVersion(version="1", data={"name": "{{ env }}"})
+    etcd.emit("/config/prod/app", config, 10)
+    await asyncio.sleep(0)
+
+    change = await subscription.get()
+    assert change["revision"] == 10
+    assert change["config"] == {"name": "prod"}
+
+    etcd.emit("/config/prod/app", config, 11)
+    etcd.emit("/config/prod/app", config, 12)
+    await asyncio.sleep(0)
+
+    assert subscription.dropped
+    assert await subscription.get() is None
+
+
+@pytest.mark.asyncio
+async def test_parent_changes_notify_inheriting_environments_with_merged_config():
+    class FakeStorage:
+        configs = {"prod/app": ConfigVersion(version="p1", data={"replicas": 3})}
+
+        def get_config(self, path):
+            return self.configs.get(path)
+
+    etcd = FakeEtcd()
+    config_manager = ConfigManager(FakeStorage(), None, environments={"prod": "base"})
+    broadcaster = ChangeBroadcaster(
+        WatchHub(etcd),
+        config_manager.renderer,
+        asyncio.get_running_loop(),
+        resolve=config_manager.resolve_change,
+        dependents=config_manager.layers.dependents,
+    )
+    prod = broadcaster.subscribe("prod/app")
+    base = broadcaster.subscribe("base/app")
+
+    config = ConfigVersion(version="b1", data={"replicas": 1, "env": "{{ env }}"})
+    etcd.emit("/config/base/app", config, 20)
+    await asyncio.sleep(0)
+
+    assert (await base.get())["config"] == {"replicas": 1, "env": "base"}
+    change = await prod.get()
+    assert change["environment"] == "prod"
+    assert change["config"] == {"replicas": 3, "env": "prod"}
+    assert (
+        change["version"]
+        == config_manager.layers.merge(
+            "prod/app", [config, FakeStorage.configs["prod/app"]]
+        ).version
+    )